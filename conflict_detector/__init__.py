@@ -1,3 +1,6 @@
 """
 需求冲突检测模块
-"""
\ No newline at end of file
+"""
+from conflict_detector.history import ConflictHistory
+
+__all__ = ["ConflictHistory"]
@@ -0,0 +1,204 @@
+"""
+批量冲突检测
+
+对一个目录或通配符匹配的多个需求文件并发执行冲突检测：
+- 所有文件共用同一个检测器，因而共用连接池化的传输层、限流器和响应缓存
+- 每个输入文件生成一份报告，报告目录结构与输入文件的相对路径一致
+- 汇总结果写入输出目录下的 batch_summary.json，每处理完一个文件更新一次
+- 报告比输入文件新且上次没有维度分析失败时视为已是最新并跳过，中断后重新运行即可从断点继续
+"""
+import glob
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+logger = logging.getLogger("BatchConflictDetector")
+
+BATCH_SUMMARY_FILE = "batch_summary.json"
+
+# 报告格式对应的文件扩展名
+REPORT_EXTENSIONS = {
+    "json": "json",
+    "markdown": "md",
+    "jsonl": "jsonl",
+}
+
+
+def collect_inputs(pattern: str) -> List[Path]:
+    """
+    收集批量检测的输入文件
+
+    Args:
+        pattern: 目录（取其中的 *.json 文件）或通配符（支持 ** 递归匹配）
+
+    Returns:
+        排序后的需求文件路径列表
+    """
+    if os.path.isdir(pattern):
+        paths = Path(pattern).glob("*.json")
+    else:
+        paths = (Path(p) for p in glob.glob(pattern, recursive=True))
+    return sorted(p for p in paths if p.is_file())
+
+
+def report_path(input_path: Path, base_dir: Path, output_dir: Path, format: str) -> Path:
+    """输入文件对应的报告路径，保留输入文件相对 base_dir 的目录结构"""
+    relative = Path(os.path.relpath(input_path, base_dir))
+    return output_dir / relative.with_suffix(f".{REPORT_EXTENSIONS[format]}")
+
+
+def is_up_to_date(input_path: Path, output_path: Path) -> bool:
+    """报告存在且不早于输入文件时视为已是最新"""
+    return output_path.exists() and output_path.stat().st_mtime >= input_path.stat().st_mtime
+
+
+def _write_atomic(path: Path, write: Callable[[TextIO], None]):
+    # 先写临时文件再替换，中断时不会留下被误认为最新的半截报告
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class BatchRunner:
+    """并发检测多个需求文件并汇总结果"""
+
+    def __init__(
+        self,
+        detector,
+        output_dir: str,
+        format: str = "markdown",
+        dimension: Optional[str] = None,
+        workers: int = 2,
+        force: bool = False
+    ):
+        """
+        Args:
+            detector: RequirementConflictDetector 实例，所有文件共用
+            output_dir: 报告输出目录
+            format: 报告格式，"json"、"markdown" 或 "jsonl"
+            dimension: 分析维度，None时分析全部维度
+            workers: 同时检测的文件数；每个文件内部的分片并发仍受检测器 max_workers 约束
+            force: 为True时忽略已是最新的报告，全部重新检测
+        """
+        self.detector = detector
+        self.output_dir = Path(output_dir)
+        self.format = format
+        self.dimension = dimension
+        self.workers = max(1, workers)
+        self.force = force
+        self.summary_path = self.output_dir / BATCH_SUMMARY_FILE
+
+    def _load_previous_entries(self) -> Dict[str, Dict]:
+        """读取上次的汇总，用于补全被跳过文件的统计信息"""
+        if not self.summary_path.exists():
+            return {}
+        try:
+            with open(self.summary_path, "r", encoding="utf-8") as f:
+                return {entry["input"]: entry for entry in json.load(f).get("files", [])}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"读取上次的批量汇总失败: {e}")
+            return {}
+
+    def _process(self, input_path: Path, output_path: Path) -> Dict[str, Any]:
+        """检测单个文件并写出报告"""
+        started = time.perf_counter()
+        with open(input_path, "r", encoding="utf-8") as f:
+            requirements = json.load(f)
+        if not isinstance(requirements, dict):
+            raise ValueError("需求文件格式应为 {\"类别\": [需求列表]}")
+
+        results = self.detector.detect_conflicts(
+            requirements=requirements,
+            dimension=self.dimension,
+            source=str(input_path)
+        )
+        _write_atomic(
+            output_path,
+            lambda f: self.detector.write_conflict_report(results, f, format=self.format)
+        )
+
+        metadata = results["metadata"]
+        return {
+            "status": "completed",
+            "total_requirements": metadata.get("total_requirements", 0),
+            "total_conflicts": metadata.get("total_conflicts", 0),
+            "conflicts_by_severity": metadata.get("conflicts_by_severity", {}),
+            "failed_dimensions": metadata.get("failed_dimensions", []),
+            "elapsed_seconds": round(time.perf_counter() - started, 2),
+        }
+
+    def _build_summary(self, entries: List[Dict]) -> Dict[str, Any]:
+        totals = {"files": len(entries), "completed": 0, "skipped": 0, "failed": 0, "pending": 0,
+                  "total_conflicts": 0, "conflicts_by_severity": {}}
+        for entry in entries:
+            totals[entry["status"]] += 1
+            totals["total_conflicts"] += entry.get("total_conflicts") or 0
+            for level, count in (entry.get("conflicts_by_severity") or {}).items():
+                totals["conflicts_by_severity"][level] = totals["conflicts_by_severity"].get(level, 0) + count
+        return {"timestamp": datetime.now().isoformat(), "totals": totals, "files": entries}
+
+    def _write_summary(self, entries: List[Dict]) -> Dict[str, Any]:
+        summary = self._build_summary(entries)
+        _write_atomic(self.summary_path, lambda f: json.dump(summary, f, ensure_ascii=False, indent=2))
+        return summary
+
+    def run(self, inputs: List[Path]) -> Dict[str, Any]:
+        """
+        批量检测
+
+        Args:
+            inputs: 需求文件路径列表
+
+        Returns:
+            汇总结果，含 totals 和每个文件的 files 条目
+        """
+        if not inputs:
+            return self._write_summary([])
+
+        base_dir = Path(os.path.commonpath([os.path.abspath(p.parent) for p in inputs]))
+        previous = self._load_previous_entries()
+        entries, pending = [], []
+        for input_path in inputs:
+            output_path = report_path(Path(os.path.abspath(input_path)), base_dir, self.output_dir, self.format)
+            entry = {"input": str(input_path), "report": str(output_path), "status": "pending"}
+            last = previous.get(str(input_path), {})
+            # 上次有维度分析失败的报告不完整，需要重新检测
+            if not self.force and not last.get("failed_dimensions") and is_up_to_date(input_path, output_path):
+                entry.update({key: value for key, value in last.items() if key not in entry})
+                entry["status"] = "skipped"
+            else:
+                pending.append((input_path, output_path, entry))
+            entries.append(entry)
+
+        logger.info(
+            f"批量检测: 共 {len(inputs)} 个文件，{len(inputs) - len(pending)} 个已是最新，"
+            f"{len(pending)} 个待检测"
+        )
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="conflict-batch")
+        try:
+            futures = {
+                executor.submit(self._process, input_path, output_path): entry
+                for input_path, output_path, entry in pending
+            }
+            for future in as_completed(futures):
+                entry = futures[future]
+                try:
+                    entry.update(future.result())
+                    logger.info(f"{entry['input']} 检测完成，发现 {entry['total_conflicts']} 个冲突")
+                except Exception as e:
+                    logger.error(f"{entry['input']} 检测失败: {e}")
+                    entry.update({"status": "failed", "error": str(e)})
+                self._write_summary(entries)
+        finally:
+            # 中断时取消尚未开始的文件，已完成的文件已经写入汇总
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return self._write_summary(entries)
@@ -0,0 +1,179 @@
+"""
+冲突候选需求预筛选
+
+在调用大模型之前，用本地的低成本相似度找出每个维度下可能相互冲突的需求组，
+只把这些候选组发送给模型分析。使用的信号：
+- 字符n-gram的TF-IDF余弦相似度（中文不分词，2/3-gram同时近似共享的名词短语）
+- 数值与时间表达式：两条需求都对同一类量（时间、百分比、金额等）提出要求
+- 维度关键词：两条需求都涉及当前维度关注的概念
+"""
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger("CandidateFilter")
+
+NGRAM_SIZES = (2, 3)
+
+# 数值单位到量纲的映射
+UNIT_FAMILIES = {
+    "毫秒": "time", "ms": "time", "秒": "time", "s": "time", "分钟": "time", "min": "time",
+    "小时": "time", "h": "time", "天": "time", "日": "time", "周": "time", "月": "time", "年": "time",
+    "%": "percent", "％": "percent",
+    "元": "money",
+    "次": "count", "个": "count", "条": "count", "本": "count", "人": "count",
+    "kb": "size", "mb": "size", "gb": "size", "tb": "size",
+    "位": "length",
+}
+
+_NUMBER_PATTERN = re.compile(
+    r"\d+(?:\.\d+)?\s*(" + "|".join(sorted(map(re.escape, UNIT_FAMILIES), key=len, reverse=True)) + r")",
+    re.IGNORECASE
+)
+_SEGMENT_PATTERN = re.compile(r"[一-鿿]+|[a-z0-9]+", re.IGNORECASE)
+
+# 数值量纲特征相对于n-gram特征的权重
+NUMBER_FEATURE_WEIGHT = 2.0
+
+# 各维度关注的概念词，两条需求同时涉及时提高其候选分数
+DIMENSION_TERMS = {
+    "功能一致性": ["规则", "定义", "必须", "不允许", "禁止", "只能", "仅限", "支持"],
+    "用户权限逻辑": ["权限", "角色", "管理员", "会员", "访问", "登录", "授权", "审批"],
+    "业务流程完整性": ["流程", "状态", "审核", "订单", "支付", "退款", "取消", "异常", "失败"],
+    "用户体验一致性": ["界面", "页面", "按钮", "提示", "交互", "显示", "操作", "跳转"],
+    "数据一致性": ["数据", "存储", "保存", "删除", "备份", "同步", "格式", "保留"],
+    "安全合规性": ["安全", "加密", "隐私", "日志", "审计", "密码", "合规", "个人信息"],
+}
+# 每个共享维度概念词的加分及加分上限
+TERM_BONUS = 0.1
+MAX_TERM_BONUS = 0.3
+
+
+def requirement_text(req: Dict) -> str:
+    """拼接需求中参与相似度计算的文本字段"""
+    return " ".join(str(req.get(field, "")) for field in ("title", "description"))
+
+
+def _features(text: str) -> Counter:
+    """提取文本的字符n-gram和数值量纲特征"""
+    features: Counter = Counter()
+    for segment in _SEGMENT_PATTERN.findall(text.lower()):
+        if segment.isascii():
+            features[segment] += 1
+            continue
+        for n in NGRAM_SIZES:
+            for i in range(len(segment) - n + 1):
+                features[segment[i:i + n]] += 1
+    for unit in _NUMBER_PATTERN.findall(text):
+        features[f"<num:{UNIT_FAMILIES[unit.lower()]}>"] += 1
+    return features
+
+
+class CandidateFilter:
+    """对一组需求建立相似度索引，按维度产出候选需求组"""
+
+    def __init__(
+        self,
+        requirements: List[Dict],
+        threshold: float = 0.25,
+        top_k: int = 5,
+        max_df: float = 0.5
+    ):
+        """
+        Args:
+            requirements: 展平后的需求列表
+            threshold: 成为候选对的最低分数
+            top_k: 每条需求最多保留的候选伙伴数，即每个候选组最多 top_k + 1 条需求
+            max_df: 出现在超过该比例需求中的特征不参与相似度计算
+        """
+        self.requirements = requirements
+        self.threshold = threshold
+        self.top_k = top_k
+        self.max_df = max_df
+        self.texts = [requirement_text(req) for req in requirements]
+        self.similarity = self._pairwise_similarity()
+
+    def _pairwise_similarity(self) -> Dict[Tuple[int, int], float]:
+        """
+        计算TF-IDF余弦相似度（只计算至少共享一个特征的需求对）
+
+        Returns:
+            {(i, j): 相似度}，其中 i < j
+        """
+        total = len(self.texts)
+        docs = [_features(text) for text in self.texts]
+        df = Counter(feature for doc in docs for feature in doc)
+        max_count = max(2, int(self.max_df * total))
+
+        postings: Dict[str, List[Tuple[int, float]]] = defaultdict(list)
+        for index, doc in enumerate(docs):
+            weights = {}
+            for feature, count in doc.items():
+                if df[feature] < 2 or df[feature] > max_count:
+                    continue
+                weight = (1 + math.log(count)) * (math.log((total + 1) / (df[feature] + 1)) + 1)
+                if feature.startswith("<num:"):
+                    weight *= NUMBER_FEATURE_WEIGHT
+                weights[feature] = weight
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for feature, weight in weights.items():
+                postings[feature].append((index, weight / norm))
+
+        similarity: Dict[Tuple[int, int], float] = defaultdict(float)
+        for entries in postings.values():
+            for a in range(len(entries)):
+                i, wi = entries[a]
+                for b in range(a + 1, len(entries)):
+                    j, wj = entries[b]
+                    similarity[(i, j)] += wi * wj
+        return similarity
+
+    def _term_sets(self, dimension: str) -> List[set]:
+        terms = DIMENSION_TERMS.get(dimension, [])
+        return [{term for term in terms if term in text} for text in self.texts]
+
+    def candidate_groups(self, dimension: str) -> List[List[Dict]]:
+        """
+        产出某个维度下的候选需求组
+
+        每条有候选伙伴的需求与分数最高的 top_k 个伙伴组成一组，组的大小不超过 top_k + 1，
+        候选对不会串联成覆盖大部分需求的大组；被之前的组完全包含的组不再产出。
+        没有任何候选伙伴的需求不会与其他需求冲突，不再发送给模型。
+
+        Args:
+            dimension: 分析维度
+
+        Returns:
+            候选需求组列表，按组内首条需求的顺序排列，组内需求保持原顺序
+        """
+        term_sets = self._term_sets(dimension)
+        partners: Dict[int, List[Tuple[float, int]]] = defaultdict(list)
+        for (i, j), score in self.similarity.items():
+            shared_terms = len(term_sets[i] & term_sets[j])
+            score += min(MAX_TERM_BONUS, TERM_BONUS * shared_terms)
+            if score >= self.threshold:
+                partners[i].append((score, j))
+                partners[j].append((score, i))
+
+        member_sets: List[set] = []
+        containing: Dict[int, List[int]] = defaultdict(list)
+        for i in sorted(partners):
+            members = {i} | {j for _, j in sorted(partners[i], reverse=True)[:self.top_k]}
+            # 只有包含需求i的组才可能包含整个组
+            if any(members <= member_sets[g] for g in containing[i]):
+                continue
+            for k in members:
+                containing[k].append(len(member_sets))
+            member_sets.append(members)
+
+        result = [
+            [self.requirements[i] for i in sorted(members)]
+            for members in sorted(member_sets, key=min)
+        ]
+        kept = len(set().union(*member_sets)) if member_sets else 0
+        logger.info(
+            f"'{dimension}'维度预筛选: {len(self.requirements)} 条需求中 {kept} 条进入 {len(result)} 个候选组"
+        )
+        return result
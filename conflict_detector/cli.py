@@ -12,8 +12,12 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 # 导入冲突检测器和样例需求
-from conflict_detector.conflict_detector import RequirementConflictDetector
+from conflict_detector import ConflictHistory
+from conflict_detector.batch import BatchRunner, collect_inputs
+from conflict_detector.conflict_detector import RequirementConflictDetector, load_config
 from conflict_detector.geek_bookstore_requirements import GEEK_BOOKSTORE_REQUIREMENTS
+from conflict_detector.report_writer import REPORT_FORMATS, ConflictReportWriter
+from llm_metrics import get_metrics
 
 # 配置日志
 logging.basicConfig(
@@ -39,6 +43,102 @@ def load_requirements_from_file(filepath: str) -> dict:
         logger.error(f"加载需求文件失败: {e}")
         raise
 
+def export_metrics(args):
+    """导出LLM调用指标"""
+    if args.metrics_out:
+        metrics_format = "prometheus" if args.metrics_out.endswith(".prom") else "json"
+        get_metrics().dump(args.metrics_out, metrics_format)
+        print(f"LLM调用指标已导出至: {args.metrics_out}")
+
+def show_history(args):
+    """
+    查询并打印检测历史
+    
+    Args:
+        args: history 子命令的参数
+    """
+    db_path = args.db or load_config(args.config).get("history_db")
+    if not db_path or not os.path.exists(db_path):
+        print("错误: 未找到检测历史数据库，请通过 --db 指定或在配置文件中设置 history_db")
+        sys.exit(1)
+    
+    history = ConflictHistory(db_path)
+    if args.runs:
+        records = history.list_runs(limit=args.last)
+    else:
+        records = history.query_conflicts(
+            requirement_id=args.requirement,
+            dimension=args.dimension,
+            severity=args.severity,
+            last_runs=args.last
+        )
+    
+    if args.json:
+        print(json.dumps(records, ensure_ascii=False, indent=2))
+        return
+    
+    if args.runs:
+        for run in records:
+            print(
+                f"#{run['id']} {run['timestamp']} 需求 {run['total_requirements']} 条，"
+                f"冲突 {run['total_conflicts']} 个  {run['source'] or '内置样例'}"
+            )
+    else:
+        for conflict in records:
+            print(
+                f"#{conflict['run_id']} {conflict['timestamp']} [{conflict['severity']}] "
+                f"{', '.join(conflict['dimensions'])} | {conflict['conflict_type']} | "
+                f"{', '.join(conflict['requirements'])}"
+            )
+            print(f"    {conflict['description']}")
+    print(f"\n共 {len(records)} 条记录")
+
+def run_batch(args, detector: RequirementConflictDetector):
+    """
+    批量检测多个需求文件
+    
+    Args:
+        args: 命令行参数
+        detector: 所有文件共用的冲突检测器
+    
+    Returns:
+        所有文件都检测成功时返回True
+    """
+    inputs = collect_inputs(args.batch)
+    if not inputs:
+        print(f"错误: {args.batch} 未匹配到任何需求文件")
+        sys.exit(1)
+    
+    dimension = None if args.dimension == "全部" else args.dimension
+    runner = BatchRunner(
+        detector,
+        output_dir=args.output_dir,
+        format=args.format,
+        dimension=dimension,
+        workers=args.workers,
+        force=args.force
+    )
+    print(f"开始批量检测 {len(inputs)} 个需求文件，分析维度: {args.dimension}")
+    summary = runner.run(inputs)
+    
+    for entry in summary["files"]:
+        if entry["status"] == "failed":
+            print(f"[失败] {entry['input']}: {entry['error']}")
+        else:
+            status = "跳过" if entry["status"] == "skipped" else "完成"
+            conflicts = entry.get("total_conflicts", "-")
+            print(f"[{status}] {entry['input']}: {conflicts} 个冲突 -> {entry['report']}")
+            if entry.get("failed_dimensions"):
+                print(f"    警告: 以下维度分析失败，结果不完整: {', '.join(entry['failed_dimensions'])}")
+    
+    totals = summary["totals"]
+    print(
+        f"\n批量检测完成! 检测 {totals['completed']} 个、跳过 {totals['skipped']} 个、"
+        f"失败 {totals['failed']} 个文件，共发现 {totals['total_conflicts']} 个潜在冲突"
+    )
+    print(f"汇总已保存至: {runner.summary_path}")
+    return totals["failed"] == 0
+
 def main():
     """CLI入口函数"""
     parser = argparse.ArgumentParser(description="基于Deepseek V3的需求冲突检测工具")
@@ -48,6 +148,26 @@ def main():
         "--requirements", "-r",
         help="需求JSON文件路径。如果未提供，将使用内置的极客书店需求样例"
     )
+    parser.add_argument(
+        "--batch", "-b",
+        help="批量检测：需求文件所在目录或通配符（如 'specs/**/*.json'），每个文件生成一份报告"
+    )
+    parser.add_argument(
+        "--output-dir",
+        default="conflict_reports",
+        help="批量检测的报告输出目录，默认为 conflict_reports"
+    )
+    parser.add_argument(
+        "--workers", "-w",
+        type=int,
+        default=2,
+        help="批量检测时同时处理的文件数，默认为2"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="批量检测时忽略已是最新的报告，全部重新检测"
+    )
     parser.add_argument(
         "--dimension", "-d",
         choices=[
@@ -63,9 +183,9 @@ def main():
     )
     parser.add_argument(
         "--format", "-f",
-        choices=["json", "markdown"],
+        choices=list(REPORT_FORMATS),
         default="markdown",
-        help="输出格式，默认为markdown"
+        help="输出格式，默认为markdown；jsonl每行一个JSON对象，检测过程中逐维度写出"
     )
     parser.add_argument(
         "--api-key", "-k",
@@ -75,10 +195,41 @@ def main():
         "--config", "-c",
         help="配置文件路径，默认使用项目根目录下的config.ini"
     )
+    parser.add_argument(
+        "--metrics-out",
+        help="检测完成后将LLM调用指标导出到该文件（.prom 后缀导出Prometheus格式，否则为JSON）"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="绕过LLM响应缓存，强制重新调用API"
+    )
+    parser.add_argument(
+        "--state",
+        help="增量检测状态文件路径。指定后只重新分析内容有变化的需求，并在检测后更新该文件"
+    )
+    
+    # 子命令：查询检测历史
+    subparsers = parser.add_subparsers(dest="command", metavar="{history}")
+    history_parser = subparsers.add_parser("history", help="查询冲突检测历史记录")
+    history_parser.add_argument("--db", help="历史数据库路径，默认读取配置文件中的 history_db")
+    history_parser.add_argument("--requirement", "-q", help="只显示涉及该需求ID的冲突")
+    history_parser.add_argument("--dimension", "-d", help="只显示该维度的冲突")
+    history_parser.add_argument("--severity", "-s", choices=["高", "中", "低"], help="只显示该严重度的冲突")
+    history_parser.add_argument("--last", "-n", type=int, default=20, help="只查询最近N次检测，默认20")
+    history_parser.add_argument("--runs", action="store_true", help="列出最近的检测记录而不是冲突")
+    history_parser.add_argument("--json", action="store_true", help="以JSON格式输出")
     
     # 解析命令行参数
     args = parser.parse_args()
     
+    if args.command == "history":
+        show_history(args)
+        return
+    
+    if args.batch and (args.requirements or args.output or args.state):
+        parser.error("--batch 不能与 --requirements、--output 或 --state 同时使用")
+    
     try:
         # 加载需求
         if args.requirements:
@@ -92,20 +243,27 @@ def main():
         # API密钥的优先级：命令行参数 > 配置文件 > 环境变量
         detector = RequirementConflictDetector(
             api_key=args.api_key,
-            config_file=args.config
+            config_file=args.config,
+            use_cache=False if args.no_cache else None
         )
         
+        if args.batch:
+            succeeded = run_batch(args, detector)
+            export_metrics(args)
+            if not succeeded:
+                sys.exit(1)
+            return
+        
         # 检测冲突
         dimension = None if args.dimension == "全部" else args.dimension
         print(f"开始检测需求冲突，分析维度: {args.dimension}")
         
-        conflicts = detector.detect_conflicts(
-            requirements=requirements,
-            dimension=dimension
-        )
-        
-        # 生成报告
-        report = detector.generate_conflict_report(conflicts, format=args.format)
+        detect_params = {
+            "requirements": requirements,
+            "dimension": dimension,
+            "state_file": args.state,
+            "source": args.requirements
+        }
         
         # 确定输出路径
         if args.output:
@@ -113,9 +271,16 @@ def main():
         else:
             output_path = f"conflict_report.{args.format}"
         
-        # 保存报告
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(report)
+        # 检测并流式写出报告；jsonl格式在每个维度完成时即写出该维度的冲突，下游工具可提前开始读取
+        if args.format == "jsonl":
+            with open(output_path, "w", encoding="utf-8") as f:
+                writer = ConflictReportWriter(f, args.format, detector.SEVERITY_LEVELS)
+                conflicts = detector.detect_conflicts(**detect_params, on_dimension=writer.write_partial)
+                writer.write_report(conflicts)
+        else:
+            conflicts = detector.detect_conflicts(**detect_params)
+            with open(output_path, "w", encoding="utf-8") as f:
+                detector.write_conflict_report(conflicts, f, format=args.format)
         
         print(f"\n检测完成! 发现 {conflicts['metadata']['total_conflicts']} 个潜在冲突")
         print(f"按严重级别统计:")
@@ -123,7 +288,21 @@ def main():
             count = conflicts["metadata"]["conflicts_by_severity"].get(level, 0)
             print(f"- {level}级: {count}个")
         
+        incremental = conflicts["metadata"].get("incremental")
+        if incremental:
+            print(
+                f"增量检测: 新增 {incremental['added']} 条、修改 {incremental['changed']} 条、"
+                f"删除 {incremental['removed']} 条需求，"
+                f"复用 {incremental['reused_shards']} 个分片的结果，重新分析 {incremental['analyzed_shards']} 个分片"
+            )
+        
+        failed_dimensions = conflicts["metadata"].get("failed_dimensions")
+        if failed_dimensions:
+            print(f"警告: 以下维度分析失败，结果不完整: {', '.join(failed_dimensions)}")
+        
         print(f"\n报告已保存至: {output_path}")
+        
+        export_metrics(args)
     
     except Exception as e:
         logger.error(f"执行过程中出错: {e}", exc_info=True)
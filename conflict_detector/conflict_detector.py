@@ -4,11 +4,29 @@
 import json
 import logging
 import os
+import sys
 import configparser
-import requests
 import codecs
+import io
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Callable, Dict, List, Set, Tuple, Any, Optional, TextIO, Union
+
+# 确保能够导入项目根目录下的共享模块
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from conflict_detector.candidate_filter import CandidateFilter
+from conflict_detector.conflict_merge import merge_conflicts
+from conflict_detector.history import ConflictHistory
+from conflict_detector.incremental import IncrementalState, shard_key
+from conflict_detector.prompt_encoding import RequirementEncoder, dimension_fields, encode_line, header_line
+from conflict_detector.report_writer import ConflictReportWriter
+from llm_async import get_async_client
+from llm_cancel import CancelToken, LLMCancelledError
+from llm_json import StructuredOutputError, request_structured
+from llm_tokens import PromptTooLargeError, estimate_messages_tokens, estimate_tokens, get_token_budget
+from llm_transport import LLMTransportError, get_transport
 
 try:
     # 导入Deepseek API
@@ -21,6 +39,8 @@ except ImportError:
             self.model_version = model_version
             self.api_base = api_base or "https://api.deepseek.com/v1"
             self.model = "deepseek-chat"  # 默认模型名称
+            # 共享的连接池化传输层
+            self.transport = get_transport()
         
         def chat_completion(self, messages: List[Dict], **kwargs):
             """调用Deepseek API获取回复"""
@@ -28,33 +48,52 @@ except ImportError:
                 raise DeepseekAPIException("未设置API密钥，无法访问Deepseek API")
             
             try:
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.api_key}"
-                }
-                
-                data = {
-                    "model": self.model,
-                    "messages": messages,
+                return self.transport.chat_completion(
+                    messages,
+                    model=self.model,
+                    api_key=self.api_key,
+                    api_base=self.api_base,
                     **kwargs
-                }
-                
-                response = requests.post(
-                    f"{self.api_base}/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=kwargs.get("timeout", 60)
                 )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    raise DeepseekAPIException(
-                        f"API调用失败，状态码：{response.status_code}，响应：{response.text}"
-                    )
+            except LLMCancelledError:
+                raise
+            except LLMTransportError as e:
+                raise DeepseekAPIException(str(e))
+            except Exception as e:
+                raise DeepseekAPIException(f"调用Deepseek API时出错: {str(e)}")
+        
+        def stream_chat_completion(self, messages: List[Dict], on_delta=None, **kwargs):
+            """以流式方式调用Deepseek API，逐段返回生成的文本"""
+            if not self.api_key:
+                raise DeepseekAPIException("未设置API密钥，无法访问Deepseek API")
             
-            except requests.exceptions.RequestException as e:
-                raise DeepseekAPIException(f"网络请求错误: {str(e)}")
+            try:
+                yield from self.transport.stream_chat_completion(
+                    messages,
+                    on_delta=on_delta,
+                    model=self.model,
+                    api_key=self.api_key,
+                    api_base=self.api_base,
+                    **kwargs
+                )
+            except LLMTransportError as e:
+                raise DeepseekAPIException(str(e))
+        
+        async def achat_completion(self, messages: List[Dict], **kwargs):
+            """异步调用Deepseek API获取回复，受共享并发上限约束"""
+            if not self.api_key:
+                raise DeepseekAPIException("未设置API密钥，无法访问Deepseek API")
+            
+            try:
+                return await get_async_client().chat_completion(
+                    messages,
+                    model=self.model,
+                    api_key=self.api_key,
+                    api_base=self.api_base,
+                    **kwargs
+                )
+            except LLMTransportError as e:
+                raise DeepseekAPIException(str(e))
             except Exception as e:
                 raise DeepseekAPIException(f"调用Deepseek API时出错: {str(e)}")
     
@@ -123,6 +162,21 @@ def load_config(config_file: str = None) -> dict:
                     logger.warning("配置文件中未找到API密钥")
             else:
                 logger.warning("配置文件中未找到 [deepseek] 部分")
+            
+            # 读取冲突检测配置
+            if 'conflict_detector' in parser:
+                detector_config = parser['conflict_detector']
+                config['max_workers'] = int(detector_config.get('max_workers', "6"))
+                config['shard_size'] = int(detector_config.get('shard_size', "40"))
+                config['prefilter'] = detector_config.getboolean('prefilter', True)
+                config['prefilter_min_requirements'] = int(detector_config.get('prefilter_min_requirements', "50"))
+                config['prefilter_threshold'] = float(detector_config.get('prefilter_threshold', "0.25"))
+                config['prefilter_top_k'] = int(detector_config.get('prefilter_top_k', "5"))
+                config['merge_similarity'] = float(detector_config.get('merge_similarity', "0.5"))
+                history_db = detector_config.get('history_db', "").strip()
+                if history_db:
+                    # 相对路径基于项目根目录
+                    config['history_db'] = str(Path(__file__).parent.parent / history_db)
         
         except Exception as e:
             logger.error(f"读取配置文件 {config_file} 出错: {e}")
@@ -147,11 +201,39 @@ class RequirementConflictDetector:
     # 严重等级定义
     SEVERITY_LEVELS = ["高", "中", "低"]
     
+    # 单次维度分析期望的最大输出token数
+    ANALYSIS_MAX_TOKENS = 4000
+    
+    # 维度分析结果的schema
+    CONFLICT_RESULT_SCHEMA = {
+        "type": "object",
+        "required": ["conflicts"],
+        "properties": {
+            "conflicts": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["conflict_type", "requirements", "severity", "description", "impact", "suggestion"],
+                    "properties": {
+                        "conflict_type": {"type": "string"},
+                        "requirements": {"type": "array", "items": {"type": "string"}, "minItems": 1},
+                        "severity": {"type": "string", "enum": SEVERITY_LEVELS},
+                        "description": {"type": "string"},
+                        "impact": {"type": "string"},
+                        "suggestion": {"type": "string"}
+                    }
+                }
+            }
+        }
+    }
+    
     def __init__(
         self, 
         api_key: Optional[str] = None, 
         model_version: str = "v3",
-        config_file: Optional[str] = None
+        config_file: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        max_workers: Optional[int] = None
     ):
         """
         初始化需求冲突检测器
@@ -160,6 +242,8 @@ class RequirementConflictDetector:
             api_key: Deepseek API密钥，如果为None则从配置文件或环境变量读取
             model_version: 使用的模型版本，默认v3
             config_file: 配置文件路径，如果为None则使用默认路径
+            use_cache: 是否使用LLM响应缓存，False时绕过缓存，None时由缓存配置决定
+            max_workers: 并发分析请求数上限，None时读取配置（默认6）
         """
         # 加载配置
         config = load_config(config_file)
@@ -187,25 +271,63 @@ class RequirementConflictDetector:
         
         # 保存配置
         self.config = config
+        self.use_cache = use_cache
+        self.token_budget = get_token_budget()
+        self.max_workers = max_workers or config.get('max_workers', 6)
+        self.shard_size = config.get('shard_size', 40)
+        self.prefilter = config.get('prefilter', True)
+        self.prefilter_min_requirements = config.get('prefilter_min_requirements', 50)
+        self.prefilter_threshold = config.get('prefilter_threshold', 0.25)
+        self.prefilter_top_k = config.get('prefilter_top_k', 5)
+        self.merge_similarity = config.get('merge_similarity', 0.5)
+        
+        # 检测历史数据库，未配置时不记录
+        history_db = config.get('history_db')
+        self.history = ConflictHistory(history_db) if history_db else None
         logger.info(f"初始化需求冲突检测器，使用模型: {config.get('model', 'deepseek-chat')}")
     
     def detect_conflicts(
         self, 
         requirements: Dict[str, List[Dict]],
-        dimension: Optional[str] = None
+        dimension: Optional[Union[str, List[str]]] = None,
+        state_file: Optional[str] = None,
+        source: Optional[str] = None,
+        cancel_token: Optional[CancelToken] = None,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        on_dimension: Optional[Callable[[str, List[Dict]], None]] = None
     ) -> Dict[str, Any]:
         """
         检测需求中的冲突
         
+        采用map-reduce方式：每个维度的需求切分为放得进token预算的分片，
+        任意两条需求至少在一个分片中相遇，所有（维度, 分片）并发分析，
+        再合并不同分片和不同维度对同一组需求报告的重复冲突。
+        
+        指定 state_file 时增量检测：只重新分析包含新增或修改需求的分片（删除需求的分片成员随之变化），
+        其余分片直接复用上次保存的结果，再与新结果一起合并。
+        
+        回调在调用 detect_conflicts 的线程中执行，可用于逐步展示结果。
+        
         Args:
             requirements: 需求字典，格式为 {"类别": [需求列表]}
-            dimension: 指定分析维度，如果为None则分析所有维度
+            dimension: 指定分析维度（单个维度或维度列表），如果为None则分析所有维度
+            state_file: 增量检测状态文件路径，None时执行完整检测
+            source: 需求来源（如需求文件路径），记录到检测历史中
+            cancel_token: 取消标记，取消后在途请求立即放弃，未开始的分片不再发送
+            on_progress: 每完成一个分片时调用，参数为（已完成分片数, 分片总数）
+            on_dimension: 某个维度的分片全部完成时调用，参数为（维度, 该维度合并后的冲突列表）
         
         Returns:
             包含冲突信息的字典
+        
+        Raises:
+            LLMCancelledError: 检测被取消，此时不保存增量状态和历史记录
         """
         # 如果没有指定分析维度，则分析所有维度
-        dimensions = [dimension] if dimension else list(self.CONFLICT_DIMENSIONS.keys())
+        if isinstance(dimension, str):
+            dimensions = [dimension]
+        else:
+            dimensions = list(dimension or self.CONFLICT_DIMENSIONS.keys())
         
         logger.info(f"开始检测需求冲突，分析维度: {dimensions}")
         
@@ -219,11 +341,144 @@ class RequirementConflictDetector:
             }
         }
         
-        # 按维度分析冲突
+        all_requirements = self._flatten_requirements(requirements)
+        
+        # 需求较多时先在本地预筛选，只把可能冲突的候选需求组发给模型
+        candidate_filter = None
+        if self.prefilter and len(all_requirements) >= self.prefilter_min_requirements:
+            candidate_filter = CandidateFilter(
+                all_requirements,
+                threshold=self.prefilter_threshold,
+                top_k=self.prefilter_top_k
+            )
+            results["metadata"]["candidate_requirements"] = {}
+        
+        # 增量检测：比较需求内容哈希，包含新增或修改需求的分片需要重新分析
+        state = None
+        dirty_ids = set()
+        if state_file:
+            state = IncrementalState(state_file)
+            changes = state.diff(all_requirements)
+            dirty_ids = set(changes["added"]) | set(changes["changed"])
+            results["metadata"]["incremental"] = {
+                **{kind: len(ids) for kind, ids in changes.items()},
+                "reused_shards": 0,
+                "analyzed_shards": 0
+            }
+            logger.info(
+                f"增量检测: 新增 {len(changes['added'])} 条，修改 {len(changes['changed'])} 条，"
+                f"删除 {len(changes['removed'])} 条需求"
+            )
+        
+        # map：为每个维度划分分片，增量检测时复用未受影响分片的结果
+        failed_dimensions = []
+        tasks = []
+        # 每个维度按分片顺序记录（复用的冲突列表, None）或（None, 任务序号）
+        layout: Dict[str, List[Tuple[Optional[List[Dict]], Optional[int]]]] = {dim: [] for dim in dimensions}
+        for dim in dimensions:
+            system_prompt = self._build_system_prompt(dim)
+            if candidate_filter is not None:
+                groups = candidate_filter.candidate_groups(dim)
+                results["metadata"]["candidate_requirements"][dim] = len({
+                    str(req.get("id")) for group in groups for req in group
+                })
+            else:
+                groups = [all_requirements]
+            try:
+                shards, starts = self._pack_shards(
+                    groups, dim, system_prompt, state.get_boundaries(dim) if state is not None else None
+                )
+            except PromptTooLargeError as e:
+                logger.error(f"'{dim}'维度的需求无法放入上下文窗口: {e}")
+                failed_dimensions.append(dim)
+                continue
+            if len(shards) > 1:
+                logger.info(f"'{dim}'维度拆分为 {len(shards)} 个分片分析")
+            if state is not None:
+                state.put_boundaries(dim, starts)
+            for shard in shards:
+                key = shard_key(dim, shard)
+                cached = None
+                if state is not None and dirty_ids.isdisjoint(str(req.get("id")) for req in shard):
+                    cached = state.get(key)
+                if cached is not None:
+                    layout[dim].append((cached, None))
+                else:
+                    layout[dim].append((None, len(tasks)))
+                    tasks.append((dim, shard, system_prompt, key))
+            if state is not None:
+                reused = sum(1 for cached, _ in layout[dim] if cached is not None)
+                results["metadata"]["incremental"]["reused_shards"] += reused
+                results["metadata"]["incremental"]["analyzed_shards"] += len(layout[dim]) - reused
+        
+        # 并发分析所有分片，单个分片失败不影响其他分片（失败的分片结果为None）
+        task_results: List[Optional[List[Dict]]] = [None for _ in tasks]
+        remaining = {dim: 0 for dim in dimensions}
+        for dim, *_ in tasks:
+            remaining[dim] += 1
+        
+        def collect(dim: str) -> List[Dict]:
+            # 按分片顺序收集，结果与完成顺序无关
+            return [
+                conflict
+                for cached, i in layout[dim]
+                for conflict in (cached if i is None else task_results[i] or [])
+            ]
+        
+        def dimension_done(dim: str):
+            if on_dimension is not None:
+                on_dimension(dim, merge_conflicts(collect(dim), self.SEVERITY_LEVELS, self.merge_similarity))
+        
         for dim in dimensions:
-            logger.info(f"分析维度: {dim}")
-            dim_conflicts = self._analyze_dimension(requirements, dim)
-            results["conflicts"].extend(dim_conflicts)
+            if remaining[dim] == 0:
+                dimension_done(dim)
+        
+        max_workers = max(1, min(self.max_workers, len(tasks)))
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="conflict-shard")
+        try:
+            futures = {
+                executor.submit(self._analyze_batch, shard, dim, system_prompt, cancel_token): i
+                for i, (dim, shard, system_prompt, _) in enumerate(tasks)
+            }
+            for completed, future in enumerate(as_completed(futures), 1):
+                i = futures[future]
+                dim = tasks[i][0]
+                try:
+                    task_results[i] = future.result()
+                except LLMCancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"分析维度 {dim} 的分片失败: {e}")
+                    if dim not in failed_dimensions:
+                        failed_dimensions.append(dim)
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                if on_progress is not None:
+                    on_progress(completed, len(tasks))
+                remaining[dim] -= 1
+                if remaining[dim] == 0:
+                    dimension_done(dim)
+        except LLMCancelledError:
+            logger.info("需求冲突检测已取消")
+            raise
+        finally:
+            # 取消时不等待在途分片，未开始的分片直接丢弃
+            executor.shutdown(wait=cancel_token is None or not cancel_token.cancelled, cancel_futures=True)
+        results["metadata"]["failed_dimensions"] = [dim for dim in dimensions if dim in failed_dimensions]
+        
+        # 保存重新分析成功的分片结果（失败的分片不保存，下次重新分析）
+        if state is not None:
+            for (_, _, _, key), conflicts in zip(tasks, task_results):
+                if conflicts is not None:
+                    state.put(key, conflicts)
+            state.save(all_requirements)
+        
+        # reduce：按维度顺序汇总分片结果，合并不同分片和不同维度报告的重复冲突
+        gathered = [conflict for dim in dimensions for conflict in collect(dim)]
+        results["conflicts"] = merge_conflicts(
+            gathered, self.SEVERITY_LEVELS, self.merge_similarity
+        )
+        results["metadata"]["merged_duplicates"] = len(gathered) - len(results["conflicts"])
         
         # 按严重等级排序
         results["conflicts"] = sorted(
@@ -241,116 +496,259 @@ class RequirementConflictDetector:
         from datetime import datetime
         results["metadata"]["timestamp"] = datetime.now().isoformat()
         
+        # 保存到历史记录
+        if self.history is not None:
+            try:
+                results["metadata"]["history_run_id"] = self.history.record_run(requirements, results, source)
+            except sqlite3.Error as e:
+                logger.error(f"保存检测历史失败: {e}")
+        
         logger.info(f"需求冲突检测完成，共发现 {len(results['conflicts'])} 个冲突")
         return results
     
-    def _analyze_dimension(
-        self, 
-        requirements: Dict[str, List[Dict]], 
-        dimension: str
-    ) -> List[Dict]:
+    @staticmethod
+    def _flatten_requirements(requirements: Dict[str, List[Dict]]) -> List[Dict]:
+        """将需求字典展平为单一列表，同类别的需求相邻，并为每条需求标注类别"""
+        all_requirements = []
+        for category, reqs in requirements.items():
+            for req in reqs:
+                req_copy = req.copy()
+                req_copy["category"] = category
+                all_requirements.append(req_copy)
+        return all_requirements
+    
+    def _shard_capacity(self, dimension: str, system_prompt: str) -> int:
+        """单个分片中需求行可用的token数（已扣除系统提示、字段名行、输出格式说明和输出预留）"""
+        fixed_tokens = estimate_messages_tokens([
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": self._build_dimension_message(dimension, header_line(dimension_fields(dimension)))}
+        ])
+        return self.token_budget.input_capacity(fixed_tokens, self.ANALYSIS_MAX_TOKENS)
+    
+    def _line_cost(self, req: Dict, dimension: str) -> int:
+        """单条需求编码后的token数（按最长的别名估算）"""
+        return estimate_tokens(encode_line(req, dimension_fields(dimension), f"R{self.shard_size}"))
+    
+    def _requirement_blocks(
+        self,
+        requirements: List[Dict],
+        dimension: str,
+        capacity: int,
+        boundaries: Set[str]
+    ) -> List[List[Dict]]:
         """
-        分析特定维度的冲突
+        按顺序把需求切分为不超过半个分片的块，任意两个块合在一起仍放得进一个分片
         
         Args:
-            requirements: 需求字典
+            requirements: 需求列表
             dimension: 分析维度
+            capacity: 单个分片中需求行可用的token数
+            boundaries: 上次检测时块的起始需求ID，遇到时开始新块，使块不随前面的插入或删除错位
         
         Returns:
-            该维度下的冲突列表
+            块列表
+        
+        Raises:
+            PromptTooLargeError: 单条需求本身就放不下
         """
-        conflicts = []
+        block_items = max(1, self.shard_size // 2)
+        block_tokens = capacity // 2
+        blocks: List[List[Dict]] = []
+        block: List[Dict] = []
+        used = 0
+        for req in requirements:
+            cost = self._line_cost(req, dimension)
+            if cost > capacity:
+                raise PromptTooLargeError(
+                    f"需求 {req.get('id')} 约 {cost} tokens，超过可用预算 {max(capacity, 0)} tokens",
+                    cost,
+                    max(capacity, 0)
+                )
+            if block and (
+                len(block) >= block_items
+                or used + cost > block_tokens
+                or str(req.get("id")) in boundaries
+            ):
+                blocks.append(block)
+                block, used = [], 0
+            block.append(req)
+            used += cost
+        if block:
+            blocks.append(block)
+        return blocks
+    
+    def _fits(self, requirements: List[Dict], dimension: str, capacity: int) -> bool:
+        """需求能否放进同一个分片"""
+        if len(requirements) > self.shard_size:
+            return False
+        return sum(self._line_cost(req, dimension) for req in requirements) <= capacity
+    
+    def _pack_shards(
+        self,
+        groups: List[List[Dict]],
+        dimension: str,
+        system_prompt: str,
+        boundaries: Optional[Set[str]] = None
+    ) -> Tuple[List[List[Dict]], List[str]]:
+        """
+        把候选需求组装入分片，组内任意两条需求至少在一个分片中相遇
         
-        # 将所有需求展平为单一列表
-        all_requirements = []
-        for category, reqs in requirements.items():
-            for req in reqs:
-                req_copy = req.copy()
-                req_copy["category"] = category
-                all_requirements.append(req_copy)
+        放得进一个分片的组不切分；否则先切分为不超过半个分片的块，每两个块组成一个分片，
+        分片数随块数平方增长，需求较多时应先经过候选预筛选缩小范围。
+        小的分片依次合并（不超过 shard_size 条且放得进token预算），避免每个小组单独发起一次调用；
+        候选组之间可能共享需求，合并时同一需求只保留一次。
         
-        # 构建与Deepseek V3模型的对话提示
-        system_prompt = self._build_system_prompt(dimension)
+        增量检测时传入上次的边界，块和分片在相同的需求处开始，只有包含变化的块和分片成员不同。
         
-        # 将需求序列化为JSON
-        requirements_json = json.dumps(all_requirements, ensure_ascii=False, indent=2)
+        Args:
+            groups: 候选需求组列表
+            dimension: 分析维度
+            system_prompt: 系统提示
+            boundaries: 上次检测时块和分片的起始需求ID
         
-        # 用户消息
-        user_message = f"""
-请分析以下需求列表，识别在"{dimension}"维度的冲突：
+        Returns:
+            （分片列表, 本次块和分片的起始需求ID）
+        
+        Raises:
+            PromptTooLargeError: 单条需求本身就放不下
+        """
+        boundaries = boundaries or set()
+        capacity = self._shard_capacity(dimension, system_prompt)
+        shards: List[List[Dict]] = []
+        starts: List[str] = []
+        for group in groups:
+            if self._fits(group, dimension, capacity):
+                pieces = [list(group)]
+            else:
+                blocks = self._requirement_blocks(group, dimension, capacity, boundaries)
+                starts.extend(str(block[0].get("id")) for block in blocks)
+                pieces = [a + b for i, a in enumerate(blocks) for b in blocks[i + 1:]]
+            for piece in pieces:
+                if shards and str(piece[0].get("id")) not in boundaries:
+                    packed = {str(req.get("id")) for req in shards[-1]}
+                    merged = shards[-1] + [req for req in piece if str(req.get("id")) not in packed]
+                    if self._fits(merged, dimension, capacity):
+                        shards[-1] = merged
+                        continue
+                shards.append(piece)
+                starts.append(str(piece[0].get("id")))
+        return shards, list(dict.fromkeys(starts))
+    
+    def _build_dimension_message(self, dimension: str, requirements_text: str) -> str:
+        """构建维度分析的用户消息"""
+        return f"""
+请分析以下需求列表，识别在"{dimension}"维度的冲突。
+每行一条需求，字段以 | 分隔，首行为字段名：
 
-{requirements_json}
+{requirements_text}
 
-请按照以下格式输出每个冲突：
+请输出一个JSON对象，conflicts 字段为冲突数组，requirements 中使用行首的需求编号，每个冲突的格式如下：
 {{
-  "conflict_type": "冲突类型",
-  "requirements": ["需求ID1", "需求ID2"],
-  "severity": "严重度(高/中/低)",
-  "description": "冲突描述",
-  "impact": "影响范围",
-  "suggestion": "修改建议"
+  "conflicts": [
+    {{
+      "conflict_type": "冲突类型",
+      "requirements": ["R1", "R2"],
+      "severity": "严重度(高/中/低)",
+      "description": "冲突描述",
+      "impact": "影响范围",
+      "suggestion": "修改建议"
+    }}
+  ]
 }}
 
-多个冲突请组织为JSON数组。如果没有检测到冲突，请返回空数组[]。
+如果没有检测到冲突，请返回 {{"conflicts": []}}。
 """
+    
+    def _analyze_batch(
+        self,
+        batch: List[Dict],
+        dimension: str,
+        system_prompt: str,
+        cancel_token: Optional[CancelToken] = None
+    ) -> List[Dict]:
+        """
+        调用模型分析一批需求在特定维度的冲突
+        
+        Args:
+            batch: 展平后的需求列表
+            dimension: 分析维度
+            system_prompt: 系统提示
+            cancel_token: 取消标记
+        
+        Returns:
+            该批需求的冲突列表
+        
+        Raises:
+            DeepseekAPIException: API调用失败
+            StructuredOutputError: 修复重试后模型输出仍不符合schema
+            PromptTooLargeError: 提示词超出token预算
+            LLMCancelledError: 调用被取消
+        """
+        # 取消后工作线程可能在执行器关闭前取到排队的分片，此时不再发送
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        
+        conflicts = []
+        
+        # 将需求编码为紧凑的行格式
+        encoder = RequirementEncoder(batch, dimension)
         
         # 构建完整对话
         messages = [
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
+            {"role": "user", "content": self._build_dimension_message(dimension, encoder.encode())}
         ]
         
         try:
+            # 按输入大小选择 max_tokens，放不下时拒绝发送
+            max_tokens = self.token_budget.plan(messages, self.ANALYSIS_MAX_TOKENS)
+            
             logger.info(f"向Deepseek API发送请求，分析维度: {dimension}")
             
             # 设置API调用参数
             api_params = {
                 "temperature": 0.1,  # 使用低温度以获取更确定性的结果
-                "max_tokens": 4000,
-                "timeout": self.config.get("timeout", 60)
+                "max_tokens": max_tokens,
+                "timeout": self.config.get("timeout", 60),
+                "call_site": "conflict_dimension"
             }
+            if self.use_cache is not None:
+                api_params["use_cache"] = self.use_cache
+            if cancel_token is not None:
+                api_params["cancel_token"] = cancel_token
             
-            # 调用Deepseek API
-            response = self.api.chat_completion(
-                messages=messages,
-                **api_params
-            )
+            # 调用Deepseek API，输出不符合schema时请求模型修复一次
+            def send(conversation: List[Dict], extra_params: Dict) -> str:
+                response = self.api.chat_completion(
+                    messages=conversation,
+                    **api_params,
+                    **extra_params
+                )
+                content = response["choices"][0]["message"]["content"]
+                logger.debug(f"Deepseek API响应: {content}")
+                return content
             
-            # 解析响应内容
-            content = response["choices"][0]["message"]["content"]
-            logger.debug(f"Deepseek API响应: {content}")
+            dim_conflicts = encoder.decode_conflicts(
+                request_structured(send, messages, self.CONFLICT_RESULT_SCHEMA)["conflicts"]
+            )
             
-            # 解析JSON响应
-            try:
-                # 提取JSON部分
-                import re
-                json_match = re.search(r'\[.*\]', content, re.DOTALL)
-                if json_match:
-                    content = json_match.group()
-                
-                dim_conflicts = json.loads(content)
-                
-                # 确保是列表类型
-                if not isinstance(dim_conflicts, list):
-                    dim_conflicts = [dim_conflicts]
-                
-                # 为每个冲突添加维度信息
-                for conflict in dim_conflicts:
-                    conflict["dimension"] = dimension
-                
-                conflicts.extend(dim_conflicts)
-                logger.info(f"在'{dimension}'维度下发现 {len(dim_conflicts)} 个冲突")
+            # 为每个冲突添加维度信息
+            for conflict in dim_conflicts:
+                conflict["dimension"] = dimension
             
-            except json.JSONDecodeError as e:
-                logger.error(f"解析模型响应时出错: {e}")
-                logger.error(f"原始响应: {content}")
-        
+            conflicts.extend(dim_conflicts)
+            logger.info(f"在'{dimension}'维度下发现 {len(dim_conflicts)} 个冲突")
+        
+        except StructuredOutputError as e:
+            logger.error(f"解析模型响应时出错: {e}")
+            logger.error(f"原始响应: {e.content}")
+            raise
+        except PromptTooLargeError as e:
+            logger.error(f"提示词超出token预算，未发送请求: {e}")
+            raise
         except DeepseekAPIException as e:
             logger.error(f"调用Deepseek API时出错: {e}")
-            logger.exception(e)
-        except Exception as e:
-            logger.error(f"出现未预期的错误: {e}")
-            logger.exception(e)
+            raise
         
         return conflicts
     
@@ -378,7 +776,7 @@ class RequirementConflictDetector:
 4. 为每个冲突标注严重等级（高/中/低）
 5. 提供具体、可执行的修改建议
 
-输出格式必须为标准JSON，包含冲突类型、涉及需求ID、严重程度、描述、影响和建议。
+输出格式必须为标准JSON，包含冲突类型、涉及需求编号、严重程度、描述、影响和建议。
 """
         return system_prompt
     
@@ -392,55 +790,27 @@ class RequirementConflictDetector:
         
         Args:
             conflicts: 检测到的冲突信息
-            format: 报告格式，支持"json"、"markdown"
+            format: 报告格式，支持"json"、"markdown"、"jsonl"
         
         Returns:
             格式化的冲突报告
         """
-        if format.lower() == "json":
-            return json.dumps(conflicts, ensure_ascii=False, indent=2)
-        
-        elif format.lower() == "markdown":
-            # 构建Markdown报告
-            md_lines = ["# 需求冲突检测报告\n"]
-            
-            # 添加元数据
-            md_lines.append("## 检测概览")
-            md_lines.append(f"- 总需求数：{conflicts['metadata']['total_requirements']}")
-            md_lines.append(f"- 检测到的冲突总数：{conflicts['metadata']['total_conflicts']}")
-            md_lines.append(f"- 检测时间：{conflicts['metadata']['timestamp']}")
-            md_lines.append(f"- 分析维度：{', '.join(conflicts['metadata']['dimensions_analyzed'])}")
-            
-            # 按严重等级统计
-            md_lines.append("\n### 按严重等级统计")
-            for level in self.SEVERITY_LEVELS:
-                count = conflicts['metadata']['conflicts_by_severity'].get(level, 0)
-                md_lines.append(f"- {level}级冲突：{count}个")
-            
-            # 冲突详情
-            md_lines.append("\n## 冲突详情")
-            
-            # 按维度分组
-            conflicts_by_dimension = {}
-            for conflict in conflicts['conflicts']:
-                dim = conflict['dimension']
-                if dim not in conflicts_by_dimension:
-                    conflicts_by_dimension[dim] = []
-                conflicts_by_dimension[dim].append(conflict)
-            
-            # 按维度输出冲突
-            for dim, dim_conflicts in conflicts_by_dimension.items():
-                md_lines.append(f"\n### {dim}")
-                
-                for i, conflict in enumerate(dim_conflicts, 1):
-                    md_lines.append(f"\n#### {i}. {conflict['conflict_type']}")
-                    md_lines.append(f"- **严重度**: {conflict['severity']}")
-                    md_lines.append(f"- **涉及需求**: {', '.join(conflict['requirements'])}")
-                    md_lines.append(f"- **冲突描述**: {conflict['description']}")
-                    md_lines.append(f"- **影响范围**: {conflict['impact']}")
-                    md_lines.append(f"- **修改建议**: {conflict['suggestion']}")
-            
-            return "\n".join(md_lines)
+        buffer = io.StringIO()
+        self.write_conflict_report(conflicts, buffer, format=format)
+        return buffer.getvalue()
+    
+    def write_conflict_report(
+        self,
+        conflicts: Dict[str, Any],
+        fp: TextIO,
+        format: str = "json"
+    ):
+        """
+        把冲突报告流式写入文件句柄，不在内存中拼接完整报告
         
-        else:
-            raise ValueError(f"不支持的报告格式: {format}")
\ No newline at end of file
+        Args:
+            conflicts: 检测到的冲突信息
+            fp: 以文本模式打开的可写文件句柄
+            format: 报告格式，支持"json"、"markdown"、"jsonl"
+        """
+        ConflictReportWriter(fp, format, self.SEVERITY_LEVELS).write_report(conflicts)
\ No newline at end of file
@@ -21,15 +21,21 @@ from PyQt5.QtGui import QFont
 # 导入极客书店需求样例和冲突检测器
 from conflict_detector.geek_bookstore_requirements import GEEK_BOOKSTORE_REQUIREMENTS
 from conflict_detector.conflict_detector import RequirementConflictDetector
+from llm_cancel import CancelToken, LLMCancelledError
 
 class ConflictDetectionThread(QThread):
     """
     需求冲突检测线程，用于在后台进行冲突检测，避免阻塞UI
+    
+    各维度并发分析，每个维度完成后立即通过 partial 信号发送该维度的结果；
+    调用 cancel() 后在途请求立即放弃，线程发送 cancelled 信号后结束。
     """
     # 定义信号
-    finished = pyqtSignal(object)  # 检测完成信号，传递结果
-    progress = pyqtSignal(int)     # 进度更新信号
-    error = pyqtSignal(str)        # 错误信号
+    finished = pyqtSignal(object)      # 检测完成信号，传递结果
+    progress = pyqtSignal(int)         # 进度更新信号
+    partial = pyqtSignal(str, object)  # 单个维度完成信号，传递维度和该维度的冲突列表
+    cancelled = pyqtSignal()           # 检测已取消信号
+    error = pyqtSignal(str)            # 错误信号
     
     def __init__(self, detector, requirements, dimensions):
         """
@@ -44,45 +50,28 @@ class ConflictDetectionThread(QThread):
         self.detector = detector
         self.requirements = requirements
         self.dimensions = dimensions
+        self.cancel_token = CancelToken()
+    
+    def cancel(self):
+        """取消检测，可在UI线程中调用"""
+        self.cancel_token.cancel()
     
     def run(self):
         """执行需求冲突检测"""
         try:
-            from datetime import datetime
-            
-            results = {
-                "conflicts": [],
-                "metadata": {
-                    "total_requirements": sum(len(reqs) for reqs in self.requirements.values()),
-                    "dimensions_analyzed": self.dimensions if self.dimensions else ["全部维度"],
-                    "total_conflicts": 0,
-                    "timestamp": datetime.now().isoformat()  # 添加时间戳
-                }
-            }
-            
-            total_dimensions = len(self.dimensions) if self.dimensions else len(self.detector.CONFLICT_DIMENSIONS)
-            for i, dimension in enumerate(self.dimensions if self.dimensions else [None]):
-                # 更新进度
-                progress_value = int((i / total_dimensions) * 100)
-                self.progress.emit(progress_value)
-                
-                # 调用检测器进行分析
-                result = self.detector.detect_conflicts(self.requirements, dimension)
-                results["conflicts"].extend(result["conflicts"])
-                
-                # 稍作暂停，避免过快的API调用
-                self.msleep(100)
-            
-            # 更新元数据
-            results["metadata"]["total_conflicts"] = len(results["conflicts"])
-            results["metadata"]["conflicts_by_severity"] = {
-                level: len([c for c in results["conflicts"] if c["severity"] == level])
-                for level in self.detector.SEVERITY_LEVELS
-            }
+            results = self.detector.detect_conflicts(
+                self.requirements,
+                self.dimensions or None,
+                cancel_token=self.cancel_token,
+                on_progress=lambda done, total: self.progress.emit(int(done * 100 / total)),
+                on_dimension=self.partial.emit
+            )
             
             # 发送完成信号
             self.finished.emit(results)
-            
+        
+        except LLMCancelledError:
+            self.cancelled.emit()
         except Exception as e:
             self.error.emit(str(e))
 
@@ -99,6 +88,11 @@ class ConflictDetectorGUI(QMainWindow):
         # 默认使用极客书店需求样例
         self.requirements = GEEK_BOOKSTORE_REQUIREMENTS
         
+        # 当前检测线程、已收到的各维度结果及最近一次完成的检测结果（可导出）
+        self.detection_thread = None
+        self.partial_results = {}
+        self.detection_results = None
+        
         # 初始化UI
         self.init_ui()
         
@@ -153,11 +147,15 @@ class ConflictDetectorGUI(QMainWindow):
         # 加载需求和运行检测的按钮
         buttons_layout = QHBoxLayout()
         load_btn = QPushButton("加载需求")
-        run_btn = QPushButton("开始检测")
+        self.run_btn = QPushButton("开始检测")
+        self.cancel_btn = QPushButton("取消检测")
+        self.cancel_btn.setEnabled(False)
         load_btn.clicked.connect(self.load_requirements)
-        run_btn.clicked.connect(self.run_detection)
+        self.run_btn.clicked.connect(self.run_detection)
+        self.cancel_btn.clicked.connect(self.cancel_detection)
         buttons_layout.addWidget(load_btn)
-        buttons_layout.addWidget(run_btn)
+        buttons_layout.addWidget(self.run_btn)
+        buttons_layout.addWidget(self.cancel_btn)
         control_layout.addLayout(buttons_layout)
         
         control_group.setLayout(control_layout)
@@ -299,9 +297,14 @@ class ConflictDetectorGUI(QMainWindow):
         self.progress_bar.setValue(0)
         self.progress_bar.show()
         
+        # 清空上次的结果，各维度完成后逐步填充；检测完成前没有可导出的结果
+        self.tree_view.clear()
+        self.detail_view.clear()
+        self.partial_results = {}
+        self.detection_results = None
+        
         # 禁用控制区域
-        for checkbox in self.dimension_checkboxes.values():
-            checkbox.setEnabled(False)
+        self.set_controls_running(True)
         
         # 创建并启动检测线程
         self.detection_thread = ConflictDetectionThread(
@@ -309,9 +312,25 @@ class ConflictDetectorGUI(QMainWindow):
         )
         self.detection_thread.finished.connect(self.update_results)
         self.detection_thread.progress.connect(self.update_progress)
+        self.detection_thread.partial.connect(self.show_partial_results)
+        self.detection_thread.cancelled.connect(self.on_detection_cancelled)
         self.detection_thread.error.connect(self.show_error)
         self.detection_thread.start()
     
+    def cancel_detection(self):
+        """取消正在进行的检测"""
+        if self.detection_thread is not None and self.detection_thread.isRunning():
+            self.detection_thread.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.statusBar.showMessage("正在取消检测...")
+    
+    def set_controls_running(self, running):
+        """检测期间禁用控制区域，只允许取消"""
+        for checkbox in self.dimension_checkboxes.values():
+            checkbox.setEnabled(not running)
+        self.run_btn.setEnabled(not running)
+        self.cancel_btn.setEnabled(running)
+    
     def update_progress(self, value):
         """更新进度条"""
         self.progress_bar.setValue(value)
@@ -323,14 +342,61 @@ class ConflictDetectorGUI(QMainWindow):
         self.progress_bar.hide()
         
         # 重新启用控制区域
-        for checkbox in self.dimension_checkboxes.values():
-            checkbox.setEnabled(True)
+        self.set_controls_running(False)
+    
+    def on_detection_cancelled(self):
+        """检测取消后仍显示已完成维度的结果，但不完整的结果不能导出"""
+        self.detection_results = None
+        self.statusBar.showMessage(f"检测已取消，已显示 {len(self.partial_results)} 个已完成维度的结果")
+        self.progress_bar.hide()
+        self.set_controls_running(False)
+    
+    def show_partial_results(self, dimension, conflicts):
+        """某个维度完成后立即显示其结果"""
+        self.partial_results[dimension] = conflicts
+        if conflicts:
+            self.add_dimension_item(dimension, conflicts)
+        
+        all_conflicts = [c for dim_conflicts in self.partial_results.values() for c in dim_conflicts]
+        self.show_report({
+            "conflicts": all_conflicts,
+            "metadata": {
+                "total_requirements": sum(len(reqs) for reqs in self.requirements.values()),
+                "total_conflicts": len(all_conflicts),
+                "timestamp": "检测中",
+                "dimensions_analyzed": list(self.partial_results),
+                "conflicts_by_severity": {
+                    level: len([c for c in all_conflicts if c["severity"] == level])
+                    for level in self.detector.SEVERITY_LEVELS
+                }
+            }
+        })
+        self.statusBar.showMessage(
+            f"正在分析需求冲突... 已完成 {len(self.partial_results)} 个维度，发现 {len(all_conflicts)} 个冲突"
+        )
+    
+    def add_dimension_item(self, dim, conflicts):
+        """在树形视图中添加一个维度及其冲突"""
+        dim_item = QTreeWidgetItem(self.tree_view, [dim, f"{len(conflicts)}个冲突"])
+        dim_item.setExpanded(True)
+        
+        for conflict in conflicts:
+            conflict_item = QTreeWidgetItem(dim_item, [
+                conflict["conflict_type"], 
+                f"严重度: {conflict['severity']} | 需求: {', '.join(conflict['requirements'])}"
+            ])
+            
+            if len(conflict.get("dimensions", [])) > 1:
+                QTreeWidgetItem(conflict_item, ["涉及维度", ", ".join(conflict["dimensions"])])
+            QTreeWidgetItem(conflict_item, ["描述", conflict["description"]])
+            QTreeWidgetItem(conflict_item, ["影响", conflict["impact"]])
+            QTreeWidgetItem(conflict_item, ["建议", conflict["suggestion"]])
     
     def update_results(self, results):
         """更新检测结果"""
         self.detection_results = results
         
-        # 清空当前视图
+        # 清空逐步显示的结果，改为显示跨维度合并后的最终结果
         self.tree_view.clear()
         self.detail_view.clear()
         
@@ -346,18 +412,7 @@ class ConflictDetectorGUI(QMainWindow):
             
             # 添加到树形视图
             for dim, conflicts in conflicts_by_dimension.items():
-                dim_item = QTreeWidgetItem(self.tree_view, [dim, f"{len(conflicts)}个冲突"])
-                dim_item.setExpanded(True)
-                
-                for conflict in conflicts:
-                    conflict_item = QTreeWidgetItem(dim_item, [
-                        conflict["conflict_type"], 
-                        f"严重度: {conflict['severity']} | 需求: {', '.join(conflict['requirements'])}"
-                    ])
-                    
-                    QTreeWidgetItem(conflict_item, ["描述", conflict["description"]])
-                    QTreeWidgetItem(conflict_item, ["影响", conflict["impact"]])
-                    QTreeWidgetItem(conflict_item, ["建议", conflict["suggestion"]])
+                self.add_dimension_item(dim, conflicts)
         else:
             # 无冲突
             QTreeWidgetItem(self.tree_view, ["无检测结果", "未发现需求冲突"])
@@ -367,26 +422,37 @@ class ConflictDetectorGUI(QMainWindow):
         
         # 更新状态
         count = len(results["conflicts"])
-        self.statusBar.showMessage(f"检测完成，共发现 {count} 个冲突")
+        failed_dimensions = results["metadata"].get("failed_dimensions")
+        if failed_dimensions:
+            self.statusBar.showMessage(
+                f"检测完成，共发现 {count} 个冲突；以下维度分析失败: {', '.join(failed_dimensions)}"
+            )
+        else:
+            self.statusBar.showMessage(f"检测完成，共发现 {count} 个冲突")
         self.progress_bar.hide()
         
         # 重新启用控制区域
-        for checkbox in self.dimension_checkboxes.values():
-            checkbox.setEnabled(True)
+        self.set_controls_running(False)
     
     def update_detail_view(self):
         """更新详细视图"""
-        if not hasattr(self, 'detection_results'):
+        if self.detection_results is None:
             return
         
-        # 生成Markdown格式的报告
-        report = self.detector.generate_conflict_report(
-            self.detection_results, format="markdown"
-        )
-        
-        # 在详细视图中显示
+        self.show_report(self.detection_results)
+    
+    def show_report(self, results):
+        """在详细视图中显示Markdown格式的报告"""
+        report = self.detector.generate_conflict_report(results, format="markdown")
         self.detail_view.setMarkdown(report)
     
+    def closeEvent(self, event):
+        """关闭窗口时取消正在进行的检测"""
+        if self.detection_thread is not None and self.detection_thread.isRunning():
+            self.detection_thread.cancel()
+            self.detection_thread.wait(2000)
+        super().closeEvent(event)
+    
     def switch_view(self, index):
         """切换视图模式"""
         if index == 0:  # 树形视图
@@ -398,30 +464,32 @@ class ConflictDetectorGUI(QMainWindow):
     
     def export_report(self):
         """导出冲突报告"""
-        if not hasattr(self, 'detection_results') or not self.detection_results["conflicts"]:
+        if self.detection_results is None or not self.detection_results["conflicts"]:
             QMessageBox.warning(self, "警告", "没有可导出的检测结果")
             return
         
         try:
             file_path, file_filter = QFileDialog.getSaveFileName(
                 self, "保存冲突报告", "", 
-                "Markdown文档 (*.md);;JSON文件 (*.json)"
+                "Markdown文档 (*.md);;JSON文件 (*.json);;JSON Lines文件 (*.jsonl)"
             )
             
             if not file_path:
                 return  # 用户取消了保存
             
             # 根据选择的过滤器确定格式
-            format_type = "markdown" if ".md" in file_filter else "json"
-            
-            # 生成报告
-            report = self.detector.generate_conflict_report(
-                self.detection_results, format=format_type
-            )
+            if ".md" in file_filter:
+                format_type = "markdown"
+            elif ".jsonl" in file_filter:
+                format_type = "jsonl"
+            else:
+                format_type = "json"
             
-            # 保存文件
+            # 流式写入报告文件
             with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(report)
+                self.detector.write_conflict_report(
+                    self.detection_results, f, format=format_type
+                )
             
             self.statusBar.showMessage(f"报告已导出到: {file_path}")
         
@@ -0,0 +1,99 @@
+"""
+冲突去重与合并
+
+多个维度（以及重叠分片）经常对同一组需求报告措辞略有不同的同一冲突。
+合并步骤：
+1. 规范化：涉及需求ID排序去重，冲突类型去掉空白、标点和“冲突/矛盾”等通用后缀
+2. 聚类：涉及需求相同的冲突中，规范化类型相同或描述相似度达到阈值的归为一组
+3. 合并：每组保留严重度最高的一条作为代表，记录组内所有来源维度
+"""
+import logging
+import re
+from typing import Dict, List, Sequence, Set, Tuple
+
+logger = logging.getLogger("ConflictMerge")
+
+_TYPE_NOISE = re.compile(r"[\s\-_/、，,。.:：()（）]+")
+_TYPE_SUFFIXES = ("冲突", "矛盾", "问题", "不一致")
+
+
+def normalize_type(conflict_type: str) -> str:
+    """规范化冲突类型：去掉空白、标点和通用后缀"""
+    text = _TYPE_NOISE.sub("", str(conflict_type or "")).lower()
+    for suffix in _TYPE_SUFFIXES:
+        if text.endswith(suffix) and len(text) > len(suffix):
+            text = text[:-len(suffix)]
+            break
+    return text
+
+
+def canonical_key(conflict: Dict) -> Tuple[Tuple[str, ...], str]:
+    """冲突的规范键：（排序后的涉及需求ID, 规范化冲突类型）"""
+    ids = tuple(sorted({str(rid) for rid in conflict.get("requirements", [])}))
+    return ids, normalize_type(conflict.get("conflict_type", ""))
+
+
+def _bigrams(text: str) -> Set[str]:
+    text = _TYPE_NOISE.sub("", str(text or "")).lower()
+    return {text[i:i + 2] for i in range(len(text) - 1)} or {text}
+
+
+def description_similarity(a: str, b: str) -> float:
+    """描述文本的字符二元组Jaccard相似度"""
+    grams_a, grams_b = _bigrams(a), _bigrams(b)
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+
+def merge_conflicts(
+    conflicts: List[Dict],
+    severity_levels: Sequence[str],
+    similarity_threshold: float = 0.5
+) -> List[Dict]:
+    """
+    合并重复冲突
+
+    Args:
+        conflicts: 各维度冲突按维度顺序拼接的列表
+        severity_levels: 严重等级，从高到低
+        similarity_threshold: 描述相似度达到该值即视为同一冲突
+
+    Returns:
+        合并后的冲突列表，保持各组首次出现的顺序；每条冲突带有 dimensions 字段列出所有来源维度
+    """
+    # 按涉及需求分桶，只在桶内比较描述
+    buckets: Dict[Tuple[str, ...], List[List[Dict]]] = {}
+    clusters: List[List[Dict]] = []
+    for conflict in conflicts:
+        ids, normalized_type = canonical_key(conflict)
+        candidates = buckets.setdefault(ids, [])
+        for cluster in candidates:
+            head = cluster[0]
+            if (
+                canonical_key(head)[1] == normalized_type
+                or description_similarity(head.get("description", ""), conflict.get("description", ""))
+                >= similarity_threshold
+            ):
+                cluster.append(conflict)
+                break
+        else:
+            cluster = [conflict]
+            candidates.append(cluster)
+            clusters.append(cluster)
+
+    merged = []
+    for cluster in clusters:
+        representative = min(cluster, key=lambda c: severity_levels.index(c["severity"]))
+        dimensions = []
+        for conflict in cluster:
+            for dim in conflict.get("dimensions") or [conflict.get("dimension")]:
+                if dim and dim not in dimensions:
+                    dimensions.append(dim)
+        merged.append({
+            **representative,
+            "requirements": list(canonical_key(representative)[0]),
+            "dimensions": dimensions,
+        })
+
+    if len(merged) < len(conflicts):
+        logger.info(f"合并重复冲突: {len(conflicts)} 条合并为 {len(merged)} 条")
+    return merged
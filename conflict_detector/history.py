@@ -0,0 +1,254 @@
+"""
+冲突检测历史记录
+
+把每次 detect_conflicts 的结果保存到本地SQLite数据库：
+- runs：每次检测的时间、来源、分析维度和统计信息
+- requirement_snapshots / run_requirements：需求内容快照（按内容哈希去重）及每次检测包含的需求
+- conflicts / conflict_requirements：冲突及其涉及的需求
+
+在需求ID、维度和严重度上建有索引，可直接回答“最近20次检测中涉及F010的冲突有哪些”这类问题。
+"""
+import json
+import logging
+import os
+import sqlite3
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+
+from conflict_detector.incremental import requirement_hash
+
+logger = logging.getLogger("ConflictHistory")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    source TEXT,
+    dimensions TEXT NOT NULL,
+    total_requirements INTEGER NOT NULL,
+    total_conflicts INTEGER NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS requirement_snapshots (
+    content_hash TEXT PRIMARY KEY,
+    content TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_requirements (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    requirement_id TEXT NOT NULL,
+    category TEXT,
+    content_hash TEXT NOT NULL REFERENCES requirement_snapshots(content_hash),
+    PRIMARY KEY (run_id, requirement_id)
+);
+CREATE TABLE IF NOT EXISTS conflicts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    dimension TEXT,
+    dimensions TEXT NOT NULL,
+    severity TEXT NOT NULL,
+    conflict_type TEXT,
+    description TEXT,
+    impact TEXT,
+    suggestion TEXT
+);
+CREATE TABLE IF NOT EXISTS conflict_requirements (
+    conflict_id INTEGER NOT NULL REFERENCES conflicts(id) ON DELETE CASCADE,
+    run_id INTEGER NOT NULL,
+    requirement_id TEXT NOT NULL,
+    PRIMARY KEY (conflict_id, requirement_id)
+);
+CREATE INDEX IF NOT EXISTS idx_run_requirements_requirement ON run_requirements(requirement_id, run_id);
+CREATE INDEX IF NOT EXISTS idx_conflicts_run ON conflicts(run_id);
+CREATE INDEX IF NOT EXISTS idx_conflicts_dimension ON conflicts(dimension, run_id);
+CREATE INDEX IF NOT EXISTS idx_conflicts_severity ON conflicts(severity, run_id);
+CREATE INDEX IF NOT EXISTS idx_conflict_requirements_requirement ON conflict_requirements(requirement_id, run_id);
+"""
+
+
+class ConflictHistory:
+    """冲突检测历史数据库"""
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: SQLite数据库文件路径，不存在时自动创建
+        """
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        # 每次操作使用独立连接，可在GUI工作线程和主线程中同时使用
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def record_run(
+        self,
+        requirements: Dict[str, List[Dict]],
+        results: Dict[str, Any],
+        source: Optional[str] = None
+    ) -> int:
+        """
+        保存一次检测结果
+
+        Args:
+            requirements: 需求字典，格式为 {"类别": [需求列表]}
+            results: detect_conflicts 的返回值
+            source: 需求来源（如需求文件路径）
+
+        Returns:
+            检测记录ID
+        """
+        metadata = results.get("metadata", {})
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (timestamp, source, dimensions, total_requirements, total_conflicts, metadata)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    metadata.get("timestamp"),
+                    source,
+                    json.dumps(metadata.get("dimensions_analyzed", []), ensure_ascii=False),
+                    metadata.get("total_requirements", 0),
+                    len(results.get("conflicts", [])),
+                    json.dumps(metadata, ensure_ascii=False),
+                )
+            )
+            run_id = cursor.lastrowid
+
+            snapshots, run_requirements = [], []
+            for category, reqs in requirements.items():
+                for req in reqs:
+                    content = {**req, "category": category}
+                    digest = requirement_hash(content)
+                    snapshots.append((digest, json.dumps(content, ensure_ascii=False)))
+                    run_requirements.append((run_id, str(req.get("id")), category, digest))
+            conn.executemany(
+                "INSERT OR IGNORE INTO requirement_snapshots (content_hash, content) VALUES (?, ?)",
+                snapshots
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO run_requirements (run_id, requirement_id, category, content_hash)"
+                " VALUES (?, ?, ?, ?)",
+                run_requirements
+            )
+
+            for conflict in results.get("conflicts", []):
+                cursor = conn.execute(
+                    "INSERT INTO conflicts (run_id, dimension, dimensions, severity, conflict_type,"
+                    " description, impact, suggestion) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        run_id,
+                        conflict.get("dimension"),
+                        json.dumps(conflict.get("dimensions") or [conflict.get("dimension")], ensure_ascii=False),
+                        conflict.get("severity"),
+                        conflict.get("conflict_type"),
+                        conflict.get("description"),
+                        conflict.get("impact"),
+                        conflict.get("suggestion"),
+                    )
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO conflict_requirements (conflict_id, run_id, requirement_id)"
+                    " VALUES (?, ?, ?)",
+                    [(cursor.lastrowid, run_id, str(rid)) for rid in conflict.get("requirements", [])]
+                )
+
+        logger.info(f"检测结果已保存到历史记录，记录ID: {run_id}")
+        return run_id
+
+    def list_runs(self, limit: int = 20) -> List[Dict]:
+        """
+        列出最近的检测记录
+
+        Args:
+            limit: 最多返回的记录数
+
+        Returns:
+            检测记录列表，按时间从新到旧
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, timestamp, source, dimensions, total_requirements, total_conflicts"
+                " FROM runs ORDER BY id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [
+            {**dict(row), "dimensions": json.loads(row["dimensions"])}
+            for row in rows
+        ]
+
+    def query_conflicts(
+        self,
+        requirement_id: Optional[str] = None,
+        dimension: Optional[str] = None,
+        severity: Optional[str] = None,
+        last_runs: Optional[int] = None,
+        run_id: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        按条件查询历史冲突
+
+        Args:
+            requirement_id: 只返回涉及该需求的冲突
+            dimension: 只返回该维度（含合并后的来源维度）的冲突
+            severity: 只返回该严重度的冲突
+            last_runs: 只查询最近N次检测
+            run_id: 只查询指定的检测记录
+
+        Returns:
+            冲突列表，按检测记录从新到旧，每条含 run_id、timestamp 和 requirements
+        """
+        clauses, params = [], []
+        if requirement_id is not None:
+            clauses.append(
+                "c.id IN (SELECT conflict_id FROM conflict_requirements WHERE requirement_id = ?)"
+            )
+            params.append(str(requirement_id))
+        if dimension is not None:
+            clauses.append(
+                "(c.dimension = ? OR EXISTS (SELECT 1 FROM json_each(c.dimensions) WHERE value = ?))"
+            )
+            params.extend([dimension, dimension])
+        if severity is not None:
+            clauses.append("c.severity = ?")
+            params.append(severity)
+        if run_id is not None:
+            clauses.append("c.run_id = ?")
+            params.append(run_id)
+        if last_runs is not None:
+            clauses.append("c.run_id IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?)")
+            params.append(last_runs)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT c.*, r.timestamp,"
+                " (SELECT json_group_array(requirement_id) FROM conflict_requirements cr"
+                "  WHERE cr.conflict_id = c.id) AS requirements"
+                f" FROM conflicts c JOIN runs r ON r.id = c.run_id {where}"
+                " ORDER BY c.run_id DESC, c.id",
+                params
+            ).fetchall()
+        return [
+            {
+                **dict(row),
+                "dimensions": json.loads(row["dimensions"]),
+                "requirements": sorted(json.loads(row["requirements"])),
+            }
+            for row in rows
+        ]
+
+    def requirement_snapshot(self, run_id: int, requirement_id: str) -> Optional[Dict]:
+        """返回某次检测时某条需求的内容快照"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT s.content FROM run_requirements rr"
+                " JOIN requirement_snapshots s ON s.content_hash = rr.content_hash"
+                " WHERE rr.run_id = ? AND rr.requirement_id = ?",
+                (run_id, str(requirement_id))
+            ).fetchone()
+        return json.loads(row["content"]) if row else None
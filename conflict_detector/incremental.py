@@ -0,0 +1,131 @@
+"""
+增量冲突检测状态
+
+以需求内容哈希为键保存上一次检测的结果：
+- 每条需求的内容哈希，用于找出新增、修改和删除的需求
+- 每个（维度, 分片）的冲突结果，分片的键由维度和分片内需求哈希计算
+
+- 每个维度切分块和分片时的起始需求ID（边界）
+
+再次检测时，包含新增或修改需求的分片重新发送给模型，其余分片按键复用保存的冲突。
+切分时沿用上次的边界，插入或删除一条需求只改变它所在的块和分片，后面的分片不会依次错位。
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger("IncrementalState")
+
+# 状态文件格式版本，格式或提示词语义变化时递增以使旧状态失效
+STATE_VERSION = 2
+
+
+def requirement_hash(req: Dict) -> str:
+    """计算单条需求（含类别）的内容哈希"""
+    canonical = json.dumps(req, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def shard_key(dimension: str, shard: List[Dict]) -> str:
+    """计算（维度, 分片）的键，与分片内需求顺序无关"""
+    hashes = sorted(requirement_hash(req) for req in shard)
+    payload = json.dumps([STATE_VERSION, dimension, hashes], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class IncrementalState:
+    """增量检测状态文件"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: 状态文件路径，不存在时视为首次检测
+        """
+        self.path = path
+        self.previous_hashes: Dict[str, str] = {}
+        self.shards: Dict[str, List[Dict]] = {}
+        self.boundaries: Dict[str, List[str]] = {}
+        self._used: Set[str] = set()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            logger.info(f"增量状态文件 {self.path} 不存在，将执行完整检测")
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取增量状态文件失败，将执行完整检测: {e}")
+            return
+        if state.get('version') != STATE_VERSION:
+            logger.info("增量状态文件版本不匹配，将执行完整检测")
+            return
+        self.previous_hashes = state.get('requirements', {})
+        self.shards = state.get('shards', {})
+        self.boundaries = state.get('boundaries', {})
+
+    def diff(self, requirements: List[Dict]) -> Dict[str, List[str]]:
+        """
+        与上一次检测比较，找出新增、修改和删除的需求
+
+        Args:
+            requirements: 展平后的需求列表
+
+        Returns:
+            {"added": [...], "changed": [...], "removed": [...]} 需求ID列表
+        """
+        current = {str(req.get('id')): requirement_hash(req) for req in requirements}
+        return {
+            'added': [rid for rid in current if rid not in self.previous_hashes],
+            'changed': [
+                rid for rid, digest in current.items()
+                if rid in self.previous_hashes and self.previous_hashes[rid] != digest
+            ],
+            'removed': [rid for rid in self.previous_hashes if rid not in current],
+        }
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """取出保存的分片结果（返回副本），没有时返回None"""
+        conflicts = self.shards.get(key)
+        if conflicts is None:
+            return None
+        self._used.add(key)
+        return copy.deepcopy(conflicts)
+
+    def put(self, key: str, conflicts: List[Dict]):
+        """保存一个分片的检测结果"""
+        self.shards[key] = copy.deepcopy(conflicts)
+        self._used.add(key)
+
+    def get_boundaries(self, dimension: str) -> Set[str]:
+        """上次检测某个维度切分块和分片时的起始需求ID"""
+        return set(self.boundaries.get(dimension, []))
+
+    def put_boundaries(self, dimension: str, starts: List[str]):
+        """记录本次检测某个维度的块和分片起始需求ID"""
+        self.boundaries[dimension] = list(starts)
+
+    def save(self, requirements: List[Dict]):
+        """
+        写入状态文件，只保留本次检测用到的分片
+
+        Args:
+            requirements: 本次检测的展平需求列表
+        """
+        state = {
+            'version': STATE_VERSION,
+            'requirements': {str(req.get('id')): requirement_hash(req) for req in requirements},
+            'shards': {key: self.shards[key] for key in sorted(self._used) if key in self.shards},
+            'boundaries': self.boundaries,
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        logger.info(f"增量状态已保存至 {self.path}")
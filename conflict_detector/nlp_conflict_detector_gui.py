@@ -818,6 +818,8 @@ class NLPConflictDetectorGUI(QMainWindow):
             "term1": "术语1",
             "term2": "术语2",
             "resource": "资源",
+            "resources": "共享资源",
+            "score": "重叠分数",
             "reason": "原因",
             "time1": "时间约束1",
             "time2": "时间约束2"
@@ -0,0 +1,110 @@
+"""
+需求的紧凑提示词编码
+
+把发送给模型的需求从缩进JSON改为紧凑的行格式：
+- 按维度只保留分析需要的字段（owner、status 等与冲突判断无关的字段不发送）
+- 用 R1、R2… 这样的短别名代替原始需求ID，别名按需求在分片中的顺序分配，同一分片内稳定
+- 每行一条需求，字段以 | 分隔，首行为字段名
+
+模型输出中的别名再映射回原始需求ID。
+"""
+import logging
+from typing import Dict, List, Sequence
+
+logger = logging.getLogger("PromptEncoding")
+
+FIELD_SEPARATOR = "|"
+
+# 字段在提示词中的显示名称
+FIELD_LABELS = {
+    "category": "类别",
+    "title": "标题",
+    "description": "描述",
+    "priority": "优先级",
+    "owner": "负责人",
+    "status": "状态",
+}
+
+DEFAULT_FIELDS = ("title", "description")
+
+# 各维度需要的需求字段
+DIMENSION_FIELDS = {
+    "功能一致性": ("title", "description", "priority"),
+    "业务流程完整性": ("title", "description", "priority"),
+    "数据一致性": ("category", "title", "description"),
+    "安全合规性": ("category", "title", "description"),
+}
+
+
+def dimension_fields(dimension: str) -> Sequence[str]:
+    """返回某个维度需要发送的字段"""
+    return DIMENSION_FIELDS.get(dimension, DEFAULT_FIELDS)
+
+
+def _clean(value) -> str:
+    """去掉会破坏行格式的换行和分隔符"""
+    text = " ".join(str(value).split())
+    return text.replace(FIELD_SEPARATOR, "/")
+
+
+def encode_line(req: Dict, fields: Sequence[str], alias: str) -> str:
+    """把单条需求编码为一行"""
+    return FIELD_SEPARATOR.join([alias] + [_clean(req.get(field, "")) for field in fields])
+
+
+def header_line(fields: Sequence[str]) -> str:
+    """字段名行"""
+    return FIELD_SEPARATOR.join(["编号"] + [FIELD_LABELS.get(field, field) for field in fields])
+
+
+class RequirementEncoder:
+    """对一个分片的需求做紧凑编码，并把模型输出中的别名还原为需求ID"""
+
+    def __init__(self, requirements: List[Dict], dimension: str):
+        """
+        Args:
+            requirements: 分片中的需求列表
+            dimension: 分析维度，决定发送哪些字段
+        """
+        self.requirements = requirements
+        self.fields = dimension_fields(dimension)
+        self.aliases = [f"R{i}" for i in range(1, len(requirements) + 1)]
+        self.alias_to_id = {
+            alias: str(req.get("id")) for alias, req in zip(self.aliases, requirements)
+        }
+        self.known_ids = set(self.alias_to_id.values())
+
+    def encode(self) -> str:
+        """编码为字段名行加每条需求一行的文本"""
+        lines = [header_line(self.fields)]
+        lines.extend(
+            encode_line(req, self.fields, alias)
+            for alias, req in zip(self.aliases, self.requirements)
+        )
+        return "\n".join(lines)
+
+    def decode_conflicts(self, conflicts: List[Dict]) -> List[Dict]:
+        """
+        把冲突中的需求别名还原为原始需求ID
+
+        模型直接给出原始ID时保留；无法识别的编号丢弃，丢弃后涉及需求为空的冲突整体丢弃。
+
+        Args:
+            conflicts: 模型输出的冲突列表
+
+        Returns:
+            还原后的冲突列表
+        """
+        decoded = []
+        for conflict in conflicts:
+            ids = []
+            for ref in conflict.get("requirements", []):
+                ref = str(ref).strip()
+                real_id = self.alias_to_id.get(ref.upper(), ref if ref in self.known_ids else None)
+                if real_id is None:
+                    logger.warning(f"模型输出了未知的需求编号: {ref}")
+                elif real_id not in ids:
+                    ids.append(real_id)
+            if ids:
+                decoded.append({**conflict, "requirements": ids})
+        return decoded
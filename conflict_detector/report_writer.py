@@ -0,0 +1,130 @@
+"""
+流式冲突报告写入
+
+报告逐段写入文件句柄，不在内存中拼接完整文档：
+- json：与 json.dumps(indent=2) 输出相同，由 json.dump 分块写入
+- markdown：逐行写入
+- jsonl：每行一个JSON对象，供下游工具逐行读取
+    {"type": "partial", ...}   检测过程中某个维度完成时写入该维度的冲突（尚未跨维度合并）
+    {"type": "conflict", ...}  检测完成后跨维度合并的最终冲突
+    {"type": "metadata", ...}  最后一行，检测统计信息
+"""
+import json
+import logging
+from typing import Any, Dict, Iterator, List, Sequence, TextIO
+
+logger = logging.getLogger("ConflictReportWriter")
+
+REPORT_FORMATS = ("json", "markdown", "jsonl")
+
+
+def markdown_lines(results: Dict[str, Any], severity_levels: Sequence[str]) -> Iterator[str]:
+    """
+    逐行生成Markdown格式的冲突报告
+
+    Args:
+        results: detect_conflicts 的返回值
+        severity_levels: 严重等级，从高到低
+
+    Yields:
+        报告的每一行（不含换行符）
+    """
+    metadata = results['metadata']
+    yield "# 需求冲突检测报告\n"
+
+    # 添加元数据
+    yield "## 检测概览"
+    yield f"- 总需求数：{metadata['total_requirements']}"
+    yield f"- 检测到的冲突总数：{metadata['total_conflicts']}"
+    yield f"- 检测时间：{metadata['timestamp']}"
+    yield f"- 分析维度：{', '.join(metadata['dimensions_analyzed'])}"
+
+    # 按严重等级统计
+    yield "\n### 按严重等级统计"
+    for level in severity_levels:
+        count = metadata['conflicts_by_severity'].get(level, 0)
+        yield f"- {level}级冲突：{count}个"
+
+    # 冲突详情
+    yield "\n## 冲突详情"
+
+    # 按维度分组（只保存引用，不复制冲突）
+    conflicts_by_dimension: Dict[str, List[Dict]] = {}
+    for conflict in results['conflicts']:
+        conflicts_by_dimension.setdefault(conflict['dimension'], []).append(conflict)
+
+    # 按维度输出冲突
+    for dim, dim_conflicts in conflicts_by_dimension.items():
+        yield f"\n### {dim}"
+
+        for i, conflict in enumerate(dim_conflicts, 1):
+            yield f"\n#### {i}. {conflict['conflict_type']}"
+            yield f"- **严重度**: {conflict['severity']}"
+            yield f"- **涉及需求**: {', '.join(conflict['requirements'])}"
+            if len(conflict.get('dimensions', [])) > 1:
+                yield f"- **涉及维度**: {', '.join(conflict['dimensions'])}"
+            yield f"- **冲突描述**: {conflict['description']}"
+            yield f"- **影响范围**: {conflict['impact']}"
+            yield f"- **修改建议**: {conflict['suggestion']}"
+
+
+class ConflictReportWriter:
+    """把冲突报告流式写入文件句柄"""
+
+    def __init__(self, fp: TextIO, format: str = "json", severity_levels: Sequence[str] = ("高", "中", "低")):
+        """
+        Args:
+            fp: 以文本模式打开的可写文件句柄
+            format: 报告格式，"json"、"markdown" 或 "jsonl"
+            severity_levels: 严重等级，从高到低
+
+        Raises:
+            ValueError: 不支持的报告格式
+        """
+        format = format.lower()
+        if format not in REPORT_FORMATS:
+            raise ValueError(f"不支持的报告格式: {format}")
+        self.fp = fp
+        self.format = format
+        self.severity_levels = severity_levels
+
+    def _write_record(self, record_type: str, record: Dict[str, Any]):
+        self.fp.write(json.dumps({"type": record_type, **record}, ensure_ascii=False))
+        self.fp.write("\n")
+
+    def write_partial(self, dimension: str, conflicts: List[Dict]):
+        """
+        写入检测过程中某个维度完成时的冲突
+
+        只有jsonl格式逐行写出并立即刷新，供下游工具在检测完成前开始读取；其他格式忽略。
+        可直接作为 detect_conflicts 的 on_dimension 回调。
+
+        Args:
+            dimension: 完成的维度
+            conflicts: 该维度的冲突列表
+        """
+        if self.format != "jsonl":
+            return
+        for conflict in conflicts:
+            self._write_record("partial", conflict)
+        self.fp.flush()
+
+    def write_report(self, results: Dict[str, Any]):
+        """
+        写入最终报告
+
+        Args:
+            results: detect_conflicts 的返回值
+        """
+        if self.format == "json":
+            json.dump(results, self.fp, ensure_ascii=False, indent=2)
+        elif self.format == "markdown":
+            for i, line in enumerate(markdown_lines(results, self.severity_levels)):
+                if i:
+                    self.fp.write("\n")
+                self.fp.write(line)
+        else:
+            for conflict in results["conflicts"]:
+                self._write_record("conflict", conflict)
+            self._write_record("metadata", results["metadata"])
+        self.fp.flush()
@@ -10,26 +10,54 @@
 - 规则匹配分析
 """
 
-import spacy
+import sys
+from pathlib import Path
+
 from spacy.matcher import Matcher, PhraseMatcher, DependencyMatcher
 from spacy.tokens import Doc, Span
 import networkx as nx
 from collections import defaultdict, Counter
+import math
+import os
 import re
 
+# 确保能够导入项目根目录下的共享模块
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from nlp_doc_cache import DocCache
+from nlp_models import get_nlp
+from nlp_overlap_index import FunctionalOverlapIndex
+from nlp_term_index import find_containment_pairs
+
 
 class RequirementConflictDetector:
     """需求冲突检测器类，使用SpaCy实现NLP分析功能"""
     
-    def __init__(self, model="zh_core_web_sm"):
+    # 按此顺序加载的需求类别
+    REQUIREMENT_TYPES = ("功能需求", "非功能需求")
+    
+    def __init__(self, model="zh_core_web_sm", batch_size=64, n_process=1, exclude=(), use_doc_cache=True,
+                 overlap_index=None):
         """
         初始化冲突检测器
         
         参数:
             model (str): 要加载的SpaCy模型名称
+            batch_size (int): 加载需求时 nlp.pipe 每批解析的文本数
+            n_process (int): 加载需求时的解析进程数，-1表示使用全部CPU核心。
+                大于1时在Windows/macOS上需要在 if __name__ == "__main__" 保护下调用
+            exclude (tuple): 不需要的管道组件，如只做词性和依存分析时可排除 "ner"
+            use_doc_cache (bool): 是否使用磁盘缓存的解析结果（见 config.ini 的 [nlp_doc_cache]）
+            overlap_index (FunctionalOverlapIndex): 功能重叠检测使用的倒排索引，None时按配置创建
         """
-        # 加载SpaCy模型
-        self.nlp = spacy.load(model)
+        # 获取进程内共享的SpaCy模型，同一模型只加载一次
+        self.nlp = get_nlp(model, exclude)
+        self.batch_size = batch_size
+        self.n_process = n_process
+        # 解析结果缓存，需求文本未变化时跳过NLP管道
+        self.doc_cache = DocCache.from_config() if use_doc_cache else None
+        # 功能重叠检测的倒排索引
+        self.overlap_index = overlap_index or FunctionalOverlapIndex.from_config()
         # 初始化匹配器
         self.matcher = Matcher(self.nlp.vocab)
         self.phrase_matcher = PhraseMatcher(self.nlp.vocab)
@@ -43,18 +71,38 @@ class RequirementConflictDetector:
         # 图形表示，用于冲突分析
         self.requirement_graph = nx.Graph()
     
-    def load_requirements(self, requirements_data):
+    def load_requirements(self, requirements_data, batch_size=None, n_process=None):
         """
         加载需求数据
         
+        所有需求通过 nlp.pipe 分批解析（可多进程），解析结果按原顺序与需求对应，
+        需求记录和需求图节点在同一遍中构建。启用解析缓存时，文本未变化的需求直接反序列化。
+        
         参数:
             requirements_data (dict): 包含功能需求和非功能需求的字典
+            batch_size (int): 每批解析的文本数，None时使用初始化时的设置
+            n_process (int): 解析进程数，None时使用初始化时的设置
         """
+        batch_size = batch_size or self.batch_size
+        n_process = n_process or self.n_process
+        if n_process == -1:
+            n_process = os.cpu_count() or 1
+        
+        records = [
+            (req, req_type)
+            for req_type in self.REQUIREMENT_TYPES
+            for req in requirements_data.get(req_type, [])
+        ]
+        texts = (f"{req['id']}: {req['title']} - {req['description']}" for req, _ in records)
+        if self.doc_cache is not None:
+            docs = self.doc_cache.pipe(self.nlp, texts, batch_size=batch_size, n_process=n_process)
+        else:
+            # 进程数不超过批次数，需求较少时不必付出启动子进程的开销
+            n_process = max(1, min(n_process, math.ceil(len(records) / batch_size)))
+            docs = self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process)
+        
         self.requirements = []
-        # 处理功能需求
-        for req in requirements_data.get("功能需求", []):
-            req_text = f"{req['id']}: {req['title']} - {req['description']}"
-            req_doc = self.nlp(req_text)
+        for (req, req_type), req_doc in zip(records, docs):
             self.requirements.append({
                 "id": req["id"],
                 "title": req["title"],
@@ -62,33 +110,13 @@ class RequirementConflictDetector:
                 "priority": req["priority"],
                 "owner": req["owner"],
                 "status": req["status"],
-                "type": "功能需求",
+                "type": req_type,
                 "doc": req_doc
             })
             # 构建需求图
             self.requirement_graph.add_node(req["id"], 
                                            title=req["title"],
-                                           type="功能需求",
-                                           priority=req["priority"])
-            
-        # 处理非功能需求
-        for req in requirements_data.get("非功能需求", []):
-            req_text = f"{req['id']}: {req['title']} - {req['description']}"
-            req_doc = self.nlp(req_text)
-            self.requirements.append({
-                "id": req["id"],
-                "title": req["title"],
-                "description": req["description"],
-                "priority": req["priority"],
-                "owner": req["owner"],
-                "status": req["status"],
-                "type": "非功能需求",
-                "doc": req_doc
-            })
-            # 构建需求图
-            self.requirement_graph.add_node(req["id"], 
-                                           title=req["title"],
-                                           type="非功能需求",
+                                           type=req_type,
                                            priority=req["priority"])
     
     def build_terminology_dict(self):
@@ -266,33 +294,36 @@ class RequirementConflictDetector:
         consistency_issues = []
         similar_terms = defaultdict(list)
         
-        # 寻找相似但不完全相同的术语
+        # 寻找相似但不完全相同的术语：用子串索引一次找出所有包含关系，
+        # 按原先两两比较的 (i, j) 顺序处理，结果与逐对比较一致
         terms = list(self.terminology_dict.keys())
-        for i, term1 in enumerate(terms):
-            for term2 in terms[i+1:]:
-                # 如果两个术语有重叠但不完全相同
-                if (term1 in term2 or term2 in term1) and term1 != term2:
-                    similar_terms[term1].append(term2)
-                    similar_terms[term2].append(term1)
-                    
-                    # 记录不一致的术语和涉及的需求
-                    consistency_issues.append({
-                        "term1": term1,
-                        "term2": term2,
-                        "req_ids1": [ref["req_id"] for ref in self.terminology_dict[term1]],
-                        "req_ids2": [ref["req_id"] for ref in self.terminology_dict[term2]]
-                    })
-                    
-                    # 在需求图中添加边，表示潜在冲突
-                    for req_id1 in [ref["req_id"] for ref in self.terminology_dict[term1]]:
-                        for req_id2 in [ref["req_id"] for ref in self.terminology_dict[term2]]:
-                            if req_id1 != req_id2:
-                                self.requirement_graph.add_edge(
-                                    req_id1, req_id2, 
-                                    type="术语不一致",
-                                    term1=term1,
-                                    term2=term2
-                                )
+        req_ids = {
+            term: [ref["req_id"] for ref in refs]
+            for term, refs in self.terminology_dict.items()
+        }
+        for i, j in find_containment_pairs(terms):
+            term1, term2 = terms[i], terms[j]
+            similar_terms[term1].append(term2)
+            similar_terms[term2].append(term1)
+            
+            # 记录不一致的术语和涉及的需求
+            consistency_issues.append({
+                "term1": term1,
+                "term2": term2,
+                "req_ids1": list(req_ids[term1]),
+                "req_ids2": list(req_ids[term2])
+            })
+            
+            # 在需求图中添加边，表示潜在冲突
+            for req_id1 in req_ids[term1]:
+                for req_id2 in req_ids[term2]:
+                    if req_id1 != req_id2:
+                        self.requirement_graph.add_edge(
+                            req_id1, req_id2, 
+                            type="术语不一致",
+                            term1=term1,
+                            term2=term2
+                        )
         
         self.analysis_results["terminology_consistency"] = {
             "issues": consistency_issues,
@@ -477,41 +508,43 @@ class RequirementConflictDetector:
                     })
     
     def _detect_functionality_conflicts(self, conflicts):
-        """检测功能之间的潜在冲突"""
-        # 通过共享资源或术语来检测功能冲突
-        shared_resources = defaultdict(list)
+        """
+        检测功能之间的潜在冲突
         
-        for req in self.requirements:
-            if req["type"] == "功能需求":
-                doc = req["doc"]
-                
-                # 提取关键资源术语
-                for token in doc:
-                    if token.pos_ in ["NOUN", "PROPN"]:
-                        shared_resources[token.text].append(req["id"])
+        通过倒排索引汇总功能需求共享的名词：常见名词按IDF降权，出现在过多需求中的名词不参与配对，
+        每对需求只产出一个冲突，分数为共享名词的权重之和（见 config.ini 的 [functional_overlap]）。
+        """
+        # 提取每个功能需求中的关键资源术语
+        documents = [
+            (req["id"], [token.text for token in req["doc"] if token.pos_ in ["NOUN", "PROPN"]])
+            for req in self.requirements
+            if req["type"] == "功能需求"
+        ]
         
         # 如果多个功能需求共享同一资源，可能存在冲突
-        for resource, req_ids in shared_resources.items():
-            if len(req_ids) > 1:
-                for i, req_id1 in enumerate(req_ids):
-                    for req_id2 in req_ids[i+1:]:
-                        if req_id1 != req_id2:
-                            # 检查是否已经存在边
-                            if not self.requirement_graph.has_edge(req_id1, req_id2):
-                                self.requirement_graph.add_edge(
-                                    req_id1, req_id2,
-                                    type="功能重叠潜在冲突",
-                                    resource=resource
-                                )
-                            
-                            conflicts.append({
-                                "req_id1": req_id1,
-                                "req_id2": req_id2,
-                                "conflict_type": "功能重叠潜在冲突",
-                                "details": {
-                                    "resource": resource
-                                }
-                            })
+        for pair in self.overlap_index.overlapping_pairs(documents):
+            req_id1, req_id2 = pair["req_id1"], pair["req_id2"]
+            if req_id1 == req_id2:
+                continue
+            details = {
+                "resource": pair["resources"][0],
+                "resources": pair["resources"],
+                "score": pair["score"]
+            }
+            # 检查是否已经存在边
+            if not self.requirement_graph.has_edge(req_id1, req_id2):
+                self.requirement_graph.add_edge(
+                    req_id1, req_id2,
+                    type="功能重叠潜在冲突",
+                    **details
+                )
+            
+            conflicts.append({
+                "req_id1": req_id1,
+                "req_id2": req_id2,
+                "conflict_type": "功能重叠潜在冲突",
+                "details": details
+            })
     
     def generate_report(self, conflicts, output_format="text"):
         """生成冲突分析报告"""
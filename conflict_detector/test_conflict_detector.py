@@ -0,0 +1,768 @@
+"""
+测试基于Deepseek的需求冲突检测器
+
+该模块测试conflict_detector包中不依赖模型调用的部分：
+1. 候选需求预筛选
+2. 增量检测状态
+3. 紧凑提示词编码
+4. 跨维度冲突合并
+5. 检测历史记录
+6. 批量检测的断点续跑
+7. 流式报告写入
+8. 使用模型替身的 detect_conflicts：并发分析各维度，分片覆盖所有需求对并在reduce时去重，
+   预筛选减少调用次数，增量检测只重新分析受影响的分片，检测中途取消
+9. 基于SpaCy的检测器分批加载需求（使用替身nlp，需安装spacy和networkx，无需下载模型）
+"""
+
+import importlib.util
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from conflict_detector.batch import BatchRunner, collect_inputs
+from conflict_detector.candidate_filter import CandidateFilter
+from conflict_detector.conflict_detector import DeepseekAPIException, RequirementConflictDetector
+from conflict_detector.enhanced_requirements import ECOMMERCE_REQUIREMENTS
+from conflict_detector.history import ConflictHistory
+from conflict_detector.conflict_merge import merge_conflicts, normalize_type
+from conflict_detector.incremental import IncrementalState, shard_key
+from conflict_detector.prompt_encoding import RequirementEncoder
+from conflict_detector.report_writer import ConflictReportWriter
+from llm_cancel import CancelToken, LLMCancelledError
+from llm_tokens import TokenBudget
+
+
+def _req(req_id, title, description):
+    return {"id": req_id, "title": title, "description": description, "category": "功能需求"}
+
+
+class TestCandidateFilter(unittest.TestCase):
+    def setUp(self):
+        self.requirements = [
+            _req("R1", "订单支付超时", "用户提交订单后需要在15分钟内完成支付，否则订单自动取消"),
+            _req("R2", "订单支付保留", "用户提交订单后可以在24小时内完成支付"),
+            _req("R3", "图书封面展示", "图书详情页展示高清封面图片"),
+            _req("R4", "密码加密存储", "用户密码必须加密存储，不得明文保存"),
+            _req("R5", "评论审核", "用户发表的书评经人工审核后才能公开显示"),
+        ]
+
+    def test_related_requirements_grouped(self):
+        """共享短语和同类数值要求的需求进入同一候选组"""
+        groups = CandidateFilter(self.requirements).candidate_groups("业务流程完整性")
+        ids = [[req["id"] for req in group] for group in groups]
+        self.assertIn(["R1", "R2"], ids)
+
+    def test_unrelated_requirements_dropped(self):
+        """与其他需求没有共同信号的需求不进入任何候选组"""
+        groups = CandidateFilter(self.requirements).candidate_groups("业务流程完整性")
+        kept = {req["id"] for group in groups for req in group}
+        self.assertNotIn("R3", kept)
+
+    def test_groups_bounded_on_realistic_set(self):
+        """内置电商需求的候选组不超过 top_k + 1 条，不会串联成一个大组"""
+        requirements = [dict(req, category=category)
+                        for category, reqs in ECOMMERCE_REQUIREMENTS.items() for req in reqs]
+        for dimension in RequirementConflictDetector.CONFLICT_DIMENSIONS:
+            groups = CandidateFilter(requirements, top_k=3).candidate_groups(dimension)
+            self.assertGreater(len(groups), 1)
+            self.assertLessEqual(max(len(group) for group in groups), 4)
+
+
+class TestIncrementalState(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "state.json")
+        self.requirements = [
+            _req("R1", "订单支付超时", "15分钟内完成支付"),
+            _req("R2", "订单支付保留", "24小时内完成支付"),
+        ]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_shard_key_ignores_order(self):
+        self.assertEqual(
+            shard_key("功能一致性", self.requirements),
+            shard_key("功能一致性", list(reversed(self.requirements)))
+        )
+        self.assertNotEqual(
+            shard_key("功能一致性", self.requirements),
+            shard_key("数据一致性", self.requirements)
+        )
+
+    def test_round_trip_and_diff(self):
+        """保存后重新加载可复用分片结果，并识别新增、修改和删除的需求"""
+        key = shard_key("功能一致性", self.requirements)
+        state = IncrementalState(self.path)
+        state.put(key, [{"requirements": ["R1", "R2"], "severity": "高"}])
+        state.save(self.requirements)
+
+        changed = [dict(self.requirements[0], description="30分钟内完成支付"), _req("R3", "新需求", "")]
+        state = IncrementalState(self.path)
+        self.assertEqual(state.get(key), [{"requirements": ["R1", "R2"], "severity": "高"}])
+        self.assertEqual(state.diff(changed), {"added": ["R3"], "changed": ["R1"], "removed": ["R2"]})
+        self.assertIsNone(state.get(shard_key("功能一致性", changed)))
+
+
+
+class TestRequirementEncoder(unittest.TestCase):
+    def setUp(self):
+        self.requirements = [
+            dict(_req("F001", "用户注册", "邮箱注册|登录\n需设置密码"), owner="用户团队", priority="高"),
+            dict(_req("F002", "社交登录", "微信一键登录"), owner="用户团队", priority="中"),
+        ]
+
+    def test_encode_projects_fields_and_aliases_ids(self):
+        """只发送维度需要的字段，用别名代替ID，每条需求一行"""
+        text = RequirementEncoder(self.requirements, "功能一致性").encode()
+        self.assertEqual(text.splitlines(), [
+            "编号|标题|描述|优先级",
+            "R1|用户注册|邮箱注册/登录 需设置密码|高",
+            "R2|社交登录|微信一键登录|中",
+        ])
+        self.assertNotIn("用户团队", text)
+        self.assertNotIn("F001", text)
+
+    def test_decode_maps_aliases_back(self):
+        """别名还原为原始ID，原始ID保留，未知编号丢弃"""
+        encoder = RequirementEncoder(self.requirements, "功能一致性")
+        decoded = encoder.decode_conflicts([
+            {"requirements": ["R1", "r2", "R9"], "severity": "高"},
+            {"requirements": ["F002"], "severity": "低"},
+            {"requirements": ["R7"], "severity": "中"},
+        ])
+        self.assertEqual(decoded, [
+            {"requirements": ["F001", "F002"], "severity": "高"},
+            {"requirements": ["F002"], "severity": "低"},
+        ])
+
+
+
+class TestConflictMerge(unittest.TestCase):
+    LEVELS = ["高", "中", "低"]
+
+    def _conflict(self, ids, conflict_type, description, severity, dimension):
+        return {"requirements": ids, "conflict_type": conflict_type, "description": description,
+                "severity": severity, "dimension": dimension}
+
+    def test_normalize_type(self):
+        self.assertEqual(normalize_type(" 权限 边界冲突"), normalize_type("权限边界矛盾"))
+
+    def test_merges_same_pair_across_dimensions(self):
+        """同一需求对的相同类型或相似描述合并，保留最高严重度并记录所有维度"""
+        merged = merge_conflicts([
+            self._conflict(["F005", "F004"], "权限边界冲突", "免费用户可查看全部样章，与会员分级矛盾", "中", "功能一致性"),
+            self._conflict(["F004", "F005"], "权限边界矛盾", "会员权益被免费用户覆盖", "高", "用户权限逻辑"),
+            self._conflict(["F004", "F005"], "访问控制漏洞", "免费用户可查看全部样章，与会员分级冲突", "低", "安全合规性"),
+            self._conflict(["F004", "F005"], "数据定义不一致", "下载次数统计口径不同", "低", "数据一致性"),
+        ], self.LEVELS)
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(merged[0]["severity"], "高")
+        self.assertEqual(merged[0]["requirements"], ["F004", "F005"])
+        self.assertEqual(merged[0]["dimensions"], ["功能一致性", "用户权限逻辑", "安全合规性"])
+        self.assertEqual(merged[1]["dimensions"], ["数据一致性"])
+
+    def test_different_pairs_not_merged(self):
+        merged = merge_conflicts([
+            self._conflict(["F001", "F002"], "流程冲突", "描述", "中", "业务流程完整性"),
+            self._conflict(["F001", "F003"], "流程冲突", "描述", "中", "业务流程完整性"),
+        ], self.LEVELS)
+        self.assertEqual(len(merged), 2)
+
+
+class TestConflictHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.history = ConflictHistory(os.path.join(self.tmpdir.name, "history.db"))
+        self.requirements = {"功能需求": [_req("F001", "会员权限", "会员可下载"), _req("F010", "样章", "免费试读")]}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _record(self, conflicts):
+        results = {
+            "conflicts": conflicts,
+            "metadata": {"timestamp": "2026-01-01T00:00:00", "total_requirements": 2,
+                         "dimensions_analyzed": ["功能一致性", "安全合规性"]},
+        }
+        return self.history.record_run(self.requirements, results, source="reqs.json")
+
+    def test_query_by_requirement_dimension_and_severity(self):
+        """按需求ID、维度（含合并来源维度）和严重度查询"""
+        run_id = self._record([
+            {"requirements": ["F001", "F010"], "severity": "高", "conflict_type": "权限冲突",
+             "description": "d", "dimension": "功能一致性", "dimensions": ["功能一致性", "安全合规性"]},
+            {"requirements": ["F001"], "severity": "低", "conflict_type": "描述不清",
+             "description": "d", "dimension": "功能一致性"},
+        ])
+        self.assertEqual(len(self.history.query_conflicts(requirement_id="F010")), 1)
+        self.assertEqual(len(self.history.query_conflicts(dimension="安全合规性")), 1)
+        low = self.history.query_conflicts(severity="低")
+        self.assertEqual([c["requirements"] for c in low], [["F001"]])
+        self.assertEqual(self.history.requirement_snapshot(run_id, "F010")["title"], "样章")
+
+    def test_last_runs_limits_query(self):
+        conflict = {"requirements": ["F010"], "severity": "中", "conflict_type": "t",
+                    "description": "d", "dimension": "功能一致性"}
+        for _ in range(3):
+            self._record([conflict])
+        self.assertEqual(len(self.history.query_conflicts(requirement_id="F010")), 3)
+        self.assertEqual(len(self.history.query_conflicts(requirement_id="F010", last_runs=2)), 2)
+        self.assertEqual([run["id"] for run in self.history.list_runs(limit=2)], [3, 2])
+
+
+class _StubDetector:
+    """记录调用的检测器替身，需求文件中含 fail 类别时抛出异常"""
+
+    def __init__(self):
+        self.sources = []
+
+    def detect_conflicts(self, requirements, dimension=None, source=None):
+        self.sources.append(Path(source).name)
+        if "fail" in requirements:
+            raise ValueError("模拟失败")
+        return {"conflicts": [], "metadata": {"total_requirements": 1, "total_conflicts": 1,
+                                              "conflicts_by_severity": {"高": 1}}}
+
+    def write_conflict_report(self, results, fp, format="json"):
+        json.dump(results, fp)
+
+
+class TestBatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.input_dir = Path(self.tmpdir.name, "specs")
+        (self.input_dir / "sub").mkdir(parents=True)
+        for name in ("a.json", "b.json", "sub/c.json"):
+            (self.input_dir / name).write_text(json.dumps({"功能需求": []}), encoding="utf-8")
+        self.output_dir = Path(self.tmpdir.name, "reports")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _run(self, pattern):
+        detector = _StubDetector()
+        runner = BatchRunner(detector, str(self.output_dir), format="json", workers=2)
+        return detector, runner.run(collect_inputs(pattern))
+
+    def test_collect_inputs(self):
+        self.assertEqual([p.name for p in collect_inputs(str(self.input_dir))], ["a.json", "b.json"])
+        self.assertEqual(len(collect_inputs(str(self.input_dir / "**" / "*.json"))), 3)
+
+    def test_resume_skips_up_to_date_reports(self):
+        """报告已是最新的文件跳过并沿用上次的统计，输入更新后重新检测"""
+        pattern = str(self.input_dir / "**" / "*.json")
+        detector, summary = self._run(pattern)
+        self.assertEqual(sorted(detector.sources), ["a.json", "b.json", "c.json"])
+        self.assertTrue((self.output_dir / "sub" / "c.json").exists())
+        self.assertEqual(summary["totals"]["total_conflicts"], 3)
+
+        newer = os.stat(self.output_dir / "b.json").st_mtime + 10
+        os.utime(self.input_dir / "b.json", (newer, newer))
+        detector, summary = self._run(pattern)
+        self.assertEqual(detector.sources, ["b.json"])
+        self.assertEqual(summary["totals"]["skipped"], 2)
+        self.assertEqual(summary["totals"]["total_conflicts"], 3)
+
+    def test_failed_file_reported_without_report(self):
+        (self.input_dir / "b.json").write_text(json.dumps({"fail": []}), encoding="utf-8")
+        _, summary = self._run(str(self.input_dir))
+        self.assertEqual(summary["totals"]["failed"], 1)
+        self.assertFalse((self.output_dir / "b.json").exists())
+        with open(self.output_dir / "batch_summary.json", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["totals"]["completed"], 1)
+
+
+class TestConflictReportWriter(unittest.TestCase):
+    def setUp(self):
+        conflict = {"requirements": ["F001", "F002"], "severity": "高", "conflict_type": "权限冲突",
+                    "description": "描述", "impact": "影响", "suggestion": "建议", "dimension": "功能一致性"}
+        self.results = {
+            "conflicts": [conflict],
+            "metadata": {"total_requirements": 2, "total_conflicts": 1, "timestamp": "2026-01-01T00:00:00",
+                         "dimensions_analyzed": ["功能一致性"], "conflicts_by_severity": {"高": 1}},
+        }
+
+    def _write(self, format, partial=None):
+        buffer = io.StringIO()
+        writer = ConflictReportWriter(buffer, format)
+        if partial:
+            writer.write_partial("功能一致性", partial)
+        writer.write_report(self.results)
+        return buffer.getvalue()
+
+    def test_json_matches_dumps(self):
+        self.assertEqual(self._write("json"), json.dumps(self.results, ensure_ascii=False, indent=2))
+
+    def test_markdown(self):
+        report = self._write("markdown")
+        self.assertTrue(report.startswith("# 需求冲突检测报告\n"))
+        self.assertIn("#### 1. 权限冲突", report)
+        self.assertFalse(report.endswith("\n"))
+
+    def test_jsonl_partial_then_final_records(self):
+        """jsonl先写检测过程中的维度结果，再写最终冲突，最后一行是统计信息"""
+        lines = [json.loads(line) for line in self._write("jsonl", self.results["conflicts"]).splitlines()]
+        self.assertEqual([line["type"] for line in lines], ["partial", "conflict", "metadata"])
+        self.assertEqual(lines[1]["requirements"], ["F001", "F002"])
+        self.assertEqual(lines[2]["total_conflicts"], 1)
+
+    def test_partial_ignored_for_other_formats(self):
+        self.assertEqual(self._write("json", self.results["conflicts"]), self._write("json"))
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            ConflictReportWriter(io.StringIO(), "html")
+
+
+class _StubAPI:
+    """
+    模型替身：从提示词中还原分片的需求ID，按 respond 返回冲突
+
+    测试需求的标题以需求ID开头，respond(维度, 需求ID列表) 返回以需求ID表示的冲突列表，
+    替身把ID换回提示词中的别名后按模型的输出格式返回。
+    """
+
+    def __init__(self, respond=None, delay=None):
+        """
+        Args:
+            respond: respond(维度, 需求ID列表) -> 冲突列表，可抛出异常模拟调用失败
+            delay: delay(维度, 需求ID列表) -> 应答前等待的秒数，等待期间取消时抛出取消异常
+        """
+        self.respond = respond or (lambda dimension, ids: [])
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def chat_completion(self, messages, **kwargs):
+        prompt = messages[1]["content"]
+        dimension = re.search(r'识别在"(.+?)"维度', prompt).group(1)
+        # 部分维度的首个字段是类别，需求ID在标题开头
+        rows = re.findall(r"^(R\d+)\|(?:[^|\n]*\|)?([A-Z]+\d+) ", prompt, re.MULTILINE)
+        ids = [req_id for _, req_id in rows]
+        aliases = {req_id: alias for alias, req_id in rows}
+        with self._lock:
+            self.calls.append((dimension, ids))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay is not None:
+                cancel_token = kwargs.get("cancel_token")
+                if cancel_token is None:
+                    time.sleep(self.delay(dimension, ids))
+                else:
+                    cancel_token.wait(self.delay(dimension, ids))
+                    cancel_token.raise_if_cancelled()
+            conflicts = [
+                dict(conflict, requirements=[aliases[req_id] for req_id in conflict["requirements"]])
+                for conflict in self.respond(dimension, ids)
+            ]
+        finally:
+            with self._lock:
+                self.active -= 1
+        content = json.dumps({"conflicts": conflicts}, ensure_ascii=False)
+        return {"choices": [{"message": {"content": content}}]}
+
+
+def _conflict_between(req_ids, conflict_type, severity="中", description=None):
+    return {"conflict_type": conflict_type, "requirements": list(req_ids), "severity": severity,
+            "description": description or f"{conflict_type}：{'与'.join(req_ids)}",
+            "impact": "影响", "suggestion": "建议"}
+
+
+class DetectorTestCase(unittest.TestCase):
+    """用临时配置创建检测器，并把模型调用替换为 _StubAPI"""
+
+    DIMENSIONS = list(RequirementConflictDetector.CONFLICT_DIMENSIONS)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_detector(self, api, **settings):
+        config_file = os.path.join(self.tmpdir.name, "config.ini")
+        lines = ["[deepseek]", "api_key = test-key", "", "[conflict_detector]"]
+        lines += [f"{key} = {value}" for key, value in settings.items()]
+        with open(config_file, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        detector = RequirementConflictDetector(config_file=config_file, use_cache=False)
+        detector.api = api
+        return detector
+
+    @staticmethod
+    def requirements(count, category="功能需求"):
+        return {category: [_req(f"F{i:03d}", f"F{i:03d} 需求{i}", f"第{i}条需求的描述") for i in range(1, count + 1)]}
+
+
+class TestConcurrentDimensions(DetectorTestCase):
+    def conflicts_by_dimension(self, dimension, ids):
+        """每个维度报告一对不同的需求，合并时不会相互合并"""
+        index = self.DIMENSIONS.index(dimension)
+        return [_conflict_between([ids[0], ids[index + 1]], f"{dimension}问题")]
+
+    def respond(self, dimension, ids):
+        if dimension == "数据一致性":
+            raise DeepseekAPIException("模拟接口错误")
+        return self.conflicts_by_dimension(dimension, ids)
+
+    def test_results_independent_of_completion_order(self):
+        """维度完成的先后顺序不同，合并后的结果完全相同，且按维度顺序排列"""
+        order = {dim: i for i, dim in enumerate(self.DIMENSIONS)}
+        runs = []
+        for delay in (lambda dim, ids: 0.01 * order[dim], lambda dim, ids: 0.01 * (5 - order[dim])):
+            api = _StubAPI(self.conflicts_by_dimension, delay)
+            results = self.make_detector(api, max_workers=6).detect_conflicts(self.requirements(7))
+            runs.append(results["conflicts"])
+        self.assertEqual(runs[0], runs[1])
+        self.assertEqual([c["dimension"] for c in runs[0]], self.DIMENSIONS)
+
+    def test_failed_dimension_isolated(self):
+        """单个维度调用失败只记入 failed_dimensions，其他维度的结果照常返回"""
+        api = _StubAPI(self.respond)
+        results = self.make_detector(api, max_workers=3).detect_conflicts(self.requirements(7))
+        self.assertEqual(results["metadata"]["failed_dimensions"], ["数据一致性"])
+        self.assertEqual(
+            [c["dimension"] for c in results["conflicts"]],
+            [dim for dim in self.DIMENSIONS if dim != "数据一致性"]
+        )
+        self.assertEqual(len(api.calls), len(self.DIMENSIONS))
+
+    def test_max_workers_honoured(self):
+        """同时在途的分析请求数不超过 max_workers"""
+        api = _StubAPI(delay=lambda dim, ids: 0.05)
+        self.make_detector(api, max_workers=2).detect_conflicts(self.requirements(3))
+        self.assertEqual(len(api.calls), len(self.DIMENSIONS))
+        self.assertEqual(api.max_active, 2)
+
+
+class TestSharding(DetectorTestCase):
+    DIMENSION = "功能一致性"
+
+    def long_requirements(self, count):
+        """描述较长的需求，较小的token预算下一个分片只能放下几条"""
+        return {"功能需求": [
+            _req(f"F{i:03d}", f"F{i:03d} 需求{i}", f"第{i}条需求的详细描述" + "，补充说明业务规则与边界条件" * 8)
+            for i in range(1, count + 1)
+        ]}
+
+    def test_shards_cover_every_pair_and_reduce_dedupes(self):
+        """token预算迫使拆分为多个分片时，任意两条需求都在某个分片中相遇，多个分片报告的同一冲突只保留一条"""
+        def respond(dimension, ids):
+            # F001与F002同在第一个块中，所有包含该块的分片都会报告它们的冲突
+            return [
+                _conflict_between(pair, "业务规则冲突", severity="高")
+                for pair in (["F001", "F002"], ["F001", "F020"], ["F010", "F019"])
+                if set(pair) <= set(ids)
+            ]
+
+        api = _StubAPI(respond)
+        detector = self.make_detector(api, shard_size=40, prefilter="false")
+        detector.token_budget = TokenBudget(context_window=6000)
+        requirements = self.long_requirements(20)
+        results = detector.detect_conflicts(requirements, dimension=self.DIMENSION)
+
+        capacity = detector._shard_capacity(self.DIMENSION, detector._build_system_prompt(self.DIMENSION))
+        self.assertGreater(len(api.calls), 2)
+        for _, ids in api.calls:
+            shard = [req for req in requirements["功能需求"] if req["id"] in ids]
+            self.assertLessEqual(sum(detector._line_cost(req, self.DIMENSION) for req in shard), capacity)
+
+        all_ids = [req["id"] for req in requirements["功能需求"]]
+        covered = {(a, b) for _, ids in api.calls for a in ids for b in ids if a < b}
+        self.assertEqual(covered, {(a, b) for a in all_ids for b in all_ids if a < b})
+
+        self.assertEqual(
+            sorted(c["requirements"] for c in results["conflicts"]),
+            [["F001", "F002"], ["F001", "F020"], ["F010", "F019"]]
+        )
+        self.assertGreater(results["metadata"]["merged_duplicates"], 0)
+        self.assertEqual(results["metadata"]["failed_dimensions"], [])
+
+    def test_small_set_sent_in_one_shard(self):
+        api = _StubAPI()
+        self.make_detector(api, shard_size=40).detect_conflicts(self.requirements(30), dimension=self.DIMENSION)
+        self.assertEqual(len(api.calls), 1)
+        self.assertEqual(len(api.calls[0][1]), 30)
+
+
+class TestPrefilter(DetectorTestCase):
+    def ecommerce_requirements(self):
+        """内置电商需求，标题前加上需求ID供模型替身识别"""
+        return {
+            category: [dict(req, title=f"{req['id']} {req['title']}") for req in reqs]
+            for category, reqs in ECOMMERCE_REQUIREMENTS.items()
+        }
+
+    def run_detection(self, prefilter):
+        api = _StubAPI()
+        detector = self.make_detector(api, shard_size=8, prefilter=prefilter, prefilter_min_requirements=0)
+        results = detector.detect_conflicts(self.ecommerce_requirements())
+        return api, results
+
+    def test_prefilter_cuts_calls_and_covers_candidate_pairs(self):
+        """预筛选后的调用次数明显少于完整检测，且每个候选组的需求都在同一次调用中"""
+        full_api, _ = self.run_detection("false")
+        api, results = self.run_detection("true")
+        self.assertLessEqual(len(api.calls) * 2, len(full_api.calls))
+
+        requirements = RequirementConflictDetector._flatten_requirements(self.ecommerce_requirements())
+        candidate_filter = CandidateFilter(requirements)
+        for dimension in self.DIMENSIONS:
+            calls = [set(ids) for dim, ids in api.calls if dim == dimension]
+            for group in candidate_filter.candidate_groups(dimension):
+                ids = {req["id"] for req in group}
+                self.assertTrue(any(ids <= call for call in calls), f"{dimension}: {sorted(ids)}")
+            self.assertEqual(
+                results["metadata"]["candidate_requirements"][dimension],
+                len(set().union(*calls))
+            )
+
+
+class TestIncrementalDetection(DetectorTestCase):
+    DIMENSION = "功能一致性"
+
+    def respond(self, dimension, ids):
+        """相邻编号的需求对报告冲突，冲突描述包含需求内容，修改需求后结果随之变化"""
+        numbers = {int(req_id[1:]): req_id for req_id in ids}
+        return [
+            _conflict_between([numbers[n], numbers[n + 1]], "业务规则冲突",
+                              description=f"{self.descriptions[numbers[n]]}；{self.descriptions[numbers[n + 1]]}")
+            for n in sorted(numbers) if n + 1 in numbers
+        ]
+
+    def detect(self, requirements, state_file=None, **settings):
+        self.descriptions = {req["id"]: req["description"] for reqs in requirements.values() for req in reqs}
+        api = _StubAPI(self.respond)
+        detector = self.make_detector(api, **settings)
+        results = detector.detect_conflicts(requirements, dimension=self.DIMENSION, state_file=state_file)
+        return api, results
+
+    def check_incremental(self, requirements, edit, **settings):
+        """先完整检测，再修改需求后增量检测，返回两次的调用记录"""
+        state_file = os.path.join(self.tmpdir.name, "state.json")
+        first_api, _ = self.detect(requirements, state_file, **settings)
+        edited = edit(json.loads(json.dumps(requirements)))
+        api, results = self.detect(edited, state_file, **settings)
+
+        # 复用的结果与新结果拼接后，与完整检测发现的冲突相同
+        _, full = self.detect(edited, **settings)
+        by_requirements = lambda conflict: conflict["requirements"]
+        self.assertEqual(sorted(results["conflicts"], key=by_requirements),
+                         sorted(full["conflicts"], key=by_requirements))
+        incremental = results["metadata"]["incremental"]
+        self.assertEqual(incremental["analyzed_shards"], len(api.calls))
+        self.assertGreater(incremental["reused_shards"], 0)
+        return first_api, api
+
+    def edit_description(self, requirements, req_id="F031"):
+        for req in requirements["功能需求"]:
+            if req["id"] == req_id:
+                req["description"] += "，并需要二次确认"
+        return requirements
+
+    def test_edit_requeries_only_shards_containing_requirement(self):
+        """修改一条需求后只重新分析包含它的分片"""
+        first_api, api = self.check_incremental(
+            self.requirements(60), self.edit_description, shard_size=10, prefilter="false"
+        )
+        self.assertGreater(len(first_api.calls), 20)
+        self.assertTrue(api.calls)
+        self.assertTrue(all("F031" in ids for _, ids in api.calls))
+        self.assertEqual(len(api.calls), sum("F031" in ids for _, ids in first_api.calls))
+
+    def test_edit_with_prefilter_requeries_only_affected_shards(self):
+        """启用预筛选时，只重新分析包含修改需求或候选组因此变化的分片，成员不变的分片都复用"""
+        topics = ["订单支付", "图书评论", "会员积分", "库存同步", "物流通知"]
+        requirements = {"功能需求": [
+            _req(f"F{i:03d}", f"F{i:03d} {topics[i % 5]}", f"用户{topics[i % 5]}时，系统需要在{i % 7 + 1}分钟内完成处理")
+            for i in range(1, 121)
+        ]}
+        first_api, api = self.check_incremental(
+            requirements, lambda reqs: self.edit_description(reqs, "F061"),
+            shard_size=10, prefilter_min_requirements=0
+        )
+        self.assertGreater(len(first_api.calls), 20)
+        self.assertLess(len(api.calls) * 4, len(first_api.calls))
+        self.assertTrue(any("F061" in ids for _, ids in api.calls))
+        previous = [set(ids) for _, ids in first_api.calls]
+        for _, ids in api.calls:
+            self.assertTrue("F061" in ids or set(ids) not in previous, ids)
+
+    def test_insert_and_remove_requery_nearby_shards(self):
+        """插入和删除需求不会使后面的分片全部错位"""
+        def insert_and_remove(requirements):
+            reqs = requirements["功能需求"]
+            reqs.insert(10, _req("N001", "N001 新需求", "新增的需求描述"))
+            del reqs[40]
+            return requirements
+
+        first_api, api = self.check_incremental(
+            self.requirements(60), insert_and_remove, shard_size=10, prefilter="false"
+        )
+        self.assertLess(len(api.calls) * 2, len(first_api.calls))
+
+
+class TestCancellation(DetectorTestCase):
+    def test_cancel_mid_run(self):
+        """取消后立即抛出取消异常，排队的分片不再发送，已完成的维度各回调一次"""
+        quick = self.DIMENSIONS[:2]
+        api = _StubAPI(delay=lambda dim, ids: 0.01 if dim in quick else 5)
+        detector = self.make_detector(api, max_workers=2)
+        token = CancelToken()
+        completed = []
+        progress = []
+
+        def on_dimension(dimension, conflicts):
+            completed.append(dimension)
+            if len(completed) == len(quick):
+                # 两个慢维度开始后再取消
+                threading.Timer(0.1, token.cancel).start()
+
+        start = time.monotonic()
+        with self.assertRaises(LLMCancelledError):
+            detector.detect_conflicts(
+                self.requirements(3), cancel_token=token,
+                on_progress=lambda done, total: progress.append((done, total)),
+                on_dimension=on_dimension
+            )
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(sorted(completed), sorted(quick))
+        self.assertEqual(progress, [(1, 6), (2, 6)])
+
+        # 在途的两个分片已放弃，其余排队的分片从未发送
+        time.sleep(0.1)
+        self.assertEqual(len(api.calls), 4)
+        self.assertEqual(api.active, 0)
+
+
+
+class _FakeNLP:
+    """nlp 替身：只提供 pipe 和 vocab，记录每次调用的参数"""
+    
+    def __init__(self, on_doc=None):
+        """
+        Args:
+            on_doc: on_doc(序号) 在交出每个解析结果前调用
+        """
+        from spacy.vocab import Vocab
+        
+        self.vocab = Vocab()
+        self.on_doc = on_doc
+        self.calls = []
+    
+    def pipe(self, texts, batch_size, n_process):
+        self.calls.append({"batch_size": batch_size, "n_process": n_process})
+        for i, text in enumerate(texts):
+            if self.on_doc is not None:
+                self.on_doc(i)
+            yield ("doc", text)
+
+
+class _FakeDocCache:
+    """解析缓存替身：全部未命中，交给 nlp.pipe 解析"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def pipe(self, nlp, texts, batch_size=64, n_process=1):
+        self.calls.append({"batch_size": batch_size, "n_process": n_process})
+        return list(nlp.pipe(texts, batch_size=batch_size, n_process=n_process))
+
+
+@unittest.skipUnless(
+    importlib.util.find_spec("spacy") and importlib.util.find_spec("networkx"), "未安装spacy或networkx"
+)
+class TestLoadRequirements(unittest.TestCase):
+    def make_detector(self, nlp, **settings):
+        from conflict_detector import requirements_conflict_detector
+        
+        with mock.patch.object(requirements_conflict_detector, "get_nlp", return_value=nlp):
+            return requirements_conflict_detector.RequirementConflictDetector(
+                use_doc_cache=False, overlap_index=object(), **settings
+            )
+    
+    def requirements_data(self):
+        def req(req_id, title):
+            return {"id": req_id, "title": title, "description": f"{title}的描述",
+                    "priority": "高", "owner": "张三", "status": "待开发"}
+        
+        # 非功能需求在前，加载时仍按 REQUIREMENT_TYPES 的顺序
+        return {
+            "非功能需求": [req("NF001", "响应时间"), req("NF002", "可用性")],
+            "功能需求": [req("F001", "用户注册"), req("F002", "订单支付"), req("F003", "图书搜索")],
+        }
+    
+    def test_docs_in_input_order(self):
+        nlp = _FakeNLP()
+        detector = self.make_detector(nlp)
+        detector.load_requirements(self.requirements_data())
+        
+        self.assertEqual(
+            [(req["id"], req["type"]) for req in detector.requirements],
+            [("F001", "功能需求"), ("F002", "功能需求"), ("F003", "功能需求"),
+             ("NF001", "非功能需求"), ("NF002", "非功能需求")]
+        )
+        for req in detector.requirements:
+            self.assertEqual(req["doc"], ("doc", f"{req['id']}: {req['title']} - {req['description']}"))
+        self.assertEqual(list(detector.requirement_graph.nodes), [req["id"] for req in detector.requirements])
+        self.assertEqual(detector.requirement_graph.nodes["NF002"]["type"], "非功能需求")
+    
+    def test_batch_settings_passed_through(self):
+        nlp = _FakeNLP()
+        detector = self.make_detector(nlp, batch_size=2, n_process=2)
+        detector.load_requirements(self.requirements_data())
+        detector.load_requirements(self.requirements_data(), batch_size=4)
+        # 进程数不超过批次数
+        detector.load_requirements(self.requirements_data(), batch_size=2, n_process=8)
+        with mock.patch("os.cpu_count", return_value=16):
+            detector.load_requirements(self.requirements_data(), batch_size=1, n_process=-1)
+        self.assertEqual(nlp.calls, [
+            {"batch_size": 2, "n_process": 2},
+            {"batch_size": 4, "n_process": 2},
+            {"batch_size": 2, "n_process": 3},
+            {"batch_size": 1, "n_process": 5},
+        ])
+    
+    def test_records_and_graph_built_in_one_pass(self):
+        def on_doc(i):
+            # 取下一个解析结果前，前面的需求记录和图节点都已构建
+            self.assertEqual(len(detector.requirements), i)
+            self.assertEqual(detector.requirement_graph.number_of_nodes(), i)
+        
+        nlp = _FakeNLP(on_doc)
+        detector = self.make_detector(nlp)
+        detector.load_requirements(self.requirements_data())
+        self.assertEqual(len(nlp.calls), 1)
+        self.assertEqual(len(detector.requirements), 5)
+        self.assertEqual(detector.requirement_graph.number_of_nodes(), 5)
+    
+    def test_doc_cache_pipe(self):
+        nlp = _FakeNLP()
+        detector = self.make_detector(nlp, batch_size=2, n_process=-1)
+        detector.doc_cache = _FakeDocCache()
+        with mock.patch("os.cpu_count", return_value=16):
+            detector.load_requirements(self.requirements_data())
+        
+        # 进程数的上限由缓存按未命中的文本数决定
+        self.assertEqual(detector.doc_cache.calls, [{"batch_size": 2, "n_process": 16}])
+        self.assertEqual(len(nlp.calls), 1)
+        self.assertEqual(
+            [req["doc"][1].split(":")[0] for req in detector.requirements],
+            ["F001", "F002", "F003", "NF001", "NF002"]
+        )
+        self.assertEqual(detector.requirement_graph.number_of_nodes(), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
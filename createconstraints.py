@@ -5,10 +5,33 @@ import datetime
 import threading
 import time
 import os
-import requests
 from pathlib import Path
 import configparser
-import re
+from llm_json import StructuredOutputError, request_structured
+from llm_tokens import PromptTooLargeError, get_token_budget
+from llm_transport import LLMTransportError, get_transport
+
+# 约束清单输出的schema
+CONSTRAINTS_SCHEMA = {
+    'type': 'object',
+    'required': ['constraints'],
+    'properties': {
+        'constraints': {
+            'type': 'array',
+            'minItems': 1,
+            'items': {
+                'type': 'object',
+                'required': ['type', 'metric', 'value', 'description'],
+                'properties': {
+                    'type': {'type': 'string'},
+                    'metric': {'type': 'string'},
+                    'value': {'type': ['string', 'number']},
+                    'description': {'type': 'string'}
+                }
+            }
+        }
+    }
+}
 
 class ConstraintsDialog:
     """约束检查清单对话框类"""
@@ -176,8 +199,8 @@ class ConstraintsDialog:
     def _generate_constraints_thread(self):
         """生成约束清单的线程"""
         try:
-            # 这里调用约束清单生成函数
-            constraints = self._generate_constraints_data()
+            # 这里调用约束清单生成函数，生成过程中的文本实时显示
+            constraints = self._generate_constraints_data(on_token=self._on_stream_token)
             self.constraints_list = constraints
             
             # 显示生成的约束清单
@@ -187,12 +210,24 @@ class ConstraintsDialog:
             self.dialog.after(0, lambda: self._update_constraints_text(markdown_content))
             
         except Exception as e:
-            # 在UI线程中显示错误
-            self.dialog.after(0, lambda: messagebox.showerror("错误", f"生成约束清单时发生错误: {str(e)}"))
+            # 在UI线程中显示错误（异常变量在except块结束后即被删除，需先取出消息）
+            error_message = f"生成约束清单时发生错误: {str(e)}"
+            self.dialog.after(0, lambda: messagebox.showerror("错误", error_message))
         finally:
             # 在UI线程中更新UI状态
             self.dialog.after(0, lambda: self._finish_generation())
     
+    def _on_stream_token(self, token):
+        """流式回调（工作线程中调用），将新生成的文本交给UI线程追加显示"""
+        self.dialog.after(0, lambda: self._append_stream_text(token))
+    
+    def _append_stream_text(self, token):
+        """追加显示流式生成的文本"""
+        if not self.constraints_text.get('1.0', 'end-1c'):
+            self.progress_var.set("正在接收生成内容...")
+        self.constraints_text.insert(tk.END, token)
+        self.constraints_text.see(tk.END)
+    
     def _update_constraints_text(self, content):
         """更新约束清单文本框"""
         self.constraints_text.delete('1.0', tk.END)
@@ -205,11 +240,17 @@ class ConstraintsDialog:
         self.save_button.configure(state=tk.NORMAL)
         self.show_progress(False, "约束清单生成完成")
     
-    def _generate_constraints_data(self):
+    def _generate_constraints_data(self, on_token=None):
         """生成约束清单数据
         
+        Args:
+            on_token: 可选的流式回调，每收到一段生成文本即调用一次
+            
         Returns:
             list: 约束清单数据列表
+            
+        Raises:
+            Exception: API调用失败，或修复重试后模型输出仍不符合约束清单schema
         """
         # 根据用户故事解析结果准备提示信息
         domain = self.parsed_data.get('domain', '')
@@ -247,94 +288,38 @@ class ConstraintsDialog:
 - 要求值（例如：500毫秒、99.9%等）
 - 约束描述（简短说明这个约束的必要性和意义）
 
-请以JSON格式输出，格式如下：
-[
-  {{
-    "type": "约束类型",
-    "metric": "度量指标",
-    "value": "要求值",
-    "description": "约束描述"
-  }},
-  ...
-]
+请以JSON对象格式输出，constraints 字段为约束数组，格式如下：
+{{
+  "constraints": [
+    {{
+      "type": "约束类型",
+      "metric": "度量指标",
+      "value": "要求值",
+      "description": "约束描述"
+    }},
+    ...
+  ]
+}}
 """
         
-        try:
-            # 调用DeepSeek API获取生成内容
-            response = self._call_deepseek_api(prompt)
-            
-            # 提取JSON部分
-            json_match = re.search(r'\[\s*{.*}\s*\]', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group(0)
-                constraints = json.loads(json_str)
-            else:
-                # 如果没有找到JSON格式，尝试解析整个响应
-                constraints = json.loads(response)
-                
-            if not constraints:
-                raise ValueError("生成的约束清单为空")
-                
-            return constraints
-            
-        except Exception as e:
-            # 如果API调用失败或解析失败，使用默认约束清单
-            print(f"警告: 调用大模型API失败，将使用默认约束清单: {str(e)}")
-            return self._get_default_constraints(domain, role, goal)
-    
-    def _get_default_constraints(self, domain, role, goal):
-        """获取默认约束清单（当API调用失败时使用）
+        messages = [
+            {'role': 'system', 'content': '你是一位软件工程质量专家，擅长分析用户故事并生成系统约束检查清单。'},
+            {'role': 'user', 'content': prompt}
+        ]
+        streamed = []
         
-        Args:
-            domain: 用户故事领域
-            role: 用户角色
-            goal: 用户目标
-            
-        Returns:
-            list: 默认约束清单
-        """
-        constraints = []
-        
-        # 性能约束
-        constraints.append({
-            'type': '性能',
-            'metric': 'P99延迟',
-            'value': '500毫秒',
-            'description': '系统需要确保99%的请求响应时间不超过500毫秒'
-        })
-        
-        constraints.append({
-            'type': '性能',
-            'metric': '系统吞吐量',
-            'value': '1000 TPS',
-            'description': f'系统需要支持每秒至少1000次的事务处理能力，以满足{role}的使用需求'
-        })
-        
-        # 安全约束
-        constraints.append({
-            'type': '安全性',
-            'metric': '身份认证',
-            'value': 'OAuth 2.0',
-            'description': f'应使用OAuth 2.0进行{role}身份验证，确保访问安全'
-        })
-        
-        # 可靠性约束
-        constraints.append({
-            'type': '可靠性',
-            'metric': '系统可用性',
-            'value': '99.9%',
-            'description': '系统年度可用性须达到99.9%（不超过8.76小时/年的停机时间）'
-        })
-        
-        # 可扩展性约束
-        constraints.append({
-            'type': '可扩展性',
-            'metric': '用户基数',
-            'value': '支持100万用户',
-            'description': f'系统架构需要支持最多100万{role}同时在线'
-        })
-        
-        return constraints
+        def send(conversation, extra_params):
+            # 只有首次请求实时显示，修复重试的输出不再追加到界面
+            callback = on_token if not streamed else None
+            streamed.append(True)
+            return self._call_deepseek_api(conversation, on_token=callback, **extra_params)
+        
+        try:
+            # 调用DeepSeek API获取生成内容，输出不符合schema时请求模型修复一次
+            return request_structured(send, messages, CONSTRAINTS_SCHEMA)['constraints']
+        except StructuredOutputError as e:
+            # 不使用默认约束清单代替，把校验错误交给界面显示
+            raise Exception(f"模型返回的约束清单无法解析（{e}）")
     
     def _format_constraints_markdown(self, constraints):
         """格式化约束清单为Markdown格式
@@ -414,11 +399,13 @@ class ConstraintsDialog:
         except Exception as e:
             messagebox.showerror("错误", f"保存约束清单时发生错误: {str(e)}")
     
-    def _call_deepseek_api(self, prompt):
+    def _call_deepseek_api(self, messages, on_token=None, **extra_params):
         """调用DeepSeek API获取生成内容
         
         Args:
-            prompt (str): 提示词
+            messages (list): 对话消息列表
+            on_token (callable): 可选的流式回调，每收到一段生成文本即调用一次
+            **extra_params: 其他API参数，如 response_format
             
         Returns:
             str: 大模型返回的内容
@@ -433,33 +420,44 @@ class ConstraintsDialog:
             if not api_key:
                 raise ValueError("DeepSeek API密钥未配置。请在config.ini文件中设置deepseek节下的api_key。")
             
-            # 构建API请求
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {api_key}'
-            }
+            # 估算输入token数并选择 max_tokens，超出上下文窗口时不发送
+            max_tokens = get_token_budget().plan(messages, 4000)
             
-            data = {
-                'model': model,
-                'messages': [
-                    {'role': 'system', 'content': '你是一位软件工程质量专家，擅长分析用户故事并生成系统约束检查清单。'},
-                    {'role': 'user', 'content': prompt}
-                ],
-                'temperature': 0.7
-            }
+            transport = get_transport()
+            if on_token is not None:
+                # 流式请求，边生成边回调
+                return "".join(transport.stream_chat_completion(
+                    messages,
+                    on_delta=on_token,
+                    model=model,
+                    api_key=api_key,
+                    api_base=api_base,
+                    temperature=0.7,
+                    max_tokens=max_tokens,
+                    call_site='constraints',
+                    **extra_params
+                ))
             
-            # 发送API请求
-            url = f"{api_base}/chat/completions"
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
+            # 通过共享传输层发送API请求
+            result = transport.chat_completion(
+                messages,
+                model=model,
+                api_key=api_key,
+                api_base=api_base,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                call_site='constraints',
+                **extra_params
+            )
             
             # 解析返回结果
-            result = response.json()
             content = result['choices'][0]['message']['content']
             
             return content
             
-        except requests.exceptions.RequestException as e:
+        except PromptTooLargeError as e:
+            raise Exception(f"用户故事内容过长: {str(e)}")
+        except LLMTransportError as e:
             raise Exception(f"API请求失败: {str(e)}")
         except (KeyError, IndexError) as e:
             raise Exception(f"解析API响应失败: {str(e)}")
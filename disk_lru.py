@@ -0,0 +1,122 @@
+"""
+限制总大小的磁盘LRU存储
+
+LLM响应缓存（llm_cache）和spaCy解析结果缓存（nlp_doc_cache）共用的文件存储：
+- 每个条目一个文件，按键的前两位分子目录存放
+- 先写临时文件再替换，读取方不会看到写了一半的条目
+- 以文件mtime作为访问时间，总大小超过上限时从最久未访问的条目开始淘汰
+"""
+import logging
+import os
+import threading
+from typing import Iterator, Optional
+
+logger = logging.getLogger("DiskLRU")
+
+
+class DiskLRUStore:
+    """按键存取字节串的文件存储，总大小超过上限时按LRU淘汰"""
+
+    def __init__(self, root_dir: str, suffix: str, max_bytes: int, name: str = "磁盘缓存"):
+        """
+        Args:
+            root_dir: 存储目录
+            suffix: 条目文件的扩展名（如 ".json"）
+            max_bytes: 总大小上限（字节）
+            name: 日志中使用的名称
+        """
+        self.root_dir = root_dir
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.name = name
+        self._lock = threading.Lock()
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self.iter_entries())
+
+    def path(self, key: str) -> str:
+        """条目文件路径"""
+        return os.path.join(self.root_dir, key[:2], f"{key}{self.suffix}")
+
+    def iter_entries(self) -> Iterator[str]:
+        """遍历所有条目文件路径"""
+        for root, _, files in os.walk(self.root_dir):
+            for name in files:
+                if name.endswith(self.suffix):
+                    yield os.path.join(root, name)
+
+    def read(self, key: str) -> Optional[bytes]:
+        """
+        读取条目内容（不刷新访问时间，调用方确认条目有效后调用 touch）
+
+        Returns:
+            条目内容；不存在时返回None
+        """
+        try:
+            with open(self.path(key), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def touch(self, key: str):
+        """刷新条目的访问时间"""
+        try:
+            os.utime(self.path(key), None)
+        except OSError:
+            pass
+
+    def write(self, key: str, data: bytes):
+        """写入条目，必要时淘汰最久未访问的条目"""
+        path = self.path(key)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.exists(path):
+                self.total_bytes -= os.path.getsize(path)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.total_bytes += len(data)
+
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def remove(self, key: str):
+        """删除条目"""
+        with self._lock:
+            self._remove_path(self.path(key))
+
+    def clear(self):
+        """删除所有条目"""
+        with self._lock:
+            for path in list(self.iter_entries()):
+                self._remove_path(path)
+            self.total_bytes = 0
+
+    def _remove_path(self, path: str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.total_bytes -= size
+        except OSError:
+            pass
+
+    def _evict(self):
+        """按访问时间从旧到新淘汰，直到总大小不超过上限"""
+        entries = []
+        for path in self.iter_entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self.total_bytes = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, _, path in entries:
+            if self.total_bytes <= self.max_bytes:
+                break
+            self._remove_path(path)
+            evicted += 1
+        if evicted:
+            logger.info(f"{self.name}淘汰 {evicted} 个条目，当前大小 {self.total_bytes} 字节")
@@ -0,0 +1,150 @@
+"""
+DeepSeek API 异步客户端
+
+在共享传输层之上提供 asyncio 接口：
+- 通过可配置的信号量限制同时在途的请求数
+- 请求在大小固定的工作线程池中执行，复用传输层的连接池，不会为每个请求创建线程
+- iter_completions 按完成顺序返回结果，便于流水线尽早处理先返回的结果
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from llm_transport import LLMTransport, get_transport, load_config_section
+
+logger = logging.getLogger("LLMAsync")
+
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+class AsyncLLMClient:
+    """带并发上限的异步chat completion客户端"""
+
+    def __init__(
+        self,
+        transport: Optional[LLMTransport] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ):
+        """
+        初始化异步客户端
+
+        Args:
+            transport: 底层传输层，默认使用进程内共享的传输层
+            max_concurrency: 同时在途的最大请求数
+        """
+        self.transport = transport or get_transport()
+        self.max_concurrency = max(1, max_concurrency)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="llm-async"
+        )
+        # asyncio.Semaphore 绑定到事件循环，按事件循环分别创建；
+        # 以事件循环对象而非 id 为键，已关闭的事件循环的 id 可能被新的事件循环复用
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+        self._semaphores_lock = threading.Lock()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._semaphores_lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                # 发生过争用的信号量会持有其事件循环的强引用，弱引用键不会自动释放，
+                # 因此创建新信号量时清理已关闭的事件循环（如每次 asyncio.run 结束后）
+                for closed_loop in [l for l in self._semaphores if l.is_closed()]:
+                    del self._semaphores[closed_loop]
+                semaphore = asyncio.Semaphore(self.max_concurrency)
+                self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def chat_completion(self, messages: List[Dict], **params) -> Dict:
+        """
+        异步调用 chat/completions 接口
+
+        Args:
+            messages: 对话消息列表
+            **params: 传给 LLMTransport.chat_completion 的其他参数
+
+        Returns:
+            API返回的完整JSON响应
+        """
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                functools.partial(self.transport.chat_completion, messages, **params)
+            )
+
+    async def iter_completions(
+        self,
+        requests: Iterable[Dict[str, Any]]
+    ) -> AsyncIterator[Tuple[int, Any]]:
+        """
+        并发发起多个请求，按完成顺序逐个返回结果
+
+        Args:
+            requests: 请求参数列表，每项为 {"messages": [...], 其他参数...}
+
+        Yields:
+            (请求序号, 响应字典或异常) 元组；单个请求失败不会影响其他请求
+        """
+        async def run(index: int, request: Dict[str, Any]) -> Tuple[int, Any]:
+            params = dict(request)
+            messages = params.pop("messages")
+            try:
+                return index, await self.chat_completion(messages, **params)
+            except Exception as e:
+                logger.error(f"第{index}个异步请求失败: {e}")
+                return index, e
+
+        tasks = [asyncio.ensure_future(run(i, r)) for i, r in enumerate(requests)]
+        try:
+            for future in asyncio.as_completed(tasks):
+                yield await future
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def gather(self, requests: Iterable[Dict[str, Any]]) -> List[Any]:
+        """并发发起多个请求，按请求顺序返回全部结果（失败项为异常对象）"""
+        requests = list(requests)
+        results: List[Any] = [None] * len(requests)
+        async for index, result in self.iter_completions(requests):
+            results[index] = result
+        return results
+
+    def close(self):
+        """关闭工作线程池"""
+        self._executor.shutdown(wait=False)
+
+
+_shared_clients: Dict[str, AsyncLLMClient] = {}
+_shared_lock = threading.Lock()
+
+
+def get_async_client(config_file: Optional[str] = None) -> AsyncLLMClient:
+    """
+    获取进程内共享的异步客户端，并发上限读取自 config.ini 的 [deepseek] max_concurrency
+
+    Args:
+        config_file: 配置文件路径，如果为None则使用项目根目录下的config.ini
+
+    Returns:
+        共享的AsyncLLMClient实例
+    """
+    key = os.path.abspath(config_file) if config_file else ''
+    with _shared_lock:
+        client = _shared_clients.get(key)
+        if client is None:
+            section = load_config_section('deepseek', config_file)
+            client = AsyncLLMClient(
+                transport=get_transport(config_file),
+                max_concurrency=int(section.get('max_concurrency', DEFAULT_MAX_CONCURRENCY))
+            )
+            _shared_clients[key] = client
+        return client
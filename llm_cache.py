@@ -0,0 +1,147 @@
+"""
+LLM响应磁盘缓存
+
+以 (model, messages, temperature, max_tokens, api_base, response_format) 的哈希作为内容地址，将API响应持久化到磁盘：
+- 总大小超过上限时按最近访问时间（LRU）淘汰（见 disk_lru）
+- 条目超过TTL后视为失效
+- 仅缓存低温度（近似确定性）的调用，单次调用也可通过 use_cache 参数强制使用或绕过缓存
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from disk_lru import DiskLRUStore
+
+logger = logging.getLogger("LLMCache")
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class LLMResponseCache:
+    """基于文件的内容寻址LRU缓存"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 100 * 1024 * 1024,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_temperature: float = 0.3
+    ):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限（字节）
+            ttl_seconds: 条目有效期（秒），小于等于0表示永不过期
+            max_temperature: 默认只缓存温度不高于该值的调用
+        """
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_temperature = max_temperature
+        self.store = DiskLRUStore(cache_dir, '.json', max_bytes, name="LLM缓存")
+
+    @classmethod
+    def from_config(cls, config_file: Optional[str] = None) -> Optional["LLMResponseCache"]:
+        """
+        根据 config.ini 的 [llm_cache] 配置节创建缓存
+
+        Returns:
+            缓存实例；未启用缓存时返回None
+        """
+        from llm_transport import load_config_section
+
+        section = load_config_section('llm_cache', config_file)
+        if section.get('enabled', 'true').lower() not in ('true', 'yes', '1', 'on'):
+            return None
+
+        cache_dir = section.get('cache_dir', '.llm_cache')
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(PROJECT_ROOT, cache_dir)
+
+        return cls(
+            cache_dir=cache_dir,
+            max_bytes=int(float(section.get('max_size_mb', 100)) * 1024 * 1024),
+            ttl_seconds=float(section.get('ttl_hours', 168)) * 3600,
+            max_temperature=float(section.get('max_temperature', 0.3))
+        )
+
+    @staticmethod
+    def make_key(
+        model: str,
+        messages: List[Dict],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        api_base: Optional[str] = None,
+        response_format: Optional[Dict] = None
+    ) -> str:
+        """
+        计算请求的内容地址
+
+        Args:
+            model: 模型名称
+            messages: 对话消息列表
+            temperature: 采样温度
+            max_tokens: 最大生成token数
+            api_base: API基础地址，不同服务端（如本地回放服务器）的响应互不共用
+            response_format: 响应格式（如JSON模式）
+
+        Returns:
+            SHA-256十六进制摘要
+        """
+        payload = json.dumps(
+            [model, messages, temperature, max_tokens, api_base, response_format],
+            ensure_ascii=False,
+            sort_keys=True,
+            separators=(',', ':')
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def should_cache(self, temperature: Optional[float], use_cache: Optional[bool] = None) -> bool:
+        """
+        判断一次调用是否使用缓存
+
+        Args:
+            temperature: 调用的采样温度
+            use_cache: True强制使用，False强制绕过，None按温度阈值判断
+        """
+        if use_cache is not None:
+            return use_cache
+        return temperature is not None and temperature <= self.max_temperature
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        读取缓存条目，命中时刷新其访问时间
+
+        Returns:
+            缓存的响应；未命中或已过期时返回None
+        """
+        data = self.store.read(key)
+        if data is None:
+            return None
+        try:
+            entry = json.loads(data.decode('utf-8'))
+        except ValueError:
+            return None
+
+        if self.ttl_seconds > 0 and time.time() - entry.get('created_at', 0) > self.ttl_seconds:
+            self.store.remove(key)
+            return None
+
+        self.store.touch(key)
+        return entry.get('response')
+
+    def set(self, key: str, response: Dict):
+        """写入缓存条目，必要时淘汰最久未访问的条目"""
+        data = json.dumps(
+            {'created_at': time.time(), 'response': response},
+            ensure_ascii=False
+        ).encode('utf-8')
+        self.store.write(key, data)
+
+    def clear(self):
+        """清空缓存"""
+        self.store.clear()
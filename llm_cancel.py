@@ -0,0 +1,125 @@
+"""
+LLM调用取消
+
+CancelToken 由发起方（如GUI的检测线程）创建并沿调用链传给传输层：
+- 取消后，尚未发送的请求不再发送，限流等待和重试退避立即结束
+- 正在进行的HTTP请求不再等待响应，调用方立即收到 LLMCancelledError；
+  请求线程在后台结束后丢弃响应
+"""
+import logging
+import threading
+from typing import Callable, List, TypeVar
+
+logger = logging.getLogger("LLMCancel")
+
+T = TypeVar("T")
+
+
+class LLMCancelledError(Exception):
+    """调用已被取消"""
+
+
+class CancelToken:
+    """线程安全的取消标记"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        """是否已取消"""
+        return self._event.is_set()
+
+    def cancel(self):
+        """取消，并唤醒所有正在等待的调用"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+        logger.info("LLM调用已取消")
+        for callback in callbacks:
+            callback()
+
+    def raise_if_cancelled(self):
+        """已取消时抛出 LLMCancelledError"""
+        if self._event.is_set():
+            raise LLMCancelledError("调用已取消")
+
+    def wait(self, timeout: float) -> bool:
+        """
+        可被取消打断的等待
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            等待期间是否被取消
+        """
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback: Callable[[], None]):
+        """注册取消时调用的回调；已取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable[[], None]):
+        """注销回调"""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def run_cancellable(fn: Callable[[], T], cancel_token: CancelToken) -> T:
+    """
+    在后台线程执行阻塞调用，取消时不再等待其结果
+
+    Args:
+        fn: 阻塞的无参函数（如一次HTTP请求）
+        cancel_token: 取消标记
+
+    Returns:
+        fn 的返回值
+
+    Raises:
+        LLMCancelledError: 调用完成前被取消
+    """
+    cancel_token.raise_if_cancelled()
+    done = threading.Event()
+    lock = threading.Lock()
+    outcome = {}
+
+    def target():
+        try:
+            result = fn()
+        except BaseException as e:
+            outcome["error"] = e
+        else:
+            with lock:
+                outcome["result"] = result
+                abandoned = outcome.get("abandoned", False)
+            # 调用方已经放弃等待时，关闭迟到的响应以释放连接
+            if abandoned and hasattr(result, "close"):
+                result.close()
+        finally:
+            done.set()
+
+    threading.Thread(target=target, name="llm-cancellable", daemon=True).start()
+    cancel_token.add_callback(done.set)
+    try:
+        done.wait()
+    finally:
+        cancel_token.remove_callback(done.set)
+
+    with lock:
+        if "result" in outcome:
+            return outcome["result"]
+        if "error" in outcome:
+            raise outcome["error"]
+        outcome["abandoned"] = True
+    raise LLMCancelledError("调用已取消")
@@ -1,12 +1,12 @@
 """LLM接口类"""
-import json
-import requests
 import configparser
 import os
-import time
 import logging
-from typing import Dict, Optional
-from requests.exceptions import Timeout, RequestException
+from typing import Callable, Dict, Iterator, List, Optional
+from llm_async import get_async_client
+from llm_json import StructuredOutputError, request_structured
+from llm_tokens import get_token_budget
+from llm_transport import LLMTransportError, get_transport
 
 # 配置日志
 logging.basicConfig(
@@ -19,6 +19,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger("LLMInterface")
 
+# PRD评审结果的schema
+PRD_ANALYSIS_SCHEMA = {
+    'type': 'object',
+    'required': ['missing_items', 'improvement_suggestions', 'details'],
+    'properties': {
+        'missing_items': {'type': 'array', 'items': {'type': 'string'}},
+        'improvement_suggestions': {'type': 'array', 'items': {'type': 'string'}},
+        'details': {
+            'type': 'object',
+            'additionalProperties': {
+                'type': 'object',
+                'required': ['score'],
+                'properties': {
+                    'score': {'type': 'number'},
+                    'title': {'type': 'string'},
+                    'reason': {'type': 'string'}
+                }
+            }
+        }
+    }
+}
+
 def get_config():
     """
     从配置文件读取配置信息
@@ -56,14 +78,15 @@ class LLMInterface:
         """初始化LLM接口"""
         config = get_config()
         self.API_KEY = config['api_key']
-        self.API_URL = "https://api.deepseek.com/v1/chat/completions"  # 修正为完整的API端点路径
         self.TIMEOUT = config['timeout']
         self.MAX_RETRIES = config['max_retries']
         self.RETRY_DELAY = config['retry_delay']
+        # 共享的连接池化传输层，负责超时与重试
+        self.transport = get_transport()
         
     def complete(self, prompt: str, **kwargs) -> str:
         """
-        调用模型API进行补全，支持重试机制
+        调用模型API进行补全，重试由共享传输层统一处理
         
         Args:
             prompt: 提示词
@@ -72,198 +95,166 @@ class LLMInterface:
         Returns:
             模型返回的文本
         """
-        retries = 0
-        last_error = None
-        
-        while retries < self.MAX_RETRIES:
-            try:
-                headers = {
-                    'Authorization': f'Bearer {self.API_KEY}',
-                    'Content-Type': 'application/json'
-                }
-                
-                data = {
-                    'model': 'deepseek-chat',
-                    'messages': [
-                        {
-                            'role': 'user',
-                            'content': prompt
-                        }
-                    ],
-                    'max_tokens': kwargs.get('max_tokens', 2000),
-                    'temperature': kwargs.get('temperature', 0.7)
-                }
-                
-                logger.info(f"调用API，提示词: {prompt}")
-                
-                response = requests.post(
-                    self.API_URL,
-                    headers=headers,
-                    json=data,
-                    timeout=self.TIMEOUT
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info("API调用成功")
-                    return result['choices'][0]['message']['content']
-                elif response.status_code == 429:  # 速率限制
-                    logger.warning("API调用次数超限，请稍后重试")
-                    raise Exception("API调用次数超限，请稍后重试")
-                else:
-                    logger.error(f"API调用失败: {response.status_code} - {response.text}")
-                    raise Exception(f"API调用失败: {response.status_code} - {response.text}")
-                    
-            except Timeout:
-                last_error = f"API调用超时（已等待{self.TIMEOUT}秒）"
-                logger.error(last_error)
-            except RequestException as e:
-                last_error = f"网络请求错误: {str(e)}"
-                logger.error(last_error)
-            except Exception as e:
-                last_error = f"调用模型API时发生错误: {str(e)}"
-                logger.error(last_error)
-            
-            retries += 1
-            if retries < self.MAX_RETRIES:
-                logger.info(f"第{retries}次重试（共{self.MAX_RETRIES}次）...")
-                time.sleep(self.RETRY_DELAY)
+        messages = [
+            {
+                'role': 'user',
+                'content': prompt
+            }
+        ]
         
-        logger.error(f"达到最大重试次数({self.MAX_RETRIES})。最后一次错误: {last_error}")
-        raise Exception(f"达到最大重试次数({self.MAX_RETRIES})。最后一次错误: {last_error}")
-            
-    def analyze_prd(self, prd_content: str, standards: list) -> Dict:
+        logger.info(f"调用API，提示词: {prompt}")
+        return self.complete_messages(messages, **kwargs)
+    
+    def complete_messages(self, messages: List[Dict], **kwargs) -> str:
         """
-        分析PRD文档
+        以完整对话消息调用模型API
         
         Args:
-            prd_content: PRD文档内容
-            standards: 评审标准列表
+            messages: 对话消息列表
+            **kwargs: 其他参数，response_format 会原样传给API
             
         Returns:
-            分析结果字典
+            模型返回的文本
         """
-        # 构建提示词
-        prompt = self._build_analysis_prompt(prd_content, standards)
-        logger.info("构建分析提示词完成")
+        extra_params = {}
+        if kwargs.get('response_format'):
+            extra_params['response_format'] = kwargs['response_format']
         
-        # 调用模型
         try:
-            response = self.complete(prompt)
-            logger.info("收到模型响应，开始解析")
-            
-            # 尝试直接解析整个响应
-            try:
-                parsed_result = json.loads(response)
-                logger.info("JSON直接解析成功")
-                return parsed_result
-            except json.JSONDecodeError:
-                # 尝试从响应中提取JSON部分
-                logger.warning("直接解析JSON失败，尝试提取JSON部分")
-                extracted_json = self._extract_json_from_text(response)
-                if extracted_json:
-                    logger.info("成功从文本中提取JSON")
-                    return extracted_json
-                else:
-                    # 如果还是失败，进行后处理
-                    logger.error("无法从响应中提取有效JSON")
-                    return self._post_process_response(response)
-                    
-        except Exception as e:
-            logger.error(f"分析PRD时发生错误: {str(e)}")
-            raise Exception(f"分析PRD时发生错误: {str(e)}")
+            result = self.transport.chat_completion(
+                messages,
+                api_key=self.API_KEY,
+                timeout=self.TIMEOUT,
+                max_tokens=kwargs.get('max_tokens', 2000),
+                temperature=kwargs.get('temperature', 0.7),
+                use_cache=kwargs.get('use_cache'),
+                call_site=kwargs.get('call_site', 'llm_interface'),
+                **extra_params
+            )
+        except LLMTransportError as e:
+            logger.error(str(e))
+            raise
+        
+        logger.info("API调用成功")
+        return result['choices'][0]['message']['content']
             
-    def _extract_json_from_text(self, text: str) -> Dict:
-        """从文本中提取JSON部分"""
-        import re
+    def stream(self, prompt: str, on_token: Optional[Callable[[str], None]] = None, **kwargs) -> Iterator[str]:
+        """
+        以流式方式调用模型，逐段返回生成的文本
         
-        # 尝试几种常见的JSON模式
-        # 1. 查找完整的JSON对象 {...}
-        json_pattern = r'(\{[\s\S]*\})'
-        matches = re.search(json_pattern, text)
-        if matches:
-            try:
-                json_str = matches.group(1)
-                logger.info(f"找到可能的JSON字符串: {json_str[:100]}...")
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                logger.warning("第一次JSON提取尝试失败")
-                pass
+        Args:
+            prompt: 提示词
+            on_token: 每收到一段文本时的回调
+            **kwargs: 其他参数
+            
+        Yields:
+            模型增量生成的文本片段
+        """
+        messages = [
+            {
+                'role': 'user',
+                'content': prompt
+            }
+        ]
         
-        # 2. 尝试寻找JSON代码块（Markdown格式）
-        code_block_pattern = r'```(?:json)?([\s\S]*?)```'
-        matches = re.search(code_block_pattern, text)
-        if matches:
-            try:
-                json_str = matches.group(1).strip()
-                logger.info(f"从代码块中提取JSON: {json_str[:100]}...")
-                return json.loads(json_str)
-            except json.JSONDecodeError:
-                logger.warning("从代码块提取JSON失败")
-                pass
+        logger.info(f"流式调用API，提示词: {prompt}")
         
-        # 3. 尝试从文本中整理JSON结构
         try:
-            # 尝试修复常见JSON格式错误
-            cleaned_text = text
-            # 替换单引号为双引号
-            cleaned_text = re.sub(r"'([^']*)':\s*", r'"\1": ', cleaned_text)
-            # 替换不带引号的键
-            cleaned_text = re.sub(r'(\w+):\s*', r'"\1": ', cleaned_text)
-            # 查找修复后的JSON对象
-            matches = re.search(r'(\{[\s\S]*\})', cleaned_text)
-            if matches:
-                json_str = matches.group(1)
-                logger.info(f"尝试修复后的JSON: {json_str[:100]}...")
-                return json.loads(json_str)
-        except Exception as e:
-            logger.warning(f"修复JSON格式失败: {str(e)}")
+            yield from self.transport.stream_chat_completion(
+                messages,
+                on_delta=on_token,
+                api_key=self.API_KEY,
+                timeout=self.TIMEOUT,
+                max_tokens=kwargs.get('max_tokens', 2000),
+                temperature=kwargs.get('temperature', 0.7),
+                call_site=kwargs.get('call_site', 'llm_interface')
+            )
+        except LLMTransportError as e:
+            logger.error(str(e))
+            raise
             
-        # 所有尝试都失败
-        return None
+    async def acomplete(self, prompt: str, **kwargs) -> str:
+        """
+        complete 的异步版本，多个调用可在共享的并发上限内重叠执行
         
-    def _post_process_response(self, response: str) -> Dict:
-        """处理非JSON格式的响应"""
-        logger.warning("模型返回的响应无法解析为JSON")
+        Args:
+            prompt: 提示词
+            **kwargs: 其他参数
+            
+        Returns:
+            模型返回的文本
+        """
+        messages = [
+            {
+                'role': 'user',
+                'content': prompt
+            }
+        ]
         
-        # 尝试提取部分有用信息
-        missing_items = []
-        improvement_suggestions = []
-        details = {}
+        logger.info(f"异步调用API，提示词: {prompt}")
         
-        # 尝试提取缺失项
-        if "缺失" in response or "missing" in response.lower():
-            missing_pattern = r'(?:缺失项|missing items)[^\n]*?[:：]([^\n]*)'
-            matches = re.findall(missing_pattern, response, re.IGNORECASE)
-            if matches:
-                for match in matches:
-                    items = re.split(r'[,，、]', match)
-                    missing_items.extend([item.strip() for item in items if item.strip()])
+        try:
+            result = await get_async_client().chat_completion(
+                messages,
+                api_key=self.API_KEY,
+                timeout=self.TIMEOUT,
+                max_tokens=kwargs.get('max_tokens', 2000),
+                temperature=kwargs.get('temperature', 0.7),
+                use_cache=kwargs.get('use_cache'),
+                call_site=kwargs.get('call_site', 'llm_interface')
+            )
+        except LLMTransportError as e:
+            logger.error(str(e))
+            raise
         
-        # 尝试提取改进建议
-        if "建议" in response or "suggestion" in response.lower():
-            suggestion_pattern = r'(?:建议|改进|suggestions)[^\n]*?[:：]([^\n]*)'
-            matches = re.findall(suggestion_pattern, response, re.IGNORECASE)
-            if matches:
-                for match in matches:
-                    items = re.split(r'[,，、]', match)
-                    improvement_suggestions.extend([item.strip() for item in items if item.strip()])
+        logger.info("异步API调用成功")
+        return result['choices'][0]['message']['content']
+            
+    def analyze_prd(self, prd_content: str, standards: list, use_cache: Optional[bool] = None) -> Dict:
+        """
+        分析PRD文档
         
-        # 如果没有提取到任何信息，使用默认的错误消息
-        if not missing_items:
-            missing_items = ['[解析错误]无法解析模型返回的评审结果']
-        if not improvement_suggestions:
-            improvement_suggestions = ['请重试评审或联系技术支持']
+        Args:
+            prd_content: PRD文档内容
+            standards: 评审标准列表
+            use_cache: 是否使用响应缓存，None时由缓存配置决定
             
-        # 记录原始响应，以便调试
-        logger.info(f"原始响应内容: {response}")
+        Returns:
+            分析结果字典
             
-        return {
-            'missing_items': missing_items,
-            'improvement_suggestions': improvement_suggestions,
-            'details': details,
-            'raw_response': response  # 保存原始响应以便调试
-        }
+        Raises:
+            PromptTooLargeError: PRD文档超出模型上下文窗口
+        """
+        # 构建提示词
+        prompt = self._build_analysis_prompt(prd_content, standards)
+        logger.info("构建分析提示词完成")
+        
+        # 估算输入token数并选择 max_tokens，文档过大时直接拒绝（抛出 PromptTooLargeError）
+        max_tokens = get_token_budget().plan([{'role': 'user', 'content': prompt}], 2000)
+        
+        # 调用模型，输出不符合schema时请求模型修复一次
+        def send(messages: List[Dict], extra_params: Dict) -> str:
+            return self.complete_messages(
+                messages,
+                max_tokens=max_tokens,
+                use_cache=use_cache,
+                call_site='prd_check',
+                **extra_params
+            )
+        
+        try:
+            result = request_structured(
+                send, [{'role': 'user', 'content': prompt}], PRD_ANALYSIS_SCHEMA
+            )
+            logger.info("模型响应解析成功")
+            return result
+        except StructuredOutputError as e:
+            logger.error(f"无法解析模型返回的评审结果: {e}")
+            logger.info(f"原始响应内容: {e.content}")
+            raise Exception(f"分析PRD时发生错误: 模型返回的评审结果无法解析（{e}）")
+        except Exception as e:
+            logger.error(f"分析PRD时发生错误: {str(e)}")
+            raise Exception(f"分析PRD时发生错误: {str(e)}")
             
     def _build_analysis_prompt(self, prd_content: str, standards: list) -> str:
         """构建分析提示词"""
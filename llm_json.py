@@ -0,0 +1,227 @@
+"""
+LLM结构化输出
+
+统一处理模型返回的JSON：
+- 顶层为对象的schema请求 API 的 JSON 模式（response_format=json_object）
+- 单次线性扫描提取文本中第一个括号平衡的JSON值（兼容Markdown代码块和前后说明文字）
+- 按调用方提供的schema校验（JSON Schema 的一个子集）
+- 提取或校验失败时，把错误反馈给模型做一次针对性的修复重试
+"""
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger("LLMJson")
+
+_OPENERS = {'{': '}', '[': ']'}
+
+_TYPE_CHECKS = {
+    'object': lambda v: isinstance(v, dict),
+    'array': lambda v: isinstance(v, list),
+    'string': lambda v: isinstance(v, str),
+    'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    'integer': lambda v: isinstance(v, int) and not isinstance(v, bool),
+    'boolean': lambda v: isinstance(v, bool),
+    'null': lambda v: v is None,
+}
+
+
+class StructuredOutputError(ValueError):
+    """模型输出无法解析为符合schema的JSON"""
+
+    def __init__(self, message: str, content: str = "", errors: Optional[List[str]] = None):
+        super().__init__(message)
+        self.content = content
+        self.errors = errors or []
+
+
+def _scan_balanced(text: str, start: int) -> int:
+    """
+    从 start 处的左括号开始扫描到与之匹配的右括号
+
+    Returns:
+        匹配右括号之后的位置；括号不匹配时返回负的出错位置；直到文本结尾仍未闭合时返回 len(text) + 1
+    """
+    stack = [_OPENERS[text[start]]]
+    in_string = False
+    escaped = False
+    for i in range(start + 1, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == '\\':
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in _OPENERS:
+            stack.append(_OPENERS[ch])
+        elif ch in '}]':
+            if ch != stack.pop():
+                return -i
+            if not stack:
+                return i + 1
+    return len(text) + 1
+
+
+def extract_json(text: str) -> Any:
+    """
+    提取文本中第一个括号平衡且可解析的JSON对象或数组
+
+    扫描位置只前进不回退，整体为线性时间。
+
+    Args:
+        text: 模型返回的文本
+
+    Returns:
+        解析后的JSON值
+
+    Raises:
+        StructuredOutputError: 文本中没有可解析的JSON
+    """
+    if not text:
+        raise StructuredOutputError("模型返回内容为空", text or "")
+
+    i, n = 0, len(text)
+    truncated = False
+    while i < n:
+        if text[i] not in _OPENERS:
+            i += 1
+            continue
+        end = _scan_balanced(text, i)
+        if end > n:
+            truncated = True
+            break
+        if end < 0:
+            # 括号不匹配，从出错位置继续扫描
+            i = -end
+            continue
+        try:
+            return json.loads(text[i:end], strict=False)
+        except json.JSONDecodeError:
+            i = end
+
+    if truncated:
+        raise StructuredOutputError("JSON不完整，输出可能被截断", text)
+    raise StructuredOutputError("模型返回内容中没有找到JSON", text)
+
+
+def validate(value: Any, schema: Dict, path: str = "$") -> List[str]:
+    """
+    按schema校验JSON值
+
+    支持的关键字：type、properties、required、additionalProperties（schema形式）、
+    items、minItems、enum。
+
+    Args:
+        value: 待校验的值
+        schema: schema字典
+        path: 当前值的路径，用于错误信息
+
+    Returns:
+        错误信息列表，为空表示校验通过
+    """
+    expected = schema.get('type')
+    if expected:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_TYPE_CHECKS[t](value) for t in types):
+            return [f"{path} 应为 {'/'.join(types)} 类型，实际为 {type(value).__name__}"]
+
+    errors = []
+    if 'enum' in schema and value not in schema['enum']:
+        errors.append(f"{path} 的取值 {value!r} 不在允许范围 {schema['enum']} 内")
+
+    if isinstance(value, dict):
+        for key in schema.get('required', []):
+            if key not in value:
+                errors.append(f"{path} 缺少必填字段 {key}")
+        properties = schema.get('properties', {})
+        extra_schema = schema.get('additionalProperties')
+        for key, item in value.items():
+            if key in properties:
+                errors.extend(validate(item, properties[key], f"{path}.{key}"))
+            elif isinstance(extra_schema, dict):
+                errors.extend(validate(item, extra_schema, f"{path}.{key}"))
+
+    if isinstance(value, list):
+        if len(value) < schema.get('minItems', 0):
+            errors.append(f"{path} 至少需要 {schema['minItems']} 项")
+        if 'items' in schema:
+            for index, item in enumerate(value):
+                errors.extend(validate(item, schema['items'], f"{path}[{index}]"))
+
+    return errors
+
+
+def parse_structured(text: str, schema: Dict) -> Any:
+    """
+    提取并校验模型输出
+
+    Raises:
+        StructuredOutputError: 无法提取JSON，或JSON不符合schema
+    """
+    value = extract_json(text)
+    errors = validate(value, schema)
+    if errors:
+        raise StructuredOutputError(f"JSON不符合要求: {'; '.join(errors[:5])}", text, errors)
+    return value
+
+
+def json_mode_params(schema: Dict) -> Dict:
+    """
+    返回请求 JSON 模式所需的API参数
+
+    DeepSeek 的 JSON 模式只保证输出顶层为对象，且提示词中须包含“json”字样，
+    因此仅对顶层为对象的schema开启。
+    """
+    if schema.get('type') == 'object':
+        return {'response_format': {'type': 'json_object'}}
+    return {}
+
+
+def _repair_message(error: StructuredOutputError) -> str:
+    details = "\n".join(f"- {e}" for e in error.errors[:10]) or f"- {error}"
+    return (
+        "你上一次的输出无法按要求解析：\n"
+        f"{details}\n"
+        "请只输出修正后的完整JSON，不要包含任何解释文字或Markdown代码块标记。"
+    )
+
+
+def request_structured(
+    send: Callable[[List[Dict], Dict], str],
+    messages: List[Dict],
+    schema: Dict,
+    max_repairs: int = 1
+) -> Any:
+    """
+    请求结构化输出，失败时做针对性的修复重试
+
+    Args:
+        send: 发送请求的函数，参数为 (对话消息, 额外API参数)，返回模型输出文本
+        messages: 对话消息
+        schema: 期望输出的schema
+        max_repairs: 最多修复重试次数
+
+    Returns:
+        通过校验的JSON值
+
+    Raises:
+        StructuredOutputError: 修复重试后仍不符合要求
+    """
+    extra_params = json_mode_params(schema)
+    conversation = list(messages)
+    for attempt in range(max_repairs + 1):
+        content = send(conversation, extra_params)
+        try:
+            return parse_structured(content, schema)
+        except StructuredOutputError as e:
+            if attempt >= max_repairs:
+                raise
+            logger.warning(f"模型输出不符合要求，请求修复（第{attempt + 1}次）: {e}")
+            conversation = conversation + [
+                {'role': 'assistant', 'content': content},
+                {'role': 'user', 'content': _repair_message(e)}
+            ]
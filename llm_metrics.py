@@ -0,0 +1,219 @@
+"""
+LLM调用遥测
+
+记录每次DeepSeek调用的耗时、首字节时间、重试次数、token用量和HTTP状态，
+按调用点（prd_check、conflict_dimension、constraints、story_generate、story_split 等）
+聚合为进程内直方图，可导出为JSON或Prometheus文本格式。
+"""
+import atexit
+import json
+import logging
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger("LLMMetrics")
+
+# 耗时类直方图的桶边界（秒）
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# token类直方图的桶边界
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+def escape_label(value: str) -> str:
+    """按Prometheus文本格式转义标签值中的反斜杠、双引号和换行"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """固定桶边界的直方图"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶内线性插值估算分位数"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.bounds[-1]
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'buckets': {
+                **{str(bound): count for bound, count in zip(self.bounds, self._cumulative())},
+                '+Inf': self.count
+            }
+        }
+
+    def _cumulative(self) -> List[int]:
+        result, total = [], 0
+        for count in self.counts[:-1]:
+            total += count
+            result.append(total)
+        return result
+
+
+class CallSiteMetrics:
+    """单个调用点的聚合指标"""
+
+    def __init__(self):
+        self.wall_time = Histogram(LATENCY_BUCKETS)
+        self.ttfb = Histogram(LATENCY_BUCKETS)
+        self.prompt_tokens = Histogram(TOKEN_BUCKETS)
+        self.completion_tokens = Histogram(TOKEN_BUCKETS)
+        self.retries = 0
+        self.status_counts: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict:
+        return {
+            'requests': dict(self.status_counts),
+            'retries': self.retries,
+            'wall_time_seconds': self.wall_time.to_dict(),
+            'ttfb_seconds': self.ttfb.to_dict(),
+            'prompt_tokens': self.prompt_tokens.to_dict(),
+            'completion_tokens': self.completion_tokens.to_dict()
+        }
+
+
+class LLMMetrics:
+    """线程安全的进程内指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sites: Dict[str, CallSiteMetrics] = {}
+
+    def record(
+        self,
+        call_site: str,
+        status: str,
+        wall_time: float,
+        ttfb: Optional[float] = None,
+        retries: int = 0,
+        usage: Optional[Dict] = None
+    ):
+        """
+        记录一次调用
+
+        Args:
+            call_site: 调用点名称
+            status: HTTP状态码，或 cache / timeout / error 等
+            wall_time: 总耗时（秒），包含重试和等待
+            ttfb: 最后一次请求的首字节时间（秒）
+            retries: 重试次数
+            usage: API响应中的 usage 字段
+        """
+        with self._lock:
+            site = self._sites.setdefault(call_site, CallSiteMetrics())
+            site.status_counts[status] = site.status_counts.get(status, 0) + 1
+            site.retries += retries
+            site.wall_time.observe(wall_time)
+            if ttfb is not None:
+                site.ttfb.observe(ttfb)
+            if usage:
+                if usage.get('prompt_tokens') is not None:
+                    site.prompt_tokens.observe(usage['prompt_tokens'])
+                if usage.get('completion_tokens') is not None:
+                    site.completion_tokens.observe(usage['completion_tokens'])
+
+    def snapshot(self) -> Dict:
+        """返回所有调用点指标的字典"""
+        with self._lock:
+            return {name: site.to_dict() for name, site in sorted(self._sites.items())}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        """导出为Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            sites = [(escape_label(name), site) for name, site in sorted(self._sites.items())]
+
+            lines.append("# TYPE llm_requests_total counter")
+            for name, site in sites:
+                for status, count in sorted(site.status_counts.items()):
+                    lines.append(
+                        f'llm_requests_total{{call_site="{name}",status="{escape_label(status)}"}} {count}'
+                    )
+
+            lines.append("# TYPE llm_retries_total counter")
+            for name, site in sites:
+                lines.append(f'llm_retries_total{{call_site="{name}"}} {site.retries}')
+
+            for metric, attr in [
+                ("llm_request_duration_seconds", "wall_time"),
+                ("llm_time_to_first_byte_seconds", "ttfb"),
+                ("llm_prompt_tokens", "prompt_tokens"),
+                ("llm_completion_tokens", "completion_tokens")
+            ]:
+                lines.append(f"# TYPE {metric} histogram")
+                for name, site in sites:
+                    histogram = getattr(site, attr)
+                    for bound, count in zip(histogram.bounds, histogram._cumulative()):
+                        lines.append(f'{metric}_bucket{{call_site="{name}",le="{bound}"}} {count}')
+                    lines.append(f'{metric}_bucket{{call_site="{name}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{metric}_sum{{call_site="{name}"}} {histogram.sum}')
+                    lines.append(f'{metric}_count{{call_site="{name}"}} {histogram.count}')
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str, format: str = "json"):
+        """
+        将指标写入文件
+
+        Args:
+            path: 输出文件路径
+            format: json 或 prometheus
+        """
+        content = self.to_prometheus() if format == "prometheus" else self.to_json()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        logger.info(f"LLM调用指标已导出至 {path}")
+
+    def reset(self):
+        with self._lock:
+            self._sites.clear()
+
+
+_metrics = LLMMetrics()
+
+
+def get_metrics() -> LLMMetrics:
+    """获取进程内共享的指标注册表"""
+    return _metrics
+
+
+def _dump_on_exit():
+    """如果 config.ini 的 [llm_metrics] 配置了 dump_path，进程退出时自动导出指标"""
+    from llm_transport import load_config_section
+
+    section = load_config_section('llm_metrics')
+    path = section.get('dump_path')
+    if path and _metrics.snapshot():
+        try:
+            _metrics.dump(path, section.get('dump_format', 'json'))
+        except OSError as e:
+            logger.error(f"导出LLM调用指标失败: {e}")
+
+
+atexit.register(_dump_on_exit)
@@ -0,0 +1,205 @@
+"""
+LLM调用自适应限流
+
+所有线程共享同一个限流器：
+- 请求数（RPM）与token数（TPM）两个令牌桶，预算来自 config.ini 的 [rate_limit] 配置节
+- 收到 429 时按 Retry-After 让所有线程一起暂停，而不是各自固定等待；
+  暂停结束后每个等待者再随机错开一段时间，避免同时恢复发送
+- 重试等待采用带抖动的指数退避，避免并发重试同时打到服务端
+"""
+import email.utils
+import logging
+import random
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger("LLMRateLimit")
+
+
+class TokenBucket:
+    """令牌桶：容量为每分钟预算，按秒匀速补充"""
+
+    def __init__(self, per_minute: float):
+        """
+        Args:
+            per_minute: 每分钟预算，小于等于0表示不限制
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def refill(self, now: float):
+        if self.unlimited:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """返回可以消费 amount 之前还需等待的秒数"""
+        if self.unlimited:
+            return 0.0
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """线程安全的RPM/TPM限流器"""
+
+    def __init__(
+        self,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0
+    ):
+        """
+        初始化限流器
+
+        Args:
+            requests_per_minute: 每分钟请求数预算，0表示不限制
+            tokens_per_minute: 每分钟token预算，0表示不限制
+            backoff_base: 指数退避的基准等待时间（秒）
+            backoff_max: 单次退避等待时间上限（秒）
+        """
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # 服务端要求暂停（Retry-After）时，所有线程都等到该时间点之后
+        self.paused_until = 0.0
+        # 暂停结束后各等待者随机错开的时间范围（秒）
+        self.resume_spread = 0.0
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_config(cls, config_file: Optional[str] = None, backoff_base: float = 1.0) -> "RateLimiter":
+        """
+        根据 config.ini 的 [rate_limit] 配置节创建限流器
+
+        Args:
+            config_file: 配置文件路径，如果为None则使用项目根目录下的config.ini
+            backoff_base: 配置中未指定 backoff_base 时使用的基准等待时间
+        """
+        from llm_transport import load_config_section
+
+        section = load_config_section('rate_limit', config_file)
+        return cls(
+            requests_per_minute=float(section.get('requests_per_minute', 0)),
+            tokens_per_minute=float(section.get('tokens_per_minute', 0)),
+            backoff_base=float(section.get('backoff_base', backoff_base)),
+            backoff_max=float(section.get('backoff_max', 60))
+        )
+
+    def acquire(self, tokens: int = 0, cancel_token=None):
+        """
+        阻塞直到预算允许发送一次请求
+
+        Args:
+            tokens: 本次请求预计消耗的token数
+            cancel_token: 取消标记（见 llm_cancel），取消时立即结束等待
+
+        Raises:
+            LLMCancelledError: 等待期间被取消
+        """
+        if cancel_token is None:
+            return self._acquire(tokens, None)
+
+        def wake():
+            with self._condition:
+                self._condition.notify_all()
+
+        cancel_token.add_callback(wake)
+        try:
+            return self._acquire(tokens, cancel_token)
+        finally:
+            cancel_token.remove_callback(wake)
+
+    def _acquire(self, tokens: int, cancel_token):
+        paused_until = 0.0
+        resume_at = 0.0
+        with self._condition:
+            while True:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                now = time.monotonic()
+                if self.paused_until > now and self.paused_until != paused_until:
+                    # 被暂停挡住的等待者各自抽取恢复时间，而不是在暂停结束时一起发送
+                    paused_until = self.paused_until
+                    resume_at = paused_until + random.uniform(0, self.resume_spread)
+                self.request_bucket.refill(now)
+                self.token_bucket.refill(now)
+                wait = max(
+                    resume_at - now,
+                    self.request_bucket.wait_time(1),
+                    self.token_bucket.wait_time(tokens)
+                )
+                if wait <= 0:
+                    if not self.request_bucket.unlimited:
+                        self.request_bucket.tokens -= 1
+                    if not self.token_bucket.unlimited:
+                        self.token_bucket.tokens -= min(tokens, self.token_bucket.capacity)
+                    return
+                self._condition.wait(wait)
+
+    def record_usage(self, reserved_tokens: int, actual_tokens: int):
+        """按实际用量修正预估时预扣的token数"""
+        if self.token_bucket.unlimited:
+            return
+        with self._condition:
+            self.token_bucket.tokens = min(
+                self.token_bucket.capacity,
+                self.token_bucket.tokens + reserved_tokens - actual_tokens
+            )
+            self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        """
+        服务端返回 Retry-After 时，让所有线程暂停指定秒数
+
+        暂停结束后，等待中的线程在之后 seconds/2 秒内随机恢复，而不是同时发送
+        """
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.resume_spread = seconds / 2
+        logger.warning(f"触发服务端限流，所有请求暂停 {seconds:.1f} 秒")
+
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        计算第 attempt 次失败后的等待时间：指数增长，并在后一半区间内随机抖动
+
+        Args:
+            attempt: 已失败的次数（从1开始）
+        """
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 响应头
+
+    Args:
+        value: 响应头的值，可以是秒数或HTTP日期
+
+    Returns:
+        需要等待的秒数；无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
@@ -0,0 +1,292 @@
+"""
+LLM调用录制/回放工具
+
+录制：在 config.ini 的 [llm_replay] 中设置 record_dir 后，共享传输层会把每次成功的
+请求/响应对保存为夹具文件（以请求内容哈希命名）。
+
+回放：启动本地替身服务器，将 config.ini 中 [deepseek] 的 api_base 指向它，
+即可在无网络的情况下对冲突检测、PRD检查和用户故事流程做确定性的基准测试：
+
+    python llm_replay.py serve --fixtures fixtures/llm --port 8765 --latency 0.5 --error-rate 0.05
+
+    [deepseek]
+    api_base = http://127.0.0.1:8765/v1
+
+LLM响应缓存不会绕过录制和回放：录制期间传输层不读写缓存；回放服务器的响应带有
+X-LLM-Replay 头，传输层不会缓存它们，缓存键也包含 api_base，真实API的缓存不会应答回放请求。
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+logger = logging.getLogger("LLMReplay")
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# 回放流式响应时每段文本的字符数
+STREAM_CHUNK_CHARS = 8
+
+# 回放服务器在响应中附带的标记头，传输层据此不缓存回放的响应，
+# 保证每次回放调用都经过服务器注入的延迟和错误
+REPLAY_HEADER = "X-LLM-Replay"
+
+
+def fixture_key(data: Dict) -> str:
+    """
+    计算请求夹具的键：对请求体（忽略 stream 标志）做规范化哈希
+
+    同一请求无论以流式还是非流式发送，都对应同一个夹具。
+    """
+    payload = {k: v for k, v in data.items() if k != 'stream'}
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class FixtureRecorder:
+    """将请求/响应对写入夹具目录"""
+
+    def __init__(self, fixtures_dir: str):
+        self.fixtures_dir = fixtures_dir
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config_file: Optional[str] = None) -> Optional["FixtureRecorder"]:
+        """
+        根据 config.ini 的 [llm_replay] record_dir 创建录制器
+
+        Returns:
+            录制器实例；未配置 record_dir 时返回None
+        """
+        from llm_transport import load_config_section
+
+        record_dir = load_config_section('llm_replay', config_file).get('record_dir')
+        if not record_dir:
+            return None
+        if not os.path.isabs(record_dir):
+            record_dir = os.path.join(PROJECT_ROOT, record_dir)
+        logger.info(f"LLM调用录制已开启，夹具目录: {record_dir}")
+        return cls(record_dir)
+
+    def record(self, data: Dict, response: Dict):
+        """
+        保存一次请求/响应对
+
+        Args:
+            data: 请求体
+            response: 完整的响应JSON
+        """
+        key = fixture_key(data)
+        fixture = {
+            'request': {k: v for k, v in data.items() if k != 'stream'},
+            'response': response,
+            'recorded_at': time.time()
+        }
+        path = os.path.join(self.fixtures_dir, f"{key}.json")
+        with self._lock:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(fixture, f, ensure_ascii=False, indent=2)
+
+    def record_stream(self, data: Dict, chunks: List[str]):
+        """将流式响应拼接为完整响应后保存"""
+        self.record(data, {
+            'object': 'chat.completion',
+            'model': data.get('model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': "".join(chunks)},
+                'finish_reason': 'stop'
+            }]
+        })
+
+
+def load_fixtures(fixtures_dir: str) -> Dict[str, Dict]:
+    """读取夹具目录，返回 {键: 响应}"""
+    fixtures = {}
+    for name in sorted(os.listdir(fixtures_dir)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(fixtures_dir, name), 'r', encoding='utf-8') as f:
+            fixture = json.load(f)
+        fixtures[fixture_key(fixture['request'])] = fixture['response']
+    logger.info(f"从 {fixtures_dir} 加载了 {len(fixtures)} 个夹具")
+    return fixtures
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """以夹具应答 chat/completions 请求的本地替身服务器"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        fixtures: Dict[str, Dict],
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        stream_chunk_delay: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        retry_after: Optional[float] = None,
+        seed: Optional[int] = None
+    ):
+        """
+        Args:
+            fixtures: {夹具键: 响应} 字典
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            latency: 每个请求的人工延迟（秒）
+            latency_jitter: 在人工延迟上叠加的均匀随机抖动上限（秒）
+            stream_chunk_delay: 流式响应中两段文本之间的延迟（秒）
+            error_rate: 注入错误的概率（0-1）
+            error_status: 注入错误时返回的HTTP状态码
+            retry_after: 注入错误时返回的 Retry-After 秒数
+            seed: 随机数种子，用于复现抖动和错误注入
+        """
+        super().__init__((host, port), ReplayRequestHandler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.stream_chunk_delay = stream_chunk_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.request_count = 0
+
+    def draw(self):
+        """返回 (本次延迟, 是否注入错误)"""
+        with self.random_lock:
+            self.request_count += 1
+            delay = self.latency + self.random.uniform(0, self.latency_jitter)
+            inject_error = self.random.random() < self.error_rate
+        return delay, inject_error
+
+
+class ReplayRequestHandler(BaseHTTPRequestHandler):
+    """回放服务器的请求处理器"""
+
+    protocol_version = "HTTP/1.1"
+    server: ReplayServer
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, body: Dict, headers: Optional[Dict] = None):
+        payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            data = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': '请求体不是合法的JSON'}})
+            return
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': f'不支持的路径: {self.path}'}})
+            return
+
+        delay, inject_error = self.server.draw()
+        if delay > 0:
+            time.sleep(delay)
+
+        if inject_error:
+            headers = {}
+            if self.server.retry_after is not None:
+                headers['Retry-After'] = str(self.server.retry_after)
+            self._send_json(self.server.error_status, {'error': {'message': '注入的模拟错误'}}, headers)
+            return
+
+        response = self.server.fixtures.get(fixture_key(data))
+        if response is None:
+            self._send_json(404, {'error': {'message': '没有与该请求匹配的夹具'}})
+            return
+
+        if data.get('stream'):
+            self._send_stream(response)
+        else:
+            self._send_json(200, response, {REPLAY_HEADER: '1'})
+
+    def _send_stream(self, response: Dict):
+        """把完整响应拆分为SSE事件流返回"""
+        content = response['choices'][0]['message']['content']
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Connection', 'close')
+        self.send_header(REPLAY_HEADER, '1')
+        self.end_headers()
+        for i in range(0, len(content), STREAM_CHUNK_CHARS):
+            chunk = {'choices': [{'index': 0, 'delta': {'content': content[i:i + STREAM_CHUNK_CHARS]}}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            if self.server.stream_chunk_delay > 0:
+                time.sleep(self.server.stream_chunk_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def main():
+    """CLI入口函数"""
+    parser = argparse.ArgumentParser(description="DeepSeek API 录制回放替身服务器")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="启动回放服务器")
+    serve.add_argument("--fixtures", "-f", required=True, help="夹具目录")
+    serve.add_argument("--host", default="127.0.0.1", help="监听地址，默认127.0.0.1")
+    serve.add_argument("--port", "-p", type=int, default=8765, help="监听端口，默认8765")
+    serve.add_argument("--latency", type=float, default=0.0, help="每个请求的人工延迟（秒）")
+    serve.add_argument("--latency-jitter", type=float, default=0.0, help="人工延迟的随机抖动上限（秒）")
+    serve.add_argument("--stream-chunk-delay", type=float, default=0.0, help="流式响应分段间隔（秒）")
+    serve.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率（0-1）")
+    serve.add_argument("--error-status", type=int, default=503, help="注入错误的HTTP状态码，默认503")
+    serve.add_argument("--retry-after", type=float, help="注入错误时返回的 Retry-After 秒数")
+    serve.add_argument("--seed", type=int, help="随机数种子")
+
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+
+    server = ReplayServer(
+        load_fixtures(args.fixtures),
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        stream_chunk_delay=args.stream_chunk_delay,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+    print(f"回放服务器已启动: http://{args.host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+在途请求合并（single-flight）
+
+多个线程同时发起相同的请求时，只有第一个线程真正执行，
+其余线程等待并共享同一个结果（或同一个异常）。
+
+取消只影响取消的一方：等待者被取消时立即返回，不影响正在执行的请求；
+执行请求的线程被取消时，未取消的等待者重新发起请求，而不是收到别人的取消。
+"""
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, TypeVar
+
+from llm_cancel import CancelToken, LLMCancelledError
+
+logger = logging.getLogger("LLMSingleFlight")
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+
+    def do(self, key: str, fn: Callable[[], T], cancel_token: Optional[CancelToken] = None) -> T:
+        """
+        执行 fn；如果相同 key 的调用正在进行，则等待其结果而不重复执行
+
+        Args:
+            key: 请求的唯一标识
+            fn: 实际执行请求的无参函数，应自行响应本调用的取消标记
+            cancel_token: 本调用的取消标记，取消时停止等待
+
+        Returns:
+            fn 的返回值（可能来自其他线程的执行）
+
+        Raises:
+            LLMCancelledError: 本调用被取消
+        """
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._inflight[key] = future
+
+            if leader:
+                return self._lead(key, future, fn)
+
+            logger.info("合并相同的在途请求，等待已发出请求的结果")
+            try:
+                return self._wait(future, cancel_token)
+            except LLMCancelledError:
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise
+                # 被取消的是发出请求的一方，本调用仍需要结果，重新发起
+                logger.info("合并的在途请求已被其发起方取消，重新发起请求")
+
+    def _lead(self, key: str, future: Future, fn: Callable[[], T]) -> T:
+        try:
+            result = fn()
+        except BaseException as e:
+            # 先移除在途记录再通知等待者，重新发起的等待者不会再取到这个已结束的请求
+            self._release(key, future)
+            future.set_exception(e)
+            raise
+        self._release(key, future)
+        future.set_result(result)
+        return result
+
+    def _release(self, key: str, future: Future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    @staticmethod
+    def _wait(future: Future, cancel_token: Optional[CancelToken]):
+        """等待在途请求的结果，本调用取消时立即抛出 LLMCancelledError"""
+        if cancel_token is None:
+            return future.result()
+
+        done = threading.Event()
+        future.add_done_callback(lambda _: done.set())
+        cancel_token.add_callback(done.set)
+        try:
+            done.wait()
+        finally:
+            cancel_token.remove_callback(done.set)
+        cancel_token.raise_if_cancelled()
+        return future.result()
+
+    def inflight_count(self) -> int:
+        """当前在途的不同请求数"""
+        with self._lock:
+            return len(self._inflight)
@@ -0,0 +1,211 @@
+"""
+提示词token估算与预算
+
+在发送请求之前估算输入token数，并据此：
+- 动态选择 max_tokens，使输入与输出之和不超过模型上下文窗口
+- 拒绝放不下的提示词，或把条目列表拆分为多个放得下的批次
+
+估算规则参考 DeepSeek 官方换算：1个中文字符约0.6个token，1个英文字符约0.3个token。
+"""
+import logging
+import math
+from typing import Callable, Dict, List, Optional, Sequence, TypeVar
+
+logger = logging.getLogger("LLMTokens")
+
+T = TypeVar("T")
+
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+# 每条消息的角色、分隔符等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class PromptTooLargeError(ValueError):
+    """提示词超出token预算"""
+
+    def __init__(self, message: str, input_tokens: int, limit: int):
+        super().__init__(message)
+        self.input_tokens = input_tokens
+        self.limit = limit
+
+
+def _is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF      # 中日韩统一表意文字
+        or 0x3400 <= code <= 0x4DBF   # 扩展A
+        or 0x3000 <= code <= 0x303F   # 中文标点
+        or 0xFF00 <= code <= 0xFFEF   # 全角字符
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的token数（向上取整）
+    """
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR)
+
+
+def estimate_messages_tokens(messages: Sequence[Dict]) -> int:
+    """估算对话消息列表的输入token数"""
+    return sum(
+        estimate_tokens(str(message.get('content', ''))) + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
+
+
+class TokenBudget:
+    """基于上下文窗口的token预算"""
+
+    def __init__(
+        self,
+        context_window: int = 64000,
+        max_output_tokens: int = 8192,
+        min_output_tokens: int = 512,
+        safety_margin: float = 0.05
+    ):
+        """
+        Args:
+            context_window: 模型上下文窗口（输入+输出）的token数
+            max_output_tokens: 接口允许的最大输出token数
+            min_output_tokens: 至少要为输出保留的token数，否则视为输入过大
+            safety_margin: 估算误差的安全余量比例
+        """
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.min_output_tokens = min_output_tokens
+        self.safety_margin = safety_margin
+
+    @classmethod
+    def from_config(cls, config_file: Optional[str] = None) -> "TokenBudget":
+        """根据 config.ini 的 [token_budget] 配置节创建预算"""
+        from llm_transport import load_config_section
+
+        section = load_config_section('token_budget', config_file)
+        return cls(
+            context_window=int(section.get('context_window', 64000)),
+            max_output_tokens=int(section.get('max_output_tokens', 8192)),
+            min_output_tokens=int(section.get('min_output_tokens', 512)),
+            safety_margin=float(section.get('safety_margin', 0.05))
+        )
+
+    @property
+    def max_input_tokens(self) -> int:
+        """输入可用的最大token数（已扣除安全余量和最小输出预留）"""
+        usable = int(self.context_window * (1 - self.safety_margin))
+        return usable - self.min_output_tokens
+
+    def input_capacity(self, fixed_tokens: int, reserve_output_tokens: int) -> int:
+        """
+        提示词中可变部分可用的token数
+
+        Args:
+            fixed_tokens: 提示词中固定部分的token数
+            reserve_output_tokens: 需要为输出预留的token数
+        """
+        return int(self.context_window * (1 - self.safety_margin)) - fixed_tokens - reserve_output_tokens
+
+    def plan_max_tokens(self, input_tokens: int, desired_max_tokens: int) -> int:
+        """
+        根据输入token数选择 max_tokens
+
+        Args:
+            input_tokens: 估算的输入token数
+            desired_max_tokens: 调用方期望的最大输出token数
+
+        Returns:
+            不超过上下文窗口剩余空间的 max_tokens
+
+        Raises:
+            PromptTooLargeError: 输入过大，剩余空间不足 min_output_tokens
+        """
+        if input_tokens > self.max_input_tokens:
+            raise PromptTooLargeError(
+                f"提示词约 {input_tokens} tokens，超过输入预算 {self.max_input_tokens} tokens",
+                input_tokens,
+                self.max_input_tokens
+            )
+        remaining = int(self.context_window * (1 - self.safety_margin)) - input_tokens
+        return max(self.min_output_tokens, min(desired_max_tokens, self.max_output_tokens, remaining))
+
+    def plan(self, messages: Sequence[Dict], desired_max_tokens: int) -> int:
+        """估算消息的输入token数并返回可用的 max_tokens，过大时抛出 PromptTooLargeError"""
+        input_tokens = estimate_messages_tokens(messages)
+        max_tokens = self.plan_max_tokens(input_tokens, desired_max_tokens)
+        logger.info(f"提示词预估 {input_tokens} tokens，max_tokens={max_tokens}")
+        return max_tokens
+
+    def split_items(
+        self,
+        items: Sequence[T],
+        render: Callable[[T], str],
+        fixed_tokens: int,
+        reserve_output_tokens: int,
+        max_items: Optional[int] = None,
+        overlap: int = 0
+    ) -> List[List[T]]:
+        """
+        把条目列表拆分为多个批次（窗口），使每个批次的提示词都放得下
+
+        Args:
+            items: 条目列表
+            render: 把单个条目渲染为提示词文本的函数
+            fixed_tokens: 提示词中与条目无关的固定部分的token数
+            reserve_output_tokens: 需要为输出预留的token数
+            max_items: 每个批次的最大条目数，None表示只受token预算限制
+            overlap: 相邻批次重叠的条目数，使跨批次边界的条目也能在同一批次中出现
+
+        Returns:
+            保持原顺序的批次列表
+
+        Raises:
+            PromptTooLargeError: 单个条目本身就放不下
+        """
+        capacity = self.input_capacity(fixed_tokens, reserve_output_tokens)
+        costs = []
+        for item in items:
+            cost = estimate_tokens(render(item))
+            if cost > capacity:
+                raise PromptTooLargeError(
+                    f"单个条目约 {cost} tokens，超过可用预算 {max(capacity, 0)} tokens",
+                    cost,
+                    max(capacity, 0)
+                )
+            costs.append(cost)
+
+        batches: List[List[T]] = []
+        start, total = 0, len(items)
+        while start < total:
+            end, used = start, 0
+            while end < total and (max_items is None or end - start < max_items):
+                if end > start and used + costs[end] > capacity:
+                    break
+                used += costs[end]
+                end += 1
+            batches.append(list(items[start:end]))
+            if end >= total:
+                break
+            # 下一个窗口回退 overlap 个条目，但至少前进一个条目
+            start = max(end - overlap, start + 1)
+        return batches
+
+
+_budget: Optional[TokenBudget] = None
+
+
+def get_token_budget() -> TokenBudget:
+    """获取进程内共享的token预算（读取项目根目录下的config.ini）"""
+    global _budget
+    if _budget is None:
+        _budget = TokenBudget.from_config()
+    return _budget
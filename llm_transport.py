@@ -0,0 +1,515 @@
+"""
+DeepSeek API 共享传输层
+
+所有DeepSeek调用点（LLMInterface、DeepseekAPI、约束清单生成、用户故事生成/拆分）
+统一通过本模块发送请求：
+- 基于 requests.Session 的 keep-alive 连接池，避免每次调用重新进行 TCP+TLS 握手
+- 每个主机的连接池大小可在 config.ini 中配置
+- 统一的超时与重试语义
+- 可选的磁盘响应缓存（见 llm_cache）
+- 流式（SSE）补全，逐段返回生成的文本
+- 跨线程共享的RPM/TPM限流，重试采用带抖动的指数退避并遵循 Retry-After（见 llm_ratelimit）
+- 相同请求并发时只发出一次HTTP请求，所有等待者共享结果（见 llm_singleflight）
+- 按调用点记录耗时、首字节时间、重试次数和token用量（见 llm_metrics）
+- 可选地把请求/响应对录制为夹具，供本地回放服务器使用（见 llm_replay）
+- 调用方可传入取消标记，取消后立即放弃在途请求和等待（见 llm_cancel）
+"""
+import configparser
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_cache import LLMResponseCache
+from llm_cancel import CancelToken, LLMCancelledError, run_cancellable
+from llm_metrics import get_metrics
+from llm_ratelimit import RateLimiter, parse_retry_after
+from llm_replay import REPLAY_HEADER, FixtureRecorder
+from llm_singleflight import SingleFlight
+from llm_tokens import estimate_messages_tokens
+
+logger = logging.getLogger("LLMTransport")
+
+DEFAULT_API_BASE = "https://api.deepseek.com/v1"
+DEFAULT_MODEL = "deepseek-chat"
+
+# 可重试的HTTP状态码：速率限制和服务端临时错误
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class LLMTransportError(Exception):
+    """传输层异常，携带HTTP状态码（如有）"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def load_config_section(section: str, config_file: Optional[str] = None) -> Dict[str, str]:
+    """
+    读取配置文件中的某个配置节
+
+    Args:
+        section: 配置节名称
+        config_file: 配置文件路径，如果为None则使用项目根目录下的config.ini
+
+    Returns:
+        配置项字典，配置文件或配置节不存在时返回空字典
+    """
+    if config_file is None:
+        config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
+
+    parser = configparser.ConfigParser()
+    if os.path.exists(config_file):
+        parser.read(config_file, encoding='utf-8')
+    else:
+        logger.warning(f"配置文件 {config_file} 不存在，使用默认配置")
+
+    return dict(parser[section]) if section in parser else {}
+
+
+def load_transport_config(config_file: Optional[str] = None) -> Dict:
+    """
+    从配置文件读取传输层配置
+
+    Args:
+        config_file: 配置文件路径，如果为None则使用项目根目录下的config.ini
+
+    Returns:
+        配置字典，缺失的配置项使用默认值
+    """
+    section = load_config_section('deepseek', config_file)
+    return {
+        'api_key': section.get('api_key') or os.environ.get("DEEPSEEK_API_KEY"),
+        'api_base': section.get('api_base', DEFAULT_API_BASE),
+        'model': section.get('model', DEFAULT_MODEL),
+        'timeout': int(section.get('timeout', 60)),
+        'max_retries': int(section.get('max_retries', 3)),
+        'retry_delay': int(section.get('retry_delay', 5)),
+        'pool_connections': int(section.get('pool_connections', 10)),
+        'pool_maxsize': int(section.get('pool_maxsize', 10)),
+    }
+
+
+class LLMTransport:
+    """带连接池的DeepSeek HTTP传输"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        api_base: str = DEFAULT_API_BASE,
+        model: str = DEFAULT_MODEL,
+        timeout: int = 60,
+        max_retries: int = 3,
+        retry_delay: int = 5,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        cache: Optional[LLMResponseCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        recorder: Optional[FixtureRecorder] = None
+    ):
+        """
+        初始化传输层
+
+        Args:
+            api_key: 默认API密钥
+            api_base: 默认API基础地址
+            model: 默认模型名称
+            timeout: 单次请求超时时间（秒）
+            max_retries: 最大尝试次数
+            retry_delay: 重试退避的基准等待时间（秒）
+            pool_connections: 缓存的主机连接池数量
+            pool_maxsize: 每个主机保持的最大连接数
+            cache: 响应缓存，为None时不缓存
+            rate_limiter: 限流器，为None时创建不限制预算、仅负责退避的限流器
+            recorder: 夹具录制器，为None时不录制
+        """
+        self.api_key = api_key
+        self.api_base = api_base.rstrip('/')
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max(1, max_retries)
+        self.retry_delay = retry_delay
+        self.cache = cache
+        self.rate_limiter = rate_limiter or RateLimiter(backoff_base=retry_delay)
+        self.single_flight = SingleFlight()
+        self.recorder = recorder
+
+        # 重试由本类统一处理，适配器本身不重试
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @classmethod
+    def from_config(cls, config_file: Optional[str] = None) -> "LLMTransport":
+        """根据配置文件创建传输层实例"""
+        config = load_transport_config(config_file)
+        return cls(
+            cache=LLMResponseCache.from_config(config_file),
+            rate_limiter=RateLimiter.from_config(config_file, backoff_base=config['retry_delay']),
+            recorder=FixtureRecorder.from_config(config_file),
+            **config
+        )
+
+    def chat_completion(
+        self,
+        messages: List[Dict],
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        api_base: Optional[str] = None,
+        timeout: Optional[int] = None,
+        use_cache: Optional[bool] = None,
+        call_site: str = "unknown",
+        cancel_token: Optional[CancelToken] = None,
+        **params
+    ) -> Dict:
+        """
+        调用 chat/completions 接口，失败时按统一语义重试
+
+        Args:
+            messages: 对话消息列表
+            model: 模型名称，默认使用配置中的模型
+            api_key: API密钥，默认使用配置中的密钥
+            api_base: API基础地址，默认使用配置中的地址
+            timeout: 请求超时时间（秒），默认使用配置中的超时时间
+            use_cache: True强制使用缓存，False绕过缓存，None时仅缓存低温度调用
+            call_site: 调用点名称，用于遥测统计
+            cancel_token: 取消标记，取消时抛出 LLMCancelledError
+            **params: 其他请求参数，如 temperature、max_tokens
+
+        Returns:
+            API返回的完整JSON响应
+        """
+        started = time.monotonic()
+        url, headers = self._endpoint(api_key, api_base)
+        timeout = timeout or self.timeout
+        data = {
+            'model': model or self.model,
+            'messages': messages,
+            **params
+        }
+
+        cache_key = None
+        # 录制时不读写缓存：每次调用都要到达服务器，才能为其写入夹具
+        if (
+            self.cache is not None
+            and self.recorder is None
+            and self.cache.should_cache(params.get('temperature'), use_cache)
+        ):
+            cache_key = LLMResponseCache.make_key(
+                data['model'], messages, params.get('temperature'), params.get('max_tokens'),
+                api_base=(api_base or self.api_base).rstrip('/'),
+                response_format=params.get('response_format')
+            )
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info("命中LLM响应缓存")
+                get_metrics().record(call_site, "cache", time.monotonic() - started)
+                return cached
+
+        sent = []
+
+        def send() -> Dict:
+            sent.append(True)
+            stats = {}
+            result = None
+            try:
+                result = self._post_with_retry(url, headers, data, timeout, stats, cancel_token)
+            finally:
+                get_metrics().record(
+                    call_site,
+                    stats.get('status', 'error'),
+                    time.monotonic() - started,
+                    ttfb=stats.get('ttfb'),
+                    retries=stats.get('retries', 0),
+                    usage=(result or {}).get('usage')
+                )
+            # 回放服务器的响应不缓存，否则之后的回放不再经过注入的延迟和错误
+            if cache_key is not None and not stats.get('replayed'):
+                self.cache.set(cache_key, result)
+            if self.recorder is not None:
+                self.recorder.record(data, result)
+            return result
+
+        # 相同的在途请求只发送一次；取消只影响取消的一方（见 llm_singleflight）
+        flight_key = hashlib.sha256(
+            json.dumps([url, data], ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        result = self.single_flight.do(flight_key, send, cancel_token)
+        if not sent:
+            get_metrics().record(call_site, "coalesced", time.monotonic() - started)
+        return result
+
+    def stream_chat_completion(
+        self,
+        messages: List[Dict],
+        on_delta: Optional[Callable[[str], None]] = None,
+        model: Optional[str] = None,
+        api_key: Optional[str] = None,
+        api_base: Optional[str] = None,
+        timeout: Optional[int] = None,
+        call_site: str = "unknown",
+        cancel_token: Optional[CancelToken] = None,
+        **params
+    ) -> Iterator[str]:
+        """
+        以 stream=true 调用 chat/completions 接口，逐段返回生成的文本
+
+        只在收到首个数据之前重试；流开始后出现的错误直接抛出，避免重复输出。
+
+        Args:
+            messages: 对话消息列表
+            on_delta: 每收到一段文本时的回调
+            model: 模型名称，默认使用配置中的模型
+            api_key: API密钥，默认使用配置中的密钥
+            api_base: API基础地址，默认使用配置中的地址
+            timeout: 连接及两次数据之间的超时时间（秒）
+            call_site: 调用点名称，用于遥测统计
+            cancel_token: 取消标记，取消时停止接收并抛出 LLMCancelledError
+            **params: 其他请求参数，如 temperature、max_tokens
+
+        Yields:
+            模型增量生成的文本片段
+        """
+        url, headers = self._endpoint(api_key, api_base)
+        timeout = timeout or self.timeout
+        headers['Accept'] = 'text/event-stream'
+        data = {
+            'model': model or self.model,
+            'messages': messages,
+            **params,
+            'stream': True
+        }
+
+        started = time.monotonic()
+        stats = {}
+        try:
+            response = self._send_with_retry(
+                url, headers, data, timeout, stats, stream=True, cancel_token=cancel_token
+            )
+        except (LLMTransportError, LLMCancelledError):
+            get_metrics().record(
+                call_site, stats.get('status', 'error'), time.monotonic() - started,
+                retries=stats.get('retries', 0)
+            )
+            raise
+
+        # 流式调用的首字节时间按收到第一段文本计算
+        first_delta_at = None
+        chunks = []
+        completed = False
+        # 按流的实际结果记录状态：读到 [DONE] 时为HTTP状态码，否则为中断原因
+        outcome = 'stream_error'
+        try:
+            for raw_line in response.iter_lines():
+                if cancel_token is not None and cancel_token.cancelled:
+                    outcome = 'cancelled'
+                    raise LLMCancelledError("调用已取消")
+                # SSE 按 UTF-8 解码，不依赖响应头中的字符集
+                line = raw_line.decode('utf-8').strip()
+                if not line.startswith('data:'):
+                    continue
+                payload = line[len('data:'):].strip()
+                if payload == '[DONE]':
+                    completed = True
+                    break
+                chunk = json.loads(payload)
+                choices = chunk.get('choices') or [{}]
+                delta = (choices[0].get('delta') or {}).get('content')
+                if delta:
+                    if first_delta_at is None:
+                        first_delta_at = time.monotonic()
+                    chunks.append(delta)
+                    if on_delta is not None:
+                        on_delta(delta)
+                    yield delta
+            if completed:
+                outcome = stats.get('status', '200')
+                if self.recorder is not None:
+                    self.recorder.record_stream(data, chunks)
+            else:
+                # 服务端未发送 [DONE] 就关闭了连接
+                outcome = 'incomplete'
+        except GeneratorExit:
+            # 调用方提前停止迭代
+            outcome = 'abandoned'
+            raise
+        except requests.exceptions.RequestException as e:
+            raise LLMTransportError(f"流式响应中断: {str(e)}")
+        except ValueError as e:
+            raise LLMTransportError(f"解析流式响应失败: {str(e)}")
+        finally:
+            response.close()
+            get_metrics().record(
+                call_site,
+                outcome,
+                time.monotonic() - started,
+                ttfb=first_delta_at - started if first_delta_at is not None else None,
+                retries=stats.get('retries', 0)
+            )
+
+    def _endpoint(self, api_key: Optional[str], api_base: Optional[str]):
+        """返回 chat/completions 地址和请求头"""
+        api_key = api_key or self.api_key
+        if not api_key:
+            raise LLMTransportError("未设置API密钥，无法访问Deepseek API")
+
+        url = f"{(api_base or self.api_base).rstrip('/')}/chat/completions"
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {api_key}'
+        }
+        return url, headers
+
+    def _post_with_retry(
+        self,
+        url: str,
+        headers: Dict,
+        data: Dict,
+        timeout: int,
+        stats: Optional[Dict] = None,
+        cancel_token: Optional[CancelToken] = None
+    ) -> Dict:
+        """发送请求并解析JSON响应"""
+        response = self._send_with_retry(url, headers, data, timeout, stats, cancel_token=cancel_token)
+        try:
+            result = response.json()
+        except ValueError as e:
+            raise LLMTransportError(f"解析API响应失败: {str(e)}")
+
+        # 用实际token用量修正限流器中的预扣量
+        total_tokens = (result.get('usage') or {}).get('total_tokens')
+        if total_tokens is not None:
+            self.rate_limiter.record_usage(self._reserved_tokens(data), total_tokens)
+        return result
+
+    @staticmethod
+    def _reserved_tokens(data: Dict) -> int:
+        """预估一次请求消耗的token数（估算的输入token数加上最大输出token数）"""
+        return estimate_messages_tokens(data.get('messages', [])) + int(data.get('max_tokens') or 0)
+
+    def _send_with_retry(
+        self,
+        url: str,
+        headers: Dict,
+        data: Dict,
+        timeout: int,
+        stats: Optional[Dict] = None,
+        stream: bool = False,
+        cancel_token: Optional[CancelToken] = None
+    ) -> requests.Response:
+        """
+        发送请求，对超时、网络错误和可重试状态码按配置重试，返回状态码为200的响应
+
+        stats 不为None时写入遥测数据：status（最后一次的状态）、retries、ttfb，
+        以及响应是否来自回放服务器（replayed）。
+        cancel_token 取消时立即放弃在途请求、限流等待和重试退避，抛出 LLMCancelledError。
+        """
+        try:
+            return self._attempt_with_retry(url, headers, data, timeout, stats, stream, cancel_token)
+        except LLMCancelledError:
+            if stats is not None:
+                stats['status'] = 'cancelled'
+            raise
+
+    def _attempt_with_retry(
+        self,
+        url: str,
+        headers: Dict,
+        data: Dict,
+        timeout: int,
+        stats: Optional[Dict],
+        stream: bool,
+        cancel_token: Optional[CancelToken]
+    ) -> requests.Response:
+        stats = stats if stats is not None else {}
+        last_error = None
+        reserved_tokens = self._reserved_tokens(data)
+        for attempt in range(1, self.max_retries + 1):
+            retry_after = None
+            stats['retries'] = attempt - 1
+            self.rate_limiter.acquire(reserved_tokens, cancel_token)
+
+            def post() -> requests.Response:
+                return self.session.post(
+                    url, headers=headers, json=data, timeout=timeout, stream=stream
+                )
+
+            try:
+                response = post() if cancel_token is None else run_cancellable(post, cancel_token)
+                stats['status'] = str(response.status_code)
+                stats['ttfb'] = response.elapsed.total_seconds()
+                if response.status_code == 200:
+                    stats['replayed'] = REPLAY_HEADER in response.headers
+                    return response
+
+                last_error = LLMTransportError(
+                    f"API调用失败: {response.status_code} - {response.text}",
+                    status_code=response.status_code
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    logger.error(str(last_error))
+                    raise last_error
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            except requests.exceptions.Timeout:
+                stats['status'] = 'timeout'
+                last_error = LLMTransportError(f"API调用超时（已等待{timeout}秒）")
+            except requests.exceptions.RequestException as e:
+                stats['status'] = 'network_error'
+                last_error = LLMTransportError(f"网络请求错误: {str(e)}")
+
+            logger.warning(f"第{attempt}次调用失败（共{self.max_retries}次）: {last_error}")
+            if attempt < self.max_retries:
+                if retry_after is not None:
+                    # 服务端指定了等待时间，所有线程共同遵守
+                    self.rate_limiter.pause(retry_after)
+                elif last_error.status_code == 429:
+                    self.rate_limiter.pause(self.rate_limiter.backoff_delay(attempt))
+                elif cancel_token is not None:
+                    if cancel_token.wait(self.rate_limiter.backoff_delay(attempt)):
+                        raise LLMCancelledError("调用已取消")
+                else:
+                    time.sleep(self.rate_limiter.backoff_delay(attempt))
+
+        raise LLMTransportError(
+            f"达到最大重试次数({self.max_retries})。最后一次错误: {last_error}",
+            status_code=last_error.status_code if last_error else None
+        )
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+
+_shared_transports: Dict[str, LLMTransport] = {}
+_shared_lock = threading.Lock()
+
+
+def get_transport(config_file: Optional[str] = None) -> LLMTransport:
+    """
+    获取进程内共享的传输层实例，同一配置文件只创建一个连接池
+
+    Args:
+        config_file: 配置文件路径，如果为None则使用项目根目录下的config.ini
+
+    Returns:
+        共享的LLMTransport实例
+    """
+    key = os.path.abspath(config_file) if config_file else ''
+    with _shared_lock:
+        transport = _shared_transports.get(key)
+        if transport is None:
+            transport = LLMTransport.from_config(config_file)
+            _shared_transports[key] = transport
+        return transport
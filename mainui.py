@@ -374,6 +374,13 @@ class RequirementInputUI:
                     else:
                         messagebox.showerror("错误", "生成用户故事失败")
                 
+                elif action == 'append_story':
+                    # 流式生成中，追加显示新收到的文本
+                    if not self.result_text.get('1.0', 'end-1c'):
+                        self.progress_var.set("正在接收生成内容...")
+                    self.result_text.insert(tk.END, message.get('text', ''))
+                    self.result_text.see(tk.END)
+                
                 elif action == 'update_parse_result':
                     result = message.get('result')
                     if result:
@@ -443,10 +450,15 @@ class RequirementInputUI:
                 widget.configure(state='disabled')
         
         self.show_progress(True)
+        self.result_text.delete('1.0', tk.END)
           # 在新线程中生成故事
         def generate():
             try:
-                story = generate_user_story(domain, role, feature)
+                # 流式生成，收到的文本片段实时显示
+                story = generate_user_story(
+                    domain, role, feature,
+                    on_token=lambda token: self.message_queue.put({'action': 'append_story', 'text': token})
+                )
                 # 将结果放入消息队列
                 self.message_queue.put({'action': 'update_story', 'story': story})
             except Exception as e:
@@ -0,0 +1,148 @@
+"""
+spaCy解析结果磁盘缓存
+
+把 nlp.pipe 解析得到的 Doc 以 DocBin 格式持久化到磁盘，需求文本未变化时直接反序列化，不再运行NLP管道：
+- 以（模型名称, 模型版本, 启用的管道组件, spaCy版本, 文本）的哈希作为内容地址，模型或管道变化后自动失效
+- 总大小超过上限时按最近访问时间（LRU）淘汰（见 disk_lru）
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+from typing import Iterable, List, Optional
+
+from disk_lru import DiskLRUStore
+
+logger = logging.getLogger("NLPDocCache")
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class DocCache:
+    """基于文件的内容寻址 Doc 缓存"""
+
+    def __init__(self, cache_dir: str, max_bytes: int = 200 * 1024 * 1024):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.cache_dir = cache_dir
+        self.store = DiskLRUStore(cache_dir, '.spacy', max_bytes, name="NLP解析缓存")
+
+    @classmethod
+    def from_config(cls, config_file: Optional[str] = None) -> Optional["DocCache"]:
+        """
+        根据 config.ini 的 [nlp_doc_cache] 配置节创建缓存
+
+        Returns:
+            缓存实例；未启用缓存时返回None
+        """
+        from llm_transport import load_config_section
+
+        section = load_config_section('nlp_doc_cache', config_file)
+        if section.get('enabled', 'true').lower() not in ('true', 'yes', '1', 'on'):
+            return None
+
+        cache_dir = section.get('cache_dir', '.nlp_cache')
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(PROJECT_ROOT, cache_dir)
+
+        return cls(
+            cache_dir=cache_dir,
+            max_bytes=int(float(section.get('max_size_mb', 200)) * 1024 * 1024)
+        )
+
+    @staticmethod
+    def model_fingerprint(nlp) -> str:
+        """模型标识：名称、版本、启用的管道组件和spaCy版本"""
+        import spacy
+
+        meta = nlp.meta
+        return json.dumps(
+            [f"{meta.get('lang')}_{meta.get('name')}", meta.get('version'), nlp.pipe_names, spacy.__version__],
+            separators=(',', ':')
+        )
+
+    @staticmethod
+    def make_key(fingerprint: str, text: str) -> str:
+        """
+        计算文本解析结果的内容地址
+
+        Args:
+            fingerprint: model_fingerprint 的返回值
+            text: 待解析的文本
+
+        Returns:
+            SHA-256十六进制摘要
+        """
+        payload = json.dumps([fingerprint, text], ensure_ascii=False, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str, vocab):
+        """
+        读取缓存的 Doc，命中时刷新其访问时间
+
+        Args:
+            key: 内容地址
+            vocab: 反序列化使用的词表（nlp.vocab）
+
+        Returns:
+            Doc；未命中或条目损坏时返回None
+        """
+        from spacy.tokens import DocBin
+
+        data = self.store.read(key)
+        if data is None:
+            return None
+        try:
+            doc = next(DocBin().from_bytes(data).get_docs(vocab))
+        except Exception as e:
+            logger.warning(f"NLP解析缓存条目损坏，将重新解析: {e}")
+            self.store.remove(key)
+            return None
+
+        self.store.touch(key)
+        return doc
+
+    def set(self, key: str, doc):
+        """写入 Doc，必要时淘汰最久未访问的条目"""
+        from spacy.tokens import DocBin
+
+        data = DocBin(docs=[doc], store_user_data=True).to_bytes()
+        self.store.write(key, data)
+
+    def pipe(self, nlp, texts: Iterable[str], batch_size: int = 64, n_process: int = 1) -> List:
+        """
+        解析文本，已缓存的直接反序列化，只有未命中的文本送入 nlp.pipe
+
+        Args:
+            nlp: spaCy Language 对象
+            texts: 待解析的文本
+            batch_size: nlp.pipe 每批解析的文本数
+            n_process: nlp.pipe 的进程数，不超过未命中文本的批次数
+
+        Returns:
+            与 texts 顺序一致的 Doc 列表
+        """
+        texts = list(texts)
+        fingerprint = self.model_fingerprint(nlp)
+        keys = [self.make_key(fingerprint, text) for text in texts]
+        docs = [self.get(key, nlp.vocab) for key in keys]
+
+        missing = [i for i, doc in enumerate(docs) if doc is None]
+        if missing:
+            n_process = max(1, min(n_process, math.ceil(len(missing) / batch_size)))
+            parsed = nlp.pipe((texts[i] for i in missing), batch_size=batch_size, n_process=n_process)
+            for i, doc in zip(missing, parsed):
+                docs[i] = doc
+                self.set(keys[i], doc)
+        logger.info(f"解析 {len(texts)} 条文本，命中缓存 {len(texts) - len(missing)} 条")
+        return docs
+
+    def clear(self):
+        """清空缓存"""
+        self.store.clear()
@@ -0,0 +1,93 @@
+"""
+进程内共享的spaCy模型注册表
+
+spaCy模型加载需要数秒，各调用点（用户故事解析、基于spaCy的需求冲突检测器、NLP检测GUI）
+统一通过本模块获取模型：
+- 每个（模型名称, 排除的组件）组合在进程内只加载一次，首次使用时才加载
+- 调用方可排除用不到的管道组件（如只需要句子切分时排除 ner），加载更快、解析更快
+- 多线程同时请求同一组合时只加载一次
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Iterable, Tuple
+
+logger = logging.getLogger("NLPModels")
+
+DEFAULT_MODEL = "zh_core_web_sm"
+
+# 只需要句子切分时可以排除的组件（zh_core_web_sm 的句子边界来自 parser）
+SENTENCE_ONLY_EXCLUDE = ("tagger", "attribute_ruler", "ner")
+
+
+def _spacy_load(model: str, exclude: Tuple[str, ...]):
+    # 延迟导入：导入spacy本身也需要一秒左右
+    import spacy
+
+    return spacy.load(model, exclude=list(exclude))
+
+
+class ModelRegistry:
+    """按（模型名称, 排除的组件）缓存已加载的模型"""
+
+    def __init__(self, loader: Callable[[str, Tuple[str, ...]], object] = _spacy_load):
+        """
+        Args:
+            loader: 加载函数，参数为模型名称和排除的组件，默认使用 spacy.load
+        """
+        self.loader = loader
+        self._models: Dict[Tuple[str, FrozenSet[str]], object] = {}
+        self._locks: Dict[Tuple[str, FrozenSet[str]], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str = DEFAULT_MODEL, exclude: Iterable[str] = ()):
+        """
+        获取模型，首次请求时加载
+
+        Args:
+            model: spaCy模型名称
+            exclude: 不需要的管道组件名称
+
+        Returns:
+            spaCy Language 对象，同一组合在进程内共享
+        """
+        key = (model, frozenset(exclude))
+        nlp = self._models.get(key)
+        if nlp is not None:
+            return nlp
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+        # 按组合加锁，加载不同模型时互不阻塞
+        with key_lock:
+            nlp = self._models.get(key)
+            if nlp is None:
+                started = time.monotonic()
+                nlp = self.loader(model, tuple(sorted(key[1])))
+                self._models[key] = nlp
+                excluded = f"，排除组件: {', '.join(sorted(key[1]))}" if key[1] else ""
+                logger.info(f"已加载spaCy模型 {model}{excluded}，耗时 {time.monotonic() - started:.1f} 秒")
+        return nlp
+
+    def clear(self):
+        """释放所有已加载的模型"""
+        with self._lock:
+            self._models.clear()
+            self._locks.clear()
+
+
+_registry = ModelRegistry()
+
+
+def get_nlp(model: str = DEFAULT_MODEL, exclude: Iterable[str] = ()):
+    """
+    获取进程内共享的spaCy模型
+
+    Args:
+        model: spaCy模型名称
+        exclude: 不需要的管道组件名称
+
+    Returns:
+        spaCy Language 对象
+    """
+    return _registry.get(model, exclude)
@@ -0,0 +1,143 @@
+"""
+功能重叠倒排索引
+
+基于spaCy的需求冲突检测器通过“共享名词”发现功能重叠。逐个名词枚举需求对时，
+“系统”“用户”这类几乎每条需求都有的名词会产生 O(n²) 个冲突，内存和报告都随需求数爆炸。
+本模块改用倒排索引（名词 -> 包含它的需求）：
+- 名词权重采用IDF，出现在所有需求中的名词权重为0，常见名词被降权
+- 出现在过多需求中的名词不参与配对（全局上限，可按名词单独配置）
+- 各名词的贡献累加到稀疏的共现矩阵中，每对需求只产出一次，分数为共享名词的权重之和
+"""
+import logging
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger("NLPOverlapIndex")
+
+
+def parse_fanout_caps(value: str) -> Dict[str, int]:
+    """
+    解析按名词配置的扇出上限
+
+    Args:
+        value: 形如 "系统:0, 用户:10" 的字符串，0表示该名词不参与配对
+
+    Returns:
+        {名词: 上限}
+
+    Raises:
+        ValueError: 格式不正确
+    """
+    caps = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        term, sep, cap = item.rpartition(':')
+        if not sep or not term.strip():
+            raise ValueError(f"扇出上限配置格式错误: {item}，应为 名词:上限")
+        caps[term.strip()] = int(cap)
+    return caps
+
+
+class FunctionalOverlapIndex:
+    """按共享名词为需求对打分的倒排索引"""
+
+    def __init__(
+        self,
+        max_fanout: int = 50,
+        fanout_caps: Optional[Dict[str, int]] = None,
+        min_score: float = 0.0
+    ):
+        """
+        Args:
+            max_fanout: 名词出现在超过该数量的需求中时不参与配对（0表示不限制）
+            fanout_caps: 按名词单独设置的扇出上限，优先于 max_fanout，0表示该名词不参与配对
+            min_score: 产出需求对的最低分数（分数为共享名词IDF权重之和，始终大于0）
+        """
+        self.max_fanout = max_fanout
+        self.fanout_caps = fanout_caps or {}
+        self.min_score = min_score
+
+    @classmethod
+    def from_config(cls, config_file: Optional[str] = None) -> "FunctionalOverlapIndex":
+        """根据 config.ini 的 [functional_overlap] 配置节创建索引"""
+        from llm_transport import load_config_section
+
+        section = load_config_section('functional_overlap', config_file)
+        return cls(
+            max_fanout=int(section.get('max_fanout', 50)),
+            fanout_caps=parse_fanout_caps(section.get('fanout_caps', '')),
+            min_score=float(section.get('min_score', 0.0))
+        )
+
+    def fanout_cap(self, term: str) -> Optional[int]:
+        """名词的扇出上限，None表示不限制"""
+        if term in self.fanout_caps:
+            return self.fanout_caps[term]
+        return self.max_fanout if self.max_fanout > 0 else None
+
+    def overlapping_pairs(self, documents: Sequence[Tuple[str, Iterable[str]]]) -> List[Dict]:
+        """
+        找出共享名词的需求对
+
+        Args:
+            documents: （需求ID, 需求中的名词）列表
+
+        Returns:
+            需求对列表，按需求在 documents 中的顺序排列，每项包含：
+            req_id1、req_id2、score（共享名词权重之和）、
+            resources（共享名词，按权重从高到低，权重相同时按在 req_id1 中首次出现的顺序）
+        """
+        total = len(documents)
+        postings: Dict[str, List[int]] = defaultdict(list)
+        # 每条需求中各名词首次出现的位置，用于同权重共享名词的排序
+        first_positions: List[Dict[str, int]] = []
+        for index, (_, terms) in enumerate(documents):
+            positions: Dict[str, int] = {}
+            for position, term in enumerate(terms):
+                positions.setdefault(term, position)
+            first_positions.append(positions)
+            for term in positions:
+                postings[term].append(index)
+
+        # 稀疏共现矩阵：只记录至少共享一个名词的需求对
+        scores: Dict[Tuple[int, int], float] = defaultdict(float)
+        shared: Dict[Tuple[int, int], List[Tuple[float, str]]] = defaultdict(list)
+        capped = 0
+        for term, indices in postings.items():
+            df = len(indices)
+            if df < 2:
+                continue
+            cap = self.fanout_cap(term)
+            if cap is not None and df > cap:
+                capped += 1
+                continue
+            weight = math.log((total + 1) / (df + 1))
+            if weight <= 0:
+                continue
+            for a in range(df):
+                i = indices[a]
+                for b in range(a + 1, df):
+                    key = (i, indices[b])
+                    scores[key] += weight
+                    shared[key].append((weight, term))
+
+        pairs = []
+        for (i, j), score in sorted(scores.items()):
+            if score < self.min_score:
+                continue
+            positions = first_positions[i]
+            resources = sorted(shared[(i, j)], key=lambda item: (-item[0], positions[item[1]]))
+            pairs.append({
+                "req_id1": documents[i][0],
+                "req_id2": documents[j][0],
+                "score": round(score, 3),
+                "resources": [term for _, term in resources]
+            })
+
+        if capped:
+            logger.info(f"{capped} 个名词出现的需求数超过扇出上限，未参与功能重叠配对")
+        logger.info(f"{total} 条功能需求中发现 {len(pairs)} 对功能重叠候选")
+        return pairs
@@ -0,0 +1,98 @@
+"""
+术语包含关系索引
+
+术语一致性检查需要找出术语表中所有“一个术语是另一个术语子串”的术语对。
+两两比较需要 O(T²) 次子串查找，术语上千时耗时数分钟；本模块改用Aho-Corasick自动机：
+以全部术语构建自动机，再用每个术语的文本扫描一遍，耗时与术语总长度加匹配数成正比。
+"""
+from collections import deque
+from typing import Dict, Iterator, List, Sequence, Set, Tuple
+
+
+class AhoCorasick:
+    """多模式子串匹配自动机"""
+
+    def __init__(self, patterns: Sequence[str]):
+        """
+        Args:
+            patterns: 模式串列表，匹配结果以其下标表示；空串不参与匹配
+        """
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # 以该状态结尾的模式下标，以及沿失败链最近的、有输出的状态
+        self.output: List[List[int]] = [[]]
+        self.dict_link: List[int] = [0]
+
+        for index, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.dict_link.append(0)
+                state = next_state
+            self.output[state].append(index)
+
+        # 按广度优先顺序计算失败链接
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.dict_link[next_state] = target if self.output[target] else self.dict_link[target]
+                queue.append(next_state)
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        扫描文本，逐个返回匹配
+
+        Yields:
+            （匹配结束位置, 模式下标）
+        """
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            match_state = state if self.output[state] else self.dict_link[state]
+            while match_state:
+                for index in self.output[match_state]:
+                    yield position, index
+                match_state = self.dict_link[match_state]
+
+    def matched_patterns(self, text: str) -> Set[int]:
+        """文本中出现过的模式下标"""
+        return {index for _, index in self.iter_matches(text)}
+
+
+def find_containment_pairs(terms: Sequence[str]) -> List[Tuple[int, int]]:
+    """
+    找出所有存在包含关系的术语对
+
+    与 `terms[i] in terms[j] or terms[j] in terms[i]`（且两者不相等）的两两比较结果相同。
+
+    Args:
+        terms: 术语列表
+
+    Returns:
+        (i, j) 下标对列表，i < j，按 (i, j) 排序
+    """
+    automaton = AhoCorasick(terms)
+    empty = [i for i, term in enumerate(terms) if not term]
+    pairs = set()
+    for j, term in enumerate(terms):
+        # 空串是任何串的子串
+        for i in automaton.matched_patterns(term).union(empty):
+            if terms[i] != term:
+                pairs.add((min(i, j), max(i, j)))
+    return sorted(pairs)
@@ -1,13 +1,11 @@
 # 安装依赖：pip install spacy requests
-import spacy
 from datetime import datetime, timedelta
-import requests
 import json
 import configparser
 import os
 from apispec_generator import APISpecGenerator
-
-nlp = spacy.load("zh_core_web_sm")
+from llm_transport import LLMTransportError, get_transport
+from nlp_models import SENTENCE_ONLY_EXCLUDE, get_nlp
 
 def get_api_key():
     """
@@ -30,19 +28,36 @@ def get_api_key():
     except KeyError:
         raise KeyError("配置文件中缺少 deepseek 部分或 api_key 配置项")
 
-def generate_user_story(domain, role, feature):
+def _request_completion(messages, api_key, on_token=None, **params):
+    """
+    调用 DeepSeek API 并返回完整文本
+    :param messages: 对话消息列表
+    :param api_key: API 密钥
+    :param on_token: 流式回调，提供时以流式方式请求，每收到一段文本即回调一次
+    :param params: 其他请求参数，如 temperature、max_tokens
+    :return: 模型返回的完整文本
+    """
+    transport = get_transport()
+    if on_token is None:
+        result = transport.chat_completion(messages, api_key=api_key, **params)
+        return result['choices'][0]['message']['content']
+    
+    return "".join(transport.stream_chat_completion(
+        messages, on_delta=on_token, api_key=api_key, **params
+    ))
+
+def generate_user_story(domain, role, feature, on_token=None):
     """
     使用 DeepSeek API 生成用户故事
     :param domain: 业务领域
     :param role: 用户角色
     :param feature: 要实现的功能特性
+    :param on_token: 可选的流式回调，每收到一段生成文本即调用一次
     :return: 生成的用户故事文本
     """
     # 从配置文件获取 API 密钥
     API_KEY = get_api_key()
     
-    API_URL = "https://api.deepseek.com/v1/chat/completions"
-    
     # 构造提示文本
     prompt = f"""请用中文编写一个用户故事，描述以下需求：
 领域：{domain}
@@ -62,40 +77,32 @@ def generate_user_story(domain, role, feature):
 请确保内容完整、清晰、具体。
 """
     
-    # 准备请求数据
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-    
-    data = {
-        "model": "deepseek-chat",
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "temperature": 0.7,
-        "max_tokens": 800
-    }
+    messages = [
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
     
     try:
-        # 发送请求
-        response = requests.post(API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        # 解析响应
-        result = response.json()
-        generated_story = result['choices'][0]['message']['content'].strip()
+        # 通过共享传输层发送请求
+        generated_story = _request_completion(
+            messages,
+            API_KEY,
+            on_token=on_token,
+            call_site="story_generate",
+            temperature=0.7,
+            max_tokens=800
+        ).strip()
         return generated_story
         
-    except requests.exceptions.RequestException as e:
+    except LLMTransportError as e:
         print(f"API 调用出错: {str(e)}")
         return None
 
 def parse_user_story(story):
-    doc = nlp(story)
+    # 只用到句子切分，首次调用时加载不含词性标注和实体识别的模型
+    doc = get_nlp("zh_core_web_sm", SENTENCE_ONLY_EXCLUDE)(story)
     
     # 提取角色（只获取"作为"之后到逗号或句号之前的内容）
     role = ""
@@ -132,7 +139,7 @@ def parse_user_story(story):
         "timestamp": datetime.now().isoformat()
     }
 
-def split_user_story(story, domain, role, count=3):
+def split_user_story(story, domain, role, count=3, on_token=None):
     """
     将一个大的用户故事拆分成多个小的、更具体的用户故事
     
@@ -141,6 +148,7 @@ def split_user_story(story, domain, role, count=3):
         domain (str): 业务领域
         role (str): 用户角色
         count (int): 期望拆分的故事数量，默认3
+        on_token (callable): 可选的流式回调，每收到一段生成文本即调用一次
         
     返回：
         list: 拆分后的用户故事列表
@@ -148,8 +156,6 @@ def split_user_story(story, domain, role, count=3):
     # 从配置文件获取 API 密钥
     API_KEY = get_api_key()
     
-    API_URL = "https://api.deepseek.com/v1/chat/completions"
-    
     # 构造提示文本
     prompt = f"""请将以下用户故事拆分成{count}个更小的、更具体的用户故事，每个故事聚焦于一个明确的功能点：
 
@@ -188,32 +194,23 @@ def split_user_story(story, domain, role, count=3):
 ...以此类推，确保输出正好{count}个用户故事
 """
     
-    # 准备请求数据
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-    
-    data = {
-        "model": "deepseek-chat",
-        "messages": [
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "temperature": 0.7,
-        "max_tokens": 1500
-    }
+    messages = [
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
     
     try:
-        # 发送请求
-        response = requests.post(API_URL, headers=headers, json=data)
-        response.raise_for_status()
-        
-        # 解析响应
-        result = response.json()
-        generated_text = result['choices'][0]['message']['content'].strip()
+        # 通过共享传输层发送请求
+        generated_text = _request_completion(
+            messages,
+            API_KEY,
+            on_token=on_token,
+            call_site="story_split",
+            temperature=0.7,
+            max_tokens=1500
+        ).strip()
         
         # 拆分多个故事
         stories = []
@@ -226,7 +223,7 @@ def split_user_story(story, domain, role, count=3):
                 
         return stories
         
-    except requests.exceptions.RequestException as e:
+    except LLMTransportError as e:
         print(f"API 调用出错: {str(e)}")
         return None
 
@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, List, Optional
 import configparser
 import os
 from llm_interface import LLMInterface
@@ -50,18 +50,19 @@ class PRDChecker:
             {'id': 19, 'title': '交互/视觉文档', 'description': '描述交互和视觉文档', 'weight': 1.0}
         ]
     
-    def check_prd(self, prd_content: str) -> Dict:
+    def check_prd(self, prd_content: str, use_cache: Optional[bool] = None) -> Dict:
         """
         检查PRD文档内容
         
         Args:
             prd_content: PRD文档内容
+            use_cache: 是否使用响应缓存，None时由缓存配置决定
             
         Returns:
             包含检查结果的字典
         """
         # 调用LLM进行分析
-        result = self.llm.analyze_prd(prd_content, self.standards)
+        result = self.llm.analyze_prd(prd_content, self.standards, use_cache=use_cache)
         
         # 计算总分
         score = self._calculate_score(result)
@@ -203,8 +203,11 @@ class SplitStoryDialog:
                     domain = self.parent.domain_entry.get().strip()
                     role = self.parent.role_entry.get().strip()
                 
-                # 调用拆分函数
-                stories = split_user_story(self.story, domain, role, count)
+                # 调用拆分函数，流式生成的文本实时显示在详情框中
+                stories = split_user_story(
+                    self.story, domain, role, count,
+                    on_token=lambda token: self.dialog.after(0, lambda: self._append_stream_text(token))
+                )
                 
                 if stories and len(stories) > 0:
                     self.split_stories = stories
@@ -222,6 +225,13 @@ class SplitStoryDialog:
         
         threading.Thread(target=split, daemon=True).start()
     
+    def _append_stream_text(self, token):
+        """追加显示流式生成的拆分文本"""
+        if not self.detail_text.get('1.0', 'end-1c'):
+            self.progress_var.set("正在接收生成内容...")
+        self.detail_text.insert(tk.END, token)
+        self.detail_text.see(tk.END)
+    
     def update_story_list(self, stories):
         """更新故事列表"""
         for i, story in enumerate(stories):
@@ -0,0 +1,64 @@
+"""
+测试磁盘LRU存储
+
+该模块测试disk_lru.py中的DiskLRUStore：
+1. 读写、覆盖写入与删除时总大小的统计
+2. 重新打开目录时按已有文件恢复总大小
+3. 超出上限时按访问时间淘汰，touch 刷新访问时间
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from disk_lru import DiskLRUStore
+
+
+class TestDiskLRUStore(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir, ignore_errors=True)
+
+    def test_read_write_and_size_accounting(self):
+        store = DiskLRUStore(self.root_dir, ".bin", max_bytes=1000)
+        self.assertIsNone(store.read("ab01"))
+
+        store.write("ab01", b"x" * 10)
+        store.write("cd02", b"y" * 20)
+        self.assertEqual(store.read("ab01"), b"x" * 10)
+        self.assertTrue(store.path("ab01").startswith(os.path.join(self.root_dir, "ab")))
+        self.assertEqual(store.total_bytes, 30)
+
+        store.write("ab01", b"z" * 5)
+        self.assertEqual(store.total_bytes, 25)
+        store.remove("cd02")
+        self.assertEqual(store.total_bytes, 5)
+        self.assertEqual(DiskLRUStore(self.root_dir, ".bin", max_bytes=1000).total_bytes, 5)
+
+        store.clear()
+        self.assertEqual(store.total_bytes, 0)
+        self.assertEqual(list(store.iter_entries()), [])
+
+    def test_evicts_least_recently_used(self):
+        store = DiskLRUStore(self.root_dir, ".bin", max_bytes=25)
+        store.write("aa", b"a" * 10)
+        store.write("bb", b"b" * 10)
+        old = time.time() - 100
+        os.utime(store.path("aa"), (old, old))
+        os.utime(store.path("bb"), (old - 10, old - 10))
+        # 访问bb后，aa成为最久未访问的条目
+        store.touch("bb")
+
+        store.write("cc", b"c" * 10)
+        self.assertIsNone(store.read("aa"))
+        self.assertEqual(store.read("bb"), b"b" * 10)
+        self.assertEqual(store.read("cc"), b"c" * 10)
+        self.assertEqual(store.total_bytes, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
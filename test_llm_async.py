@@ -0,0 +1,80 @@
+"""
+测试DeepSeek API异步客户端
+
+该模块测试llm_async.py中的AsyncLLMClient（使用假的传输层代替网络请求）：
+1. 并发的 chat_completion 调用受信号量限制，同时在途的请求数不超过上限
+2. 单个请求失败时按请求顺序返回异常对象，不影响其他请求
+3. 多次 asyncio.run 之后不会累积已关闭事件循环的信号量
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from llm_async import AsyncLLMClient
+
+
+class _FakeTransport:
+    """记录同时在途调用数的传输层"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def chat_completion(self, messages, **params):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if params.get("fail"):
+                raise ValueError("模拟失败")
+            return {"content": messages[0]["content"]}
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def make_requests(count, **params):
+    return [{"messages": [{"role": "user", "content": str(i)}], **params} for i in range(count)]
+
+
+class TestAsyncLLMClient(unittest.TestCase):
+    def setUp(self):
+        self.transport = _FakeTransport()
+        self.client = AsyncLLMClient(transport=self.transport, max_concurrency=2)
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_concurrent_calls_bounded_by_semaphore(self):
+        async def run():
+            return await asyncio.gather(*[
+                self.client.chat_completion(request["messages"]) for request in make_requests(6)
+            ])
+
+        results = asyncio.run(run())
+        self.assertEqual([r["content"] for r in results], [str(i) for i in range(6)])
+        self.assertEqual(self.transport.calls, 6)
+        self.assertEqual(self.transport.max_active, 2)
+
+    def test_gather_returns_errors_in_order(self):
+        requests = make_requests(2) + make_requests(1, fail=True)
+        results = asyncio.run(self.client.gather(requests))
+        self.assertEqual(results[:2], [{"content": "0"}, {"content": "1"}])
+        self.assertIsInstance(results[2], ValueError)
+
+    def test_semaphores_of_closed_loops_are_released(self):
+        for _ in range(5):
+            asyncio.run(self.client.gather(make_requests(4)))
+        # 只保留最近一次运行的事件循环，下次创建信号量时清理
+        self.assertLessEqual(len(self.client._semaphores), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+测试LLM响应磁盘缓存模块
+
+该模块测试llm_cache.py中的缓存行为：
+1. 内容地址键计算
+2. 读写与TTL过期
+3. 按访问时间的LRU淘汰
+4. 温度阈值与绕过开关
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from llm_cache import LLMResponseCache
+
+
+class TestLLMResponseCache(unittest.TestCase):
+    def setUp(self):
+        """创建临时缓存目录"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.messages = [{"role": "user", "content": "检测需求冲突"}]
+        self.response = {"choices": [{"message": {"content": "[]"}}]}
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_make_key_is_content_addressed(self):
+        """相同请求得到相同键，任一参数变化得到不同键"""
+        key = LLMResponseCache.make_key("deepseek-chat", self.messages, 0.1, 4000)
+        self.assertEqual(key, LLMResponseCache.make_key("deepseek-chat", self.messages, 0.1, 4000))
+        self.assertNotEqual(key, LLMResponseCache.make_key("deepseek-chat", self.messages, 0.2, 4000))
+        self.assertNotEqual(key, LLMResponseCache.make_key("deepseek-chat", self.messages, 0.1, 2000))
+        self.assertNotEqual(key, LLMResponseCache.make_key(
+            "deepseek-chat", self.messages, 0.1, 4000, api_base="http://127.0.0.1:8765/v1"
+        ))
+        self.assertNotEqual(key, LLMResponseCache.make_key(
+            "deepseek-chat", self.messages, 0.1, 4000, response_format={"type": "json_object"}
+        ))
+
+    def test_get_and_set(self):
+        """写入后可以读取，未写入的键返回None"""
+        cache = LLMResponseCache(self.cache_dir)
+        key = LLMResponseCache.make_key("deepseek-chat", self.messages, 0.1, 4000)
+        self.assertIsNone(cache.get(key))
+        cache.set(key, self.response)
+        self.assertEqual(cache.get(key), self.response)
+
+    def test_ttl_expiry(self):
+        """超过TTL的条目视为未命中"""
+        cache = LLMResponseCache(self.cache_dir, ttl_seconds=0.05)
+        cache.set("a" * 64, self.response)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("a" * 64))
+
+    def test_lru_eviction(self):
+        """超出大小上限时淘汰最久未访问的条目"""
+        cache = LLMResponseCache(self.cache_dir)
+        cache.set("a" * 64, self.response)
+        entry_size = cache.store.total_bytes
+        # 留出余量：created_at 的小数位数不同会使条目大小相差几个字节
+        cache.store.max_bytes = entry_size * 2 + entry_size // 2
+
+        cache.set("b" * 64, self.response)
+        # 将a的访问时间设为较早，再访问b
+        old = time.time() - 100
+        os.utime(cache.store.path("a" * 64), (old, old))
+        cache.get("b" * 64)
+
+        cache.set("c" * 64, self.response)
+        self.assertIsNone(cache.get("a" * 64))
+        self.assertEqual(cache.get("b" * 64), self.response)
+        self.assertEqual(cache.get("c" * 64), self.response)
+
+    def test_should_cache(self):
+        """默认按温度阈值判断，显式开关优先"""
+        cache = LLMResponseCache(self.cache_dir, max_temperature=0.3)
+        self.assertTrue(cache.should_cache(0.1))
+        self.assertFalse(cache.should_cache(0.7))
+        self.assertFalse(cache.should_cache(None))
+        self.assertTrue(cache.should_cache(0.7, use_cache=True))
+        self.assertFalse(cache.should_cache(0.1, use_cache=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
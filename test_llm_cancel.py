@@ -0,0 +1,74 @@
+"""
+测试LLM调用取消模块
+
+该模块测试llm_cancel.py中的取消行为：
+1. 在途的阻塞调用被取消后立即返回
+2. 调用方放弃后迟到的响应被关闭
+3. 限流等待可被取消
+"""
+
+import threading
+import time
+import unittest
+
+from llm_cancel import CancelToken, LLMCancelledError, run_cancellable
+from llm_ratelimit import RateLimiter
+
+
+class _Response:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+class TestCancelToken(unittest.TestCase):
+    def test_completed_call_returns_result(self):
+        self.assertEqual(run_cancellable(lambda: 42, CancelToken()), 42)
+
+    def test_errors_propagate(self):
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            run_cancellable(fail, CancelToken())
+
+    def test_cancel_abandons_inflight_call(self):
+        """取消后立即返回，迟到的响应在后台关闭"""
+        token = CancelToken()
+        response = _Response()
+
+        def slow():
+            time.sleep(0.3)
+            return response
+
+        threading.Timer(0.05, token.cancel).start()
+        start = time.monotonic()
+        with self.assertRaises(LLMCancelledError):
+            run_cancellable(slow, token)
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertTrue(response.closed.wait(1))
+
+    def test_cancelled_token_rejects_new_calls(self):
+        token = CancelToken()
+        token.cancel()
+        called = []
+        with self.assertRaises(LLMCancelledError):
+            run_cancellable(lambda: called.append(True), token)
+        self.assertEqual(called, [])
+
+    def test_rate_limit_wait_is_cancellable(self):
+        """限流暂停期间取消，等待立即结束"""
+        limiter = RateLimiter()
+        limiter.pause(10)
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel).start()
+        start = time.monotonic()
+        with self.assertRaises(LLMCancelledError):
+            limiter.acquire(cancel_token=token)
+        self.assertLess(time.monotonic() - start, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
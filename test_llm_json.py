@@ -0,0 +1,87 @@
+"""
+测试LLM结构化输出模块
+
+该模块测试llm_json.py中的功能：
+1. 从带说明文字和代码块的文本中提取JSON
+2. 截断输出的识别
+3. schema校验
+4. 修复重试
+"""
+
+import unittest
+
+from llm_json import StructuredOutputError, extract_json, json_mode_params, request_structured, validate
+
+SCHEMA = {
+    'type': 'object',
+    'required': ['items'],
+    'properties': {
+        'items': {
+            'type': 'array',
+            'items': {'type': 'object', 'required': ['level'],
+                      'properties': {'level': {'type': 'string', 'enum': ['高', '中', '低']}}}
+        }
+    }
+}
+
+
+class TestExtractJson(unittest.TestCase):
+    def test_extracts_from_code_block_with_prose(self):
+        """忽略前后说明文字和Markdown代码块标记"""
+        text = '分析如下：\n```json\n{"items": [{"level": "高", "note": "含}和]的\\"字符串"}]}\n```\n以上。'
+        self.assertEqual(extract_json(text), {'items': [{'level': '高', 'note': '含}和]的"字符串'}]})
+
+    def test_skips_unparseable_bracketed_prose(self):
+        """跳过括号平衡但不是JSON的片段"""
+        self.assertEqual(extract_json('[注意] 结果为 [1, 2]'), [1, 2])
+        self.assertEqual(extract_json('(见[附录}) {"a": 1}'), {'a': 1})
+
+    def test_truncated_output(self):
+        """输出被截断时给出明确错误"""
+        with self.assertRaises(StructuredOutputError) as ctx:
+            extract_json('{"items": [{"level": "高"')
+        self.assertIn('截断', str(ctx.exception))
+
+    def test_no_json(self):
+        with self.assertRaises(StructuredOutputError):
+            extract_json('没有检测到冲突')
+
+
+class TestValidate(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(validate({'items': [{'level': '中'}]}, SCHEMA), [])
+
+    def test_reports_paths(self):
+        """错误信息包含出错位置"""
+        errors = validate({'items': [{'level': '严重'}, {}]}, SCHEMA)
+        self.assertEqual(len(errors), 2)
+        self.assertIn('$.items[0].level', errors[0])
+        self.assertIn('$.items[1]', errors[1])
+
+    def test_json_mode_only_for_objects(self):
+        self.assertIn('response_format', json_mode_params(SCHEMA))
+        self.assertEqual(json_mode_params({'type': 'array'}), {})
+
+
+class TestRequestStructured(unittest.TestCase):
+    def test_repair_retry(self):
+        """首次输出不合格时附带错误信息请求修复"""
+        replies = ['{"items": [{"level": "严重"}]}', '{"items": [{"level": "高"}]}']
+        conversations = []
+
+        def send(messages, extra_params):
+            conversations.append(messages)
+            return replies[len(conversations) - 1]
+
+        result = request_structured(send, [{'role': 'user', 'content': 'json'}], SCHEMA)
+        self.assertEqual(result, {'items': [{'level': '高'}]})
+        self.assertEqual(len(conversations[1]), 3)
+        self.assertIn('$.items[0].level', conversations[1][2]['content'])
+
+    def test_gives_up_after_repairs(self):
+        with self.assertRaises(StructuredOutputError):
+            request_structured(lambda m, p: '无法完成', [{'role': 'user', 'content': 'json'}], SCHEMA)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+测试LLM调用遥测模块
+
+该模块测试llm_metrics.py中的直方图与导出：
+1. 直方图的桶计数（边界值落入 le 等于该值的桶）、累计计数、总和与分位数
+2. 按调用点聚合状态、重试和token用量
+3. Prometheus文本格式的 _bucket/_sum/_count 序列及标签值转义
+"""
+
+import json
+import unittest
+
+from llm_metrics import LATENCY_BUCKETS, Histogram, LLMMetrics, escape_label
+
+
+class TestHistogram(unittest.TestCase):
+    def test_bucket_counts(self):
+        histogram = Histogram((1, 5, 10))
+        for value in (0.5, 1, 3, 10, 50):
+            histogram.observe(value)
+        # 最后一个桶为 +Inf
+        self.assertEqual(histogram.counts, [2, 1, 1, 1])
+        self.assertEqual(histogram._cumulative(), [2, 3, 4])
+        self.assertEqual(histogram.count, 5)
+        self.assertAlmostEqual(histogram.sum, 64.5)
+
+        buckets = histogram.to_dict()["buckets"]
+        self.assertEqual(buckets, {"1": 2, "5": 3, "10": 4, "+Inf": 5})
+
+    def test_quantile(self):
+        histogram = Histogram((1, 2))
+        self.assertIsNone(histogram.quantile(0.5))
+        for value in (0.5, 0.5, 1.5, 1.5):
+            histogram.observe(value)
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.0)
+        self.assertAlmostEqual(histogram.quantile(1.0), 2.0)
+
+
+class TestLLMMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = LLMMetrics()
+        self.metrics.record("prd_check", "200", 0.3, ttfb=0.1, retries=1,
+                            usage={"prompt_tokens": 300, "completion_tokens": 50})
+        self.metrics.record("prd_check", "200", 2.0, ttfb=0.5)
+        self.metrics.record("prd_check", "timeout", 60.0, retries=2)
+
+    def test_snapshot_aggregates_per_call_site(self):
+        site = self.metrics.snapshot()["prd_check"]
+        self.assertEqual(site["requests"], {"200": 2, "timeout": 1})
+        self.assertEqual(site["retries"], 3)
+        self.assertEqual(site["wall_time_seconds"]["count"], 3)
+        self.assertEqual(site["ttfb_seconds"]["count"], 2)
+        self.assertEqual(site["prompt_tokens"]["buckets"]["500"], 1)
+        self.assertEqual(site["completion_tokens"]["sum"], 50)
+        json.loads(self.metrics.to_json())
+
+    def test_prometheus_histogram_series(self):
+        lines = self.metrics.to_prometheus().splitlines()
+        self.assertIn('llm_requests_total{call_site="prd_check",status="200"} 2', lines)
+        self.assertIn('llm_retries_total{call_site="prd_check"} 3', lines)
+
+        prefix = 'llm_request_duration_seconds'
+        buckets = [line for line in lines if line.startswith(f'{prefix}_bucket{{call_site="prd_check"')]
+        self.assertEqual(len(buckets), len(LATENCY_BUCKETS) + 1)
+        self.assertIn(f'{prefix}_bucket{{call_site="prd_check",le="0.5"}} 1', lines)
+        self.assertIn(f'{prefix}_bucket{{call_site="prd_check",le="2.5"}} 2', lines)
+        self.assertIn(f'{prefix}_bucket{{call_site="prd_check",le="60"}} 3', lines)
+        self.assertIn(f'{prefix}_bucket{{call_site="prd_check",le="+Inf"}} 3', lines)
+        self.assertIn(f'{prefix}_sum{{call_site="prd_check"}} 62.3', lines)
+        self.assertIn(f'{prefix}_count{{call_site="prd_check"}} 3', lines)
+
+        # 累计计数单调不减
+        counts = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))
+
+    def test_prometheus_label_escaping(self):
+        self.assertEqual(escape_label('a\\b"c\nd'), 'a\\\\b\\"c\\nd')
+
+        metrics = LLMMetrics()
+        metrics.record('site "x"\nline\\2', 'err"', 1.0)
+        output = metrics.to_prometheus()
+        self.assertIn(
+            'llm_requests_total{call_site="site \\"x\\"\\nline\\\\2",status="err\\""} 1',
+            output.splitlines()
+        )
+        self.assertIn('llm_request_duration_seconds_count{call_site="site \\"x\\"\\nline\\\\2"} 1', output)
+
+
+if __name__ == '__main__':
+    unittest.main()
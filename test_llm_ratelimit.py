@@ -0,0 +1,100 @@
+"""
+测试LLM调用限流模块
+
+该模块测试llm_ratelimit.py中的限流行为：
+1. 请求数令牌桶阻塞
+2. Retry-After 全局暂停，暂停结束后等待者错开恢复
+3. 带抖动的指数退避
+4. Retry-After 响应头解析
+5. 未配置 backoff_base 时使用 [deepseek] retry_delay
+"""
+
+import threading
+import time
+import unittest
+
+from llm_ratelimit import RateLimiter, parse_retry_after
+from llm_transport import load_transport_config
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_unlimited_budget_does_not_block(self):
+        """预算为0时不限制"""
+        limiter = RateLimiter()
+        start = time.monotonic()
+        for _ in range(100):
+            limiter.acquire(10000)
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_request_budget_blocks_when_exhausted(self):
+        """请求预算耗尽后需要等待补充"""
+        limiter = RateLimiter(requests_per_minute=600)  # 每0.1秒补充1个
+        limiter.request_bucket.tokens = 1
+        limiter.acquire()
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.08)
+
+    def test_pause_blocks_all_callers(self):
+        """服务端要求暂停时，后续请求等待到暂停结束"""
+        limiter = RateLimiter()
+        limiter.pause(0.1)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_waiters_resume_staggered_after_pause(self):
+        """暂停期间排队的请求在暂停结束后的 seconds/2 内错开恢复，而不是同时发送"""
+        limiter = RateLimiter(requests_per_minute=600)
+        limiter.pause(0.4)
+        start = time.monotonic()
+        resumed = []
+        lock = threading.Lock()
+
+        def call():
+            limiter.acquire()
+            with lock:
+                resumed.append(time.monotonic() - start)
+
+        threads = [threading.Thread(target=call) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+
+        self.assertEqual(len(resumed), 8)
+        self.assertGreaterEqual(min(resumed), 0.39)
+        self.assertLess(max(resumed), 0.7)
+        self.assertGreater(max(resumed) - min(resumed), 0.05)
+
+    def test_backoff_is_exponential_with_jitter(self):
+        """退避时间在 [d/2, d] 区间内，且不超过上限"""
+        limiter = RateLimiter(backoff_base=1, backoff_max=8)
+        for attempt, full in [(1, 1), (2, 2), (3, 4), (4, 8), (6, 8)]:
+            delay = limiter.backoff_delay(attempt)
+            self.assertGreaterEqual(delay, full / 2)
+            self.assertLessEqual(delay, full)
+
+    def test_record_usage_refunds_over_reservation(self):
+        """实际用量小于预扣量时返还差额"""
+        limiter = RateLimiter(tokens_per_minute=1000)
+        limiter.acquire(800)
+        limiter.record_usage(800, 300)
+        self.assertAlmostEqual(limiter.token_bucket.tokens, 700, delta=5)
+
+    def test_backoff_base_falls_back_to_retry_delay(self):
+        """项目配置未设置 backoff_base 时，退避基准取 [deepseek] retry_delay"""
+        retry_delay = load_transport_config()['retry_delay']
+        limiter = RateLimiter.from_config(backoff_base=retry_delay)
+        self.assertEqual(limiter.backoff_base, retry_delay)
+
+    def test_parse_retry_after(self):
+        """支持秒数和HTTP日期两种格式"""
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
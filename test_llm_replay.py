@@ -0,0 +1,163 @@
+"""
+测试LLM调用录制/回放工具
+
+该模块测试llm_replay.py与共享传输层配合的行为（在本机随机端口启动回放服务器）：
+1. 录制→回放往返：录制的夹具可由新的回放服务器应答，流式与非流式请求共用夹具
+2. 延迟与错误注入（含 Retry-After）
+3. 没有匹配夹具时返回404，传输层不重试
+4. 开启LLM响应缓存时，回放请求仍然经过服务器，不被缓存应答
+5. 录制时即使缓存中已有响应，也会请求服务器并写入夹具
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import requests
+
+from llm_cache import LLMResponseCache
+from llm_replay import FixtureRecorder, ReplayServer, fixture_key, load_fixtures
+from llm_transport import DEFAULT_API_BASE, DEFAULT_MODEL, LLMTransport, LLMTransportError
+
+
+MESSAGES = [{"role": "user", "content": "检测需求冲突"}]
+REQUEST = {"model": DEFAULT_MODEL, "messages": MESSAGES, "temperature": 0.1}
+# 长于回放服务器流式分段的长度，流式回放时分多段返回
+CONTENT = "回放的响应：两个需求对库存扣减时机的要求不一致"
+RESPONSE = {
+    "object": "chat.completion",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": CONTENT}}]
+}
+
+
+class ReplayTestCase(unittest.TestCase):
+    """在随机端口启动回放服务器的测试基类"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = ReplayServer({fixture_key(REQUEST): RESPONSE}, port=0, seed=0)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        self.api_base = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def make_transport(self, **kwargs):
+        transport = LLMTransport(
+            api_key="test-key", api_base=self.api_base, max_retries=1, retry_delay=0, **kwargs
+        )
+        self.addCleanup(transport.close)
+        return transport
+
+
+class TestReplayServer(ReplayTestCase):
+    def test_record_replay_round_trip(self):
+        fixtures_dir = os.path.join(self.tmpdir, "fixtures")
+        recording = self.make_transport(recorder=FixtureRecorder(fixtures_dir))
+        self.assertEqual(recording.chat_completion(MESSAGES, temperature=0.1), RESPONSE)
+
+        # 用录制的夹具启动新的回放服务器
+        replay = ReplayServer(load_fixtures(fixtures_dir), port=0)
+        threading.Thread(target=replay.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(replay.server_close)
+        self.addCleanup(replay.shutdown)
+        transport = LLMTransport(
+            api_key="test-key", api_base=f"http://127.0.0.1:{replay.server_address[1]}/v1", retry_delay=0
+        )
+        self.addCleanup(transport.close)
+
+        self.assertEqual(transport.chat_completion(MESSAGES, temperature=0.1), RESPONSE)
+        # 同一请求以流式发送时使用同一个夹具，按段返回
+        deltas = list(transport.stream_chat_completion(MESSAGES, temperature=0.1))
+        self.assertGreater(len(deltas), 1)
+        self.assertEqual("".join(deltas), CONTENT)
+        self.assertEqual(replay.request_count, 2)
+
+    def test_stream_is_recorded_as_complete_response(self):
+        fixtures_dir = os.path.join(self.tmpdir, "fixtures")
+        transport = self.make_transport(recorder=FixtureRecorder(fixtures_dir))
+        self.assertEqual("".join(transport.stream_chat_completion(MESSAGES, temperature=0.1)), CONTENT)
+        recorded = load_fixtures(fixtures_dir)[fixture_key(REQUEST)]
+        self.assertEqual(recorded["choices"][0]["message"]["content"], CONTENT)
+
+    def test_latency_injection(self):
+        self.server.latency = 0.2
+        transport = self.make_transport()
+        started = time.monotonic()
+        transport.chat_completion(MESSAGES, temperature=0.1)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_error_injection(self):
+        self.server.error_rate = 1.0
+        self.server.error_status = 429
+        self.server.retry_after = 3
+        response = requests.post(f"{self.api_base}/chat/completions", json=REQUEST, timeout=5)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "3")
+
+        with self.assertRaises(LLMTransportError) as ctx:
+            self.make_transport().chat_completion(MESSAGES, temperature=0.1)
+        self.assertEqual(ctx.exception.status_code, 429)
+
+    def test_error_rate_is_reproducible_with_seed(self):
+        def draws(seed):
+            server = ReplayServer({}, port=0, error_rate=0.5, latency_jitter=0.1, seed=seed)
+            server.server_close()
+            return [server.draw() for _ in range(20)]
+
+        self.assertEqual(draws(7), draws(7))
+        injected = [inject for _, inject in draws(7)]
+        self.assertIn(True, injected)
+        self.assertIn(False, injected)
+
+    def test_missing_fixture(self):
+        transport = LLMTransport(api_key="test-key", api_base=self.api_base, max_retries=3, retry_delay=0)
+        self.addCleanup(transport.close)
+        with self.assertRaises(LLMTransportError) as ctx:
+            transport.chat_completion([{"role": "user", "content": "没有录制过的请求"}])
+        self.assertEqual(ctx.exception.status_code, 404)
+        # 404不可重试
+        self.assertEqual(self.server.request_count, 1)
+
+
+class TestReplayWithCache(ReplayTestCase):
+    def test_replay_is_not_answered_from_cache(self):
+        cache = LLMResponseCache(os.path.join(self.tmpdir, "cache"))
+        # 缓存中已有真实API对同一请求的响应
+        cache.set(
+            LLMResponseCache.make_key(DEFAULT_MODEL, MESSAGES, 0.1, api_base=DEFAULT_API_BASE),
+            {"choices": [{"message": {"content": "真实API的响应"}}]}
+        )
+        transport = self.make_transport(cache=cache)
+
+        self.assertEqual(transport.chat_completion(MESSAGES, temperature=0.1), RESPONSE)
+        self.assertEqual(self.server.request_count, 1)
+
+        # 回放的响应没有被缓存，注入的错误对之后的调用生效
+        self.server.error_rate = 1.0
+        with self.assertRaises(LLMTransportError):
+            transport.chat_completion(MESSAGES, temperature=0.1)
+        self.assertEqual(self.server.request_count, 2)
+
+    def test_record_bypasses_cache(self):
+        cache = LLMResponseCache(os.path.join(self.tmpdir, "cache"))
+        cache.set(
+            LLMResponseCache.make_key(DEFAULT_MODEL, MESSAGES, 0.1, api_base=self.api_base),
+            {"choices": [{"message": {"content": "缓存的响应"}}]}
+        )
+        fixtures_dir = os.path.join(self.tmpdir, "fixtures")
+        transport = self.make_transport(cache=cache, recorder=FixtureRecorder(fixtures_dir))
+
+        self.assertEqual(transport.chat_completion(MESSAGES, temperature=0.1), RESPONSE)
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(load_fixtures(fixtures_dir), {fixture_key(REQUEST): RESPONSE})
+
+
+if __name__ == '__main__':
+    unittest.main()
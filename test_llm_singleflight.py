@@ -0,0 +1,146 @@
+"""
+测试在途请求合并模块
+
+该模块测试llm_singleflight.py中的SingleFlight：
+1. N个并发的相同调用只执行一次
+2. 执行失败时所有等待者收到同一个异常
+3. 调用结束后移除在途记录，之后的调用重新执行
+4. 等待者被取消时立即返回；执行者被取消时，未取消的等待者重新执行而不是收到取消
+"""
+
+import threading
+import time
+import unittest
+
+from llm_cancel import CancelToken, LLMCancelledError
+from llm_singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+        self.release = threading.Event()
+
+    def blocking_fn(self, result="结果", error=None):
+        """等待 release 后返回 result 或抛出 error 的函数"""
+        def fn():
+            with self.calls_lock:
+                self.calls += 1
+            self.release.wait(2)
+            if error is not None:
+                raise error
+            return result
+        return fn
+
+    def run_concurrently(self, count, fn_factory):
+        """并发发起 count 个相同 key 的调用，返回线程列表和 {序号: 结果或异常}"""
+        results = {}
+
+        def call(index):
+            try:
+                results[index] = self.flight.do("key", fn_factory(index))
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def wait_for_calls(self, expected):
+        deadline = time.monotonic() + 1
+        while self.calls < expected and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def start_call(self, results, name, fn, token):
+        def call():
+            try:
+                results[name] = self.flight.do("key", fn, token)
+            except Exception as e:
+                results[name] = e
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        return thread
+
+    def test_concurrent_identical_calls_execute_once(self):
+        threads, results = self.run_concurrently(8, lambda _: self.blocking_fn())
+        self.wait_for_calls(1)
+        time.sleep(0.05)
+        self.release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, {i: "结果" for i in range(8)})
+
+    def test_leader_exception_reaches_all_followers(self):
+        error = ValueError("接口错误")
+        threads, results = self.run_concurrently(5, lambda _: self.blocking_fn(error=error))
+        self.wait_for_calls(1)
+        time.sleep(0.05)
+        self.release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(result is error for result in results.values()))
+
+    def test_entry_removed_after_completion(self):
+        self.release.set()
+        self.assertEqual(self.flight.do("key", self.blocking_fn("第一次")), "第一次")
+        self.assertEqual(self.flight.inflight_count(), 0)
+        self.assertEqual(self.flight.do("key", self.blocking_fn("第二次")), "第二次")
+        self.assertEqual(self.calls, 2)
+
+        with self.assertRaises(ValueError):
+            self.flight.do("key", self.blocking_fn(error=ValueError("失败")))
+        self.assertEqual(self.flight.inflight_count(), 0)
+
+    def test_cancelled_follower_returns_immediately(self):
+        """等待者取消后立即抛出取消异常，执行者继续执行并得到结果"""
+        results = {}
+        leader = self.start_call(results, "leader", self.blocking_fn(), None)
+        self.wait_for_calls(1)
+        follower_token = CancelToken()
+        follower = self.start_call(results, "follower", self.blocking_fn(), follower_token)
+        time.sleep(0.05)
+        cancelled_at = time.monotonic()
+        follower_token.cancel()
+        follower.join(1)
+        self.assertLess(time.monotonic() - cancelled_at, 0.2)
+        self.assertIsInstance(results["follower"], LLMCancelledError)
+
+        self.release.set()
+        leader.join(2)
+        self.assertEqual(results["leader"], "结果")
+        self.assertEqual(self.calls, 1)
+
+    def test_leader_cancel_makes_follower_retry(self):
+        """执行者被取消时，未取消的等待者重新执行并得到自己的结果"""
+        leader_token = CancelToken()
+
+        def leader_fn():
+            with self.calls_lock:
+                self.calls += 1
+            leader_token.wait(2)
+            raise LLMCancelledError("调用已取消")
+
+        results = {}
+        leader = self.start_call(results, "leader", leader_fn, leader_token)
+        self.wait_for_calls(1)
+        self.release.set()
+        follower = self.start_call(results, "follower", self.blocking_fn("重新执行的结果"), CancelToken())
+        time.sleep(0.05)
+        leader_token.cancel()
+        leader.join(2)
+        follower.join(2)
+
+        self.assertIsInstance(results["leader"], LLMCancelledError)
+        self.assertEqual(results["follower"], "重新执行的结果")
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.flight.inflight_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+测试提示词token估算与预算模块
+
+该模块测试llm_tokens.py中的功能：
+1. 中英文混合文本的token估算
+2. 按输入大小选择 max_tokens
+3. 超出预算时拒绝
+4. 按预算拆分条目列表
+"""
+
+import unittest
+
+from llm_tokens import PromptTooLargeError, TokenBudget, estimate_messages_tokens, estimate_tokens
+
+
+class TestTokenEstimate(unittest.TestCase):
+    def test_cjk_and_ascii_rates(self):
+        """中文字符约0.6个token，英文字符约0.3个token"""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("需求" * 5), 6)
+        self.assertEqual(estimate_tokens("a" * 10), 3)
+        self.assertEqual(estimate_tokens("需求abc"), 3)
+
+    def test_messages_include_overhead(self):
+        """每条消息计入固定开销"""
+        messages = [{'role': 'user', 'content': 'a' * 10}, {'role': 'system', 'content': ''}]
+        self.assertEqual(estimate_messages_tokens(messages), 3 + 4 + 4)
+
+
+class TestTokenBudget(unittest.TestCase):
+    def setUp(self):
+        self.budget = TokenBudget(context_window=1000, max_output_tokens=500,
+                                  min_output_tokens=100, safety_margin=0)
+
+    def test_max_tokens_shrinks_with_input(self):
+        """输入越大，可用的 max_tokens 越小"""
+        self.assertEqual(self.budget.plan_max_tokens(100, 400), 400)
+        self.assertEqual(self.budget.plan_max_tokens(100, 4000), 500)
+        self.assertEqual(self.budget.plan_max_tokens(700, 400), 300)
+
+    def test_oversized_prompt_is_refused(self):
+        """输入挤占到输出不足 min_output_tokens 时拒绝"""
+        with self.assertRaises(PromptTooLargeError):
+            self.budget.plan_max_tokens(901, 400)
+
+    def test_split_items_respects_capacity(self):
+        """拆分后每批都不超过容量，且保持原顺序"""
+        items = ["a" * 100] * 10  # 每条30 tokens
+        batches = self.budget.split_items(items, lambda s: s, fixed_tokens=800, reserve_output_tokens=100)
+        self.assertEqual([len(b) for b in batches], [3, 3, 3, 1])
+        self.assertEqual(sum(batches, []), items)
+
+    def test_split_items_overlapping_windows(self):
+        """按条目数限制切分窗口，相邻窗口重叠且覆盖全部条目"""
+        items = list(range(10))
+        batches = self.budget.split_items(items, str, fixed_tokens=0, reserve_output_tokens=100,
+                                          max_items=4, overlap=1)
+        self.assertEqual(batches, [[0, 1, 2, 3], [3, 4, 5, 6], [6, 7, 8, 9]])
+
+    def test_split_items_refuses_single_oversized_item(self):
+        """单个条目放不下时拒绝"""
+        with self.assertRaises(PromptTooLargeError):
+            self.budget.split_items(["需" * 2000], lambda s: s, fixed_tokens=0, reserve_output_tokens=100)
+
+
+if __name__ == '__main__':
+    unittest.main()
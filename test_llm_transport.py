@@ -0,0 +1,317 @@
+"""
+测试DeepSeek API共享传输层
+
+该模块测试llm_transport.py中的LLMTransport（使用假的Session代替网络请求）：
+1. 429、5xx和网络错误会重试，其他4xx不重试
+2. 重试退避的等待时间在指数退避的上下界之内
+3. 同一个传输层实例的所有调用复用同一个连接池Session
+4. SSE解析：跨网络分块的 data 行、[DONE]、保活/注释行
+5. 流式调用只在收到首个字节之前重试，指标按流的实际结果记录状态
+6. 合并的相同请求中，取消只影响取消的一方
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+import requests
+
+import llm_transport
+from llm_cancel import CancelToken, LLMCancelledError
+from llm_metrics import get_metrics
+from llm_transport import LLMTransport, LLMTransportError, get_transport
+
+
+MESSAGES = [{"role": "user", "content": "检测需求冲突"}]
+RESULT = {"choices": [{"message": {"role": "assistant", "content": "[]"}}]}
+
+
+class _FakeResponse:
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self.body = RESULT if body is None else body
+        self.headers = headers or {}
+        self.elapsed = timedelta(seconds=0.01)
+        self.text = str(self.body)
+
+    def json(self):
+        return self.body
+
+    def close(self):
+        pass
+
+
+class _FakeSession:
+    """按顺序返回预设的响应或抛出预设的异常"""
+
+    def __init__(self, outcomes=(), delay=0.0):
+        self.outcomes = list(outcomes)
+        self.delay = delay
+        self.posts = []
+        self.adapters = {}
+
+    def mount(self, prefix, adapter):
+        self.adapters[prefix] = adapter
+
+    def post(self, url, **kwargs):
+        self.posts.append((url, kwargs))
+        if self.delay:
+            time.sleep(self.delay)
+        outcome = self.outcomes.pop(0) if self.outcomes else _FakeResponse()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def close(self):
+        pass
+
+
+class _ChunkedRaw:
+    """按预设分块返回数据的原始流，分块可以在任意字节处切开；异常对象表示读取到此处时连接中断"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def read(self, amt=None, **kwargs):
+        if not self.chunks:
+            return b""
+        chunk = self.chunks.pop(0)
+        if isinstance(chunk, Exception):
+            raise chunk
+        return chunk
+
+    def close(self):
+        pass
+
+
+def sse_response(chunks):
+    """构造真实的 requests.Response，由其 iter_lines 完成分块到行的拼接"""
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = _ChunkedRaw(chunks)
+    return response
+
+
+def sse_event(content):
+    return f'data: {{"choices": [{{"delta": {{"content": "{content}"}}}}]}}\n\n'.encode("utf-8")
+
+
+def make_transport(outcomes=(), **kwargs):
+    kwargs.setdefault("max_retries", 3)
+    kwargs.setdefault("retry_delay", 0)
+    transport = LLMTransport(api_key="test-key", api_base="https://api.example.com/v1", **kwargs)
+    transport.session = _FakeSession(outcomes)
+    return transport
+
+
+class TestRetry(unittest.TestCase):
+    def test_retries_rate_limit_and_server_errors(self):
+        transport = make_transport([
+            _FakeResponse(429),
+            _FakeResponse(503),
+            _FakeResponse(200)
+        ])
+        self.assertEqual(transport.chat_completion(MESSAGES, call_site="test_retry"), RESULT)
+        self.assertEqual(len(transport.session.posts), 3)
+
+    def test_retries_network_errors(self):
+        transport = make_transport([
+            requests.exceptions.ConnectionError("连接被重置"),
+            requests.exceptions.Timeout("读取超时"),
+            _FakeResponse(200)
+        ])
+        stats = {}
+        response = transport._send_with_retry(
+            "https://api.example.com/v1/chat/completions", {}, {"messages": MESSAGES}, 5, stats
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["status"], "200")
+
+    def test_client_errors_are_not_retried(self):
+        transport = make_transport([_FakeResponse(400, {"error": "bad request"}), _FakeResponse(200)])
+        with self.assertRaises(LLMTransportError) as ctx:
+            transport.chat_completion(MESSAGES, call_site="test_retry")
+        self.assertEqual(ctx.exception.status_code, 400)
+        self.assertEqual(len(transport.session.posts), 1)
+
+    def test_gives_up_after_max_retries(self):
+        transport = make_transport([_FakeResponse(502)] * 3)
+        with self.assertRaises(LLMTransportError) as ctx:
+            transport.chat_completion(MESSAGES, call_site="test_retry")
+        self.assertEqual(ctx.exception.status_code, 502)
+        self.assertEqual(len(transport.session.posts), 3)
+
+    def test_backoff_is_bounded(self):
+        """第n次失败后等待 [d/2, d]，d = min(backoff_max, base * 2^(n-1))"""
+        transport = make_transport([_FakeResponse(500)] * 4, max_retries=4, retry_delay=1)
+        transport.rate_limiter.backoff_max = 1.5
+        with mock.patch.object(llm_transport.time, "sleep") as sleep:
+            with self.assertRaises(LLMTransportError):
+                transport.chat_completion(MESSAGES, call_site="test_retry")
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 3)
+        for delay, upper in zip(delays, (1, 1.5, 1.5)):
+            self.assertGreaterEqual(delay, upper / 2)
+            self.assertLessEqual(delay, upper)
+
+
+class TestStreamChatCompletion(unittest.TestCase):
+    def stream(self, transport, call_site):
+        return list(transport.stream_chat_completion(MESSAGES, call_site=call_site))
+
+    def status_counts(self, call_site):
+        return get_metrics().snapshot()[call_site]["requests"]
+
+    def test_lines_split_across_chunks(self):
+        """data 行和多字节字符被网络分块切开时仍能完整解析"""
+        body = sse_event("需求") + sse_event("冲突") + b"data: [DONE]\n\n"
+        # 在每个事件的中间、以及“需”字的UTF-8编码中间切开
+        cut = body.index("需".encode("utf-8")) + 1
+        chunks = [body[:10], body[10:cut], body[cut:cut + 40], body[cut + 40:]]
+        transport = make_transport([sse_response(chunks)])
+        self.assertEqual(self.stream(transport, "test_sse_split"), ["需求", "冲突"])
+        self.assertEqual(self.status_counts("test_sse_split"), {"200": 1})
+
+    def test_done_ends_stream(self):
+        body = sse_event("a") + b"data: [DONE]\n\n" + sse_event("b")
+        transport = make_transport([sse_response([body])])
+        self.assertEqual(self.stream(transport, "test_sse_done"), ["a"])
+
+    def test_keepalive_and_comment_lines_ignored(self):
+        body = (
+            b": keep-alive\n\n" + sse_event("a") + b"\n\nevent: ping\n" +
+            b"data: {\"choices\": [{\"delta\": {}}]}\n\n" + sse_event("b") + b"data: [DONE]\n\n"
+        )
+        deltas = []
+        transport = make_transport([sse_response([body])])
+        result = list(transport.stream_chat_completion(MESSAGES, on_delta=deltas.append, call_site="test_sse"))
+        self.assertEqual(result, ["a", "b"])
+        self.assertEqual(deltas, ["a", "b"])
+
+    def test_retries_before_first_byte(self):
+        body = sse_event("a") + b"data: [DONE]\n\n"
+        transport = make_transport([
+            requests.exceptions.ConnectionError("连接被重置"),
+            _FakeResponse(503),
+            sse_response([body])
+        ])
+        self.assertEqual(self.stream(transport, "test_sse_retry"), ["a"])
+        self.assertEqual(len(transport.session.posts), 3)
+        self.assertTrue(transport.session.posts[-1][1]["stream"])
+
+    def test_no_retry_after_first_byte(self):
+        """流开始后中断直接抛出，不重新请求，指标记录为流中断而不是200"""
+        transport = make_transport([
+            sse_response([sse_event("a"), requests.exceptions.ChunkedEncodingError("连接中断")])
+        ])
+        received = []
+        with self.assertRaises(LLMTransportError):
+            for delta in transport.stream_chat_completion(MESSAGES, call_site="test_sse_broken"):
+                received.append(delta)
+        self.assertEqual(received, ["a"])
+        self.assertEqual(len(transport.session.posts), 1)
+        self.assertEqual(self.status_counts("test_sse_broken"), {"stream_error": 1})
+
+    def test_stream_closed_without_done_is_incomplete(self):
+        transport = make_transport([sse_response([sse_event("a")])])
+        self.assertEqual(self.stream(transport, "test_sse_incomplete"), ["a"])
+        self.assertEqual(self.status_counts("test_sse_incomplete"), {"incomplete": 1})
+
+    def test_malformed_event_is_error(self):
+        transport = make_transport([sse_response([b"data: {not json}\n\n"])])
+        with self.assertRaises(LLMTransportError):
+            self.stream(transport, "test_sse_malformed")
+        self.assertEqual(self.status_counts("test_sse_malformed"), {"stream_error": 1})
+
+
+class TestCoalescedCancellation(unittest.TestCase):
+    """相同请求合并后，一个调用方取消不影响其他调用方"""
+
+    def setUp(self):
+        self.transport = make_transport()
+        self.transport.session.delay = 0.3
+        self.results = {}
+        self.finished_at = {}
+
+    def start_call(self, name, cancel_token):
+        def call():
+            try:
+                self.results[name] = self.transport.chat_completion(
+                    MESSAGES, call_site="test_coalesce", cancel_token=cancel_token
+                )
+            except Exception as e:
+                self.results[name] = e
+            self.finished_at[name] = time.monotonic()
+
+        thread = threading.Thread(target=call)
+        thread.start()
+        return thread
+
+    def wait_inflight(self):
+        deadline = time.monotonic() + 1
+        while self.transport.single_flight.inflight_count() == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_leader_cancel_does_not_fail_follower(self):
+        leader_token = CancelToken()
+        leader = self.start_call("leader", leader_token)
+        self.wait_inflight()
+        follower = self.start_call("follower", CancelToken())
+        time.sleep(0.05)
+        leader_token.cancel()
+        leader.join(2)
+        follower.join(2)
+
+        self.assertIsInstance(self.results["leader"], LLMCancelledError)
+        self.assertEqual(self.results["follower"], RESULT)
+        self.assertEqual(len(self.transport.session.posts), 2)
+
+    def test_follower_cancel_returns_immediately(self):
+        leader = self.start_call("leader", None)
+        self.wait_inflight()
+        follower_token = CancelToken()
+        follower = self.start_call("follower", follower_token)
+        time.sleep(0.05)
+        cancelled_at = time.monotonic()
+        follower_token.cancel()
+        follower.join(2)
+        leader.join(2)
+
+        self.assertIsInstance(self.results["follower"], LLMCancelledError)
+        self.assertLess(self.finished_at["follower"] - cancelled_at, 0.15)
+        self.assertEqual(self.results["leader"], RESULT)
+        self.assertEqual(len(self.transport.session.posts), 1)
+
+
+class TestConnectionPool(unittest.TestCase):
+    def test_calls_reuse_one_pooled_session(self):
+        session = _FakeSession()
+        with mock.patch.object(llm_transport.requests, "Session", return_value=session) as session_cls:
+            transport = LLMTransport(api_key="test-key", pool_maxsize=4, retry_delay=0)
+            for _ in range(3):
+                transport.chat_completion(MESSAGES, call_site="test_pool")
+        self.assertEqual(session_cls.call_count, 1)
+        self.assertEqual(len(session.posts), 3)
+        self.assertIs(session.adapters["https://"], session.adapters["http://"])
+        self.assertEqual(session.adapters["https://"]._pool_maxsize, 4)
+
+    def test_get_transport_is_shared_per_config(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "config.ini")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("[deepseek]\napi_key = test-key\n\n[llm_cache]\nenabled = false\n")
+            transport = get_transport(path)
+            try:
+                self.assertIs(get_transport(path), transport)
+            finally:
+                transport.close()
+                llm_transport._shared_transports.pop(os.path.abspath(path), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
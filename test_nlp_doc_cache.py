@@ -0,0 +1,59 @@
+"""
+测试spaCy解析结果磁盘缓存
+
+该模块测试nlp_doc_cache.py中的DocCache（使用spacy.blank("zh")，无需下载模型）：
+1. 命中缓存时不再运行NLP管道，结果顺序与输入一致
+2. 总大小超过上限时按LRU淘汰
+"""
+
+import importlib.util
+import os
+import tempfile
+import unittest
+
+from nlp_doc_cache import DocCache
+
+
+@unittest.skipUnless(importlib.util.find_spec("spacy"), "未安装spacy")
+class TestDocCache(unittest.TestCase):
+    def setUp(self):
+        import spacy
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.nlp = spacy.blank("zh")
+        self.parsed = []
+        pipe = self.nlp.pipe
+
+        def counting_pipe(texts, **kwargs):
+            texts = list(texts)
+            self.parsed.extend(texts)
+            return pipe(texts, **kwargs)
+
+        self.nlp.pipe = counting_pipe
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hits_skip_pipeline(self):
+        cache = DocCache(self.tmpdir.name)
+        first = cache.pipe(self.nlp, ["用户注册", "订单支付"])
+        self.assertEqual(self.parsed, ["用户注册", "订单支付"])
+
+        self.parsed.clear()
+        second = cache.pipe(self.nlp, ["订单支付", "图书搜索", "用户注册"])
+        self.assertEqual(self.parsed, ["图书搜索"])
+        self.assertEqual([doc.text for doc in second], ["订单支付", "图书搜索", "用户注册"])
+        self.assertEqual([t.text for t in second[2]], [t.text for t in first[0]])
+
+    def test_eviction_bounded_by_size(self):
+        cache = DocCache(self.tmpdir.name)
+        cache.pipe(self.nlp, ["需求一"])
+        entry_size = cache.store.total_bytes
+        cache.store.max_bytes = entry_size * 2
+        cache.pipe(self.nlp, ["需求二", "需求三", "需求四"])
+        self.assertLessEqual(cache.store.total_bytes, cache.store.max_bytes)
+        self.assertLessEqual(len(list(cache.store.iter_entries())), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
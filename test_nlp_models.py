@@ -0,0 +1,57 @@
+"""
+测试spaCy模型注册表
+
+该模块测试nlp_models.py中的ModelRegistry（使用计数加载函数代替spacy.load）：
+1. 同一组合只加载一次
+2. 排除的组件不同时分别加载，与顺序无关
+3. 多线程并发请求只加载一次
+"""
+
+import threading
+import time
+import unittest
+
+from nlp_models import ModelRegistry
+
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.loads = []
+
+        def loader(model, exclude):
+            time.sleep(0.05)
+            self.loads.append((model, exclude))
+            return object()
+
+        self.registry = ModelRegistry(loader)
+
+    def test_loads_once_per_combination(self):
+        nlp = self.registry.get("zh_core_web_sm")
+        self.assertIs(self.registry.get("zh_core_web_sm"), nlp)
+        self.assertEqual(self.loads, [("zh_core_web_sm", ())])
+
+    def test_exclude_is_part_of_key(self):
+        """排除组件不同的组合分别加载，排除组件的顺序不影响缓存"""
+        full = self.registry.get("zh_core_web_sm")
+        trimmed = self.registry.get("zh_core_web_sm", ["ner", "tagger"])
+        self.assertIsNot(full, trimmed)
+        self.assertIs(self.registry.get("zh_core_web_sm", ("tagger", "ner")), trimmed)
+        self.assertEqual(self.loads[1], ("zh_core_web_sm", ("ner", "tagger")))
+        self.assertEqual(len(self.loads), 2)
+
+    def test_concurrent_requests_load_once(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.registry.get("zh_core_web_sm")))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.loads), 1)
+        self.assertEqual(len({id(nlp) for nlp in results}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+测试功能重叠倒排索引
+
+该模块测试nlp_overlap_index.py中的FunctionalOverlapIndex（纯Python实现，无需spaCy）：
+1. 每对需求只产出一次，分数为共享名词的IDF权重之和
+2. 出现在所有需求中的名词不计分
+3. 超过扇出上限（全局或按名词配置）的名词不参与配对
+"""
+
+import math
+import os
+import tempfile
+import unittest
+
+from nlp_overlap_index import FunctionalOverlapIndex, parse_fanout_caps
+
+
+DOCUMENTS = [
+    ("FR-001", ["系统", "订单", "支付", "订单"]),
+    ("FR-002", ["系统", "订单", "支付"]),
+    ("FR-003", ["系统", "图书"]),
+    ("FR-004", ["系统", "图书", "订单"]),
+]
+
+
+class TestFunctionalOverlapIndex(unittest.TestCase):
+    def test_pairs_emitted_once_with_combined_score(self):
+        pairs = FunctionalOverlapIndex().overlapping_pairs(DOCUMENTS)
+        self.assertEqual(
+            [(p["req_id1"], p["req_id2"]) for p in pairs],
+            [("FR-001", "FR-002"), ("FR-001", "FR-004"), ("FR-002", "FR-004"), ("FR-003", "FR-004")]
+        )
+
+        order_weight = math.log(5 / 4)
+        pay_weight = math.log(5 / 3)
+        first = pairs[0]
+        self.assertAlmostEqual(first["score"], round(order_weight + pay_weight, 3))
+        # 权重高的共享名词排在前面，出现在所有需求中的“系统”不计入
+        self.assertEqual(first["resources"], ["支付", "订单"])
+
+    def test_resource_ties_follow_first_requirement_order(self):
+        """权重相同的共享名词按在前一条需求中首次出现的顺序排列，而不是按语料中出现的顺序"""
+        documents = [
+            ("FR-001", ["库存", "订单"]),
+            ("FR-002", ["订单", "库存", "图书"]),
+            ("FR-003", ["订单", "库存"]),
+            ("FR-004", ["图书", "支付"]),
+            ("FR-005", ["支付"]),
+        ]
+        pairs = {(p["req_id1"], p["req_id2"]): p["resources"] for p in
+                 FunctionalOverlapIndex().overlapping_pairs(documents)}
+        self.assertEqual(pairs[("FR-001", "FR-002")], ["库存", "订单"])
+        self.assertEqual(pairs[("FR-002", "FR-003")], ["订单", "库存"])
+
+    def test_fanout_caps(self):
+        index = FunctionalOverlapIndex(max_fanout=2)
+        pairs = index.overlapping_pairs(DOCUMENTS)
+        self.assertEqual(
+            [(p["req_id1"], p["req_id2"], p["resources"]) for p in pairs],
+            [("FR-001", "FR-002", ["支付"]), ("FR-003", "FR-004", ["图书"])]
+        )
+
+        index = FunctionalOverlapIndex(fanout_caps={"支付": 0})
+        resources = [p["resources"] for p in index.overlapping_pairs(DOCUMENTS)]
+        self.assertNotIn("支付", sum(resources, []))
+
+    def test_min_score(self):
+        index = FunctionalOverlapIndex(min_score=0.6)
+        pairs = index.overlapping_pairs(DOCUMENTS)
+        self.assertEqual([(p["req_id1"], p["req_id2"]) for p in pairs], [("FR-001", "FR-002")])
+
+    def test_from_config(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "config.ini")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("[functional_overlap]\nmax_fanout = 10\nfanout_caps = 系统:0, 用户:3\nmin_score = 0.2\n")
+            index = FunctionalOverlapIndex.from_config(path)
+        self.assertEqual(index.max_fanout, 10)
+        self.assertEqual(index.fanout_caps, {"系统": 0, "用户": 3})
+        self.assertEqual(index.min_score, 0.2)
+
+    def test_parse_fanout_caps_rejects_malformed(self):
+        with self.assertRaises(ValueError):
+            parse_fanout_caps("系统")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+测试术语包含关系索引
+
+该模块测试nlp_term_index.py（纯Python实现，无需spaCy）：
+1. 自动机找出文本中出现的全部模式，包括互相重叠、互为后缀的模式
+2. find_containment_pairs 与两两比较的结果及顺序完全一致
+"""
+
+import random
+import unittest
+
+from nlp_term_index import AhoCorasick, find_containment_pairs
+
+
+def brute_force_pairs(terms):
+    return [
+        (i, j)
+        for i, term1 in enumerate(terms)
+        for j in range(i + 1, len(terms))
+        if (term1 in terms[j] or terms[j] in term1) and term1 != terms[j]
+    ]
+
+
+class TestAhoCorasick(unittest.TestCase):
+    def test_overlapping_and_suffix_patterns(self):
+        patterns = ["he", "she", "his", "hers", "用户", "用户名", "户名"]
+        automaton = AhoCorasick(patterns)
+        self.assertEqual(automaton.matched_patterns("ushers"), {0, 1, 3})
+        self.assertEqual(automaton.matched_patterns("注册用户名"), {4, 5, 6})
+        self.assertEqual(
+            sorted(automaton.iter_matches("shehe")),
+            [(2, 0), (2, 1), (4, 0)]
+        )
+
+
+class TestFindContainmentPairs(unittest.TestCase):
+    def test_terminology_example(self):
+        terms = ["用户", "订单", "用户账户", "账户", "订单支付", "支付"]
+        self.assertEqual(find_containment_pairs(terms), brute_force_pairs(terms))
+        self.assertEqual(
+            find_containment_pairs(terms),
+            [(0, 2), (1, 4), (2, 3), (4, 5)]
+        )
+
+    def test_matches_brute_force(self):
+        rng = random.Random(24)
+        for _ in range(50):
+            terms = list(dict.fromkeys(
+                "".join(rng.choice("abc") for _ in range(rng.randint(1, 5)))
+                for _ in range(rng.randint(0, 40))
+            ))
+            self.assertEqual(find_containment_pairs(terms), brute_force_pairs(terms))
+
+    def test_duplicates_and_empty_terms(self):
+        terms = ["ab", "ab", "", "abc"]
+        self.assertEqual(find_containment_pairs(terms), brute_force_pairs(terms))
+
+
+if __name__ == '__main__':
+    unittest.main()